@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BackendConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'backend'
+
+    def ready(self):
+        from backend import authentication  # noqa: F401, connects the user cache invalidation
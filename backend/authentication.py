@@ -0,0 +1,64 @@
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.signals import user_logged_out
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from backend.models import Profile
+
+UserModel = get_user_model()
+
+# Profile columns written with queryset updates, which send no signal. They are left out of the cached
+# user and read from the database when accessed, a cached copy could be stale or be saved back.
+UNCACHED_PROFILE_FIELDS = ["follower_count", "following_count", "photo_count", "avatar_variants"]
+
+
+def user_cache_key(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def invalidate_user(user_id: Optional[int]):
+    """Drop the cached user now and again on commit, so a concurrent request cannot cache the old rows."""
+    if user_id is None:
+        return
+    cache = caches[settings.USER_CACHE]
+    cache.delete(user_cache_key(user_id))
+    transaction.on_commit(lambda: cache.delete(user_cache_key(user_id)))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend loading the session's user with its profile from the cache, saving two queries a request."""
+
+    def get_user(self, user_id):
+        cache = caches[settings.USER_CACHE]
+        user = cache.get(user_cache_key(user_id))
+        if user is None:
+            # From the primary, a lagging replica could cache a user whose password just changed
+            user = UserModel._default_manager.db_manager(DEFAULT_DB_ALIAS).select_related("profile") \
+                .defer(*(f"profile__{field}" for field in UNCACHED_PROFILE_FIELDS)) \
+                .filter(pk=user_id).first()
+            if user is None:
+                return None
+            cache.set(user_cache_key(user_id), user, settings.USER_CACHE_TTL)
+        return user if self.user_can_authenticate(user) else None
+
+
+@receiver([post_save, post_delete], sender=UserModel)
+def user_changed(sender, instance, **kwargs):
+    # Covers profile updates, password changes and the last_login update of login
+    invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+
+@receiver(user_logged_out)
+def logged_out(sender, request, user, **kwargs):
+    invalidate_user(getattr(user, "pk", None))
@@ -1,13 +1,23 @@
-from typing import Optional, List
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
 
 import boto3
 import strawberry
-from cachetools import cached, TTLCache
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.cache import caches
+from graphql import GraphQLError
+from strawberry.utils.inspect import in_async_context
 
 from backend.directive import IsAuthenticated
+from backend.errors import ERR_INVALID_ARGUMENT
+from backend.metrics import external_call
 from backend.types import Location
 
+T = TypeVar("T")
+
 location_client = boto3.client(
     'location',
     region_name="us-west-2",
@@ -16,14 +26,78 @@ location_client = boto3.client(
 )
 
 
-@cached(cache=TTLCache(maxsize=4096, ttl=86400))
-def get_suggestion(text, top_n):
-    result: dict = location_client.search_place_index_for_suggestions(
-        IndexName='PhotoShareApp',
-        MaxResults=top_n,
-        Text=text
-    )
-    return [place['Text'] for place in result["Results"]]
+class SingleFlight:
+    """Run concurrent calls sharing a key once, the other callers wait for the result of the first."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: Dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+
+suggestion_calls = SingleFlight()
+
+# Bounds of MaxResults in search_place_index_for_suggestions
+MAX_SUGGESTIONS = 15
+
+
+def suggestion_key(text: str) -> str:
+    return "location-suggestions:" + hashlib.sha256(text.encode()).hexdigest()
+
+
+def cached_suggestions(entry: Optional[Tuple[int, List[str]]], top_n: int) -> Optional[List[str]]:
+    """Serve ``top_n`` from an entry fetched with at least as many results, or that returned fewer than it asked."""
+    if entry is None:
+        return None
+    fetched_n, places = entry
+    if fetched_n >= top_n or len(places) < fetched_n:
+        return places[:top_n]
+    return None
+
+
+def fetch_suggestion(key: str, text: str, top_n: int) -> List[str]:
+    with external_call("aws_location", "search_place_index_for_suggestions"):
+        result: dict = location_client.search_place_index_for_suggestions(
+            IndexName='PhotoShareApp',
+            MaxResults=top_n,
+            Text=text
+        )
+    places = [place['Text'] for place in result["Results"]]
+    timeout = settings.LOCATION_SUGGESTION_TTL if places else settings.LOCATION_SUGGESTION_NEGATIVE_TTL
+    caches[settings.LOCATION_SUGGESTION_CACHE].set(key, (top_n, places), timeout)
+    return places
+
+
+def get_suggestion(text: str, top_n: int) -> List[str]:
+    """Place suggestions for ``text``, cached across workers, identical concurrent lookups call AWS once."""
+    text = " ".join(text.split())
+    if not text:
+        return []
+    key = suggestion_key(text.casefold())
+    places = cached_suggestions(caches[settings.LOCATION_SUGGESTION_CACHE].get(key), top_n)
+    if places is not None:
+        return places
+    return suggestion_calls.do(f"{key}:{top_n}", lambda: fetch_suggestion(key, text, top_n))
 
 
 def parse_address(address: str) -> Location:
@@ -37,5 +111,15 @@ def parse_address(address: str) -> Location:
 class AWSQuery:
     @strawberry.field(extensions=[IsAuthenticated()])
     def location_suggestions(self, text: str, top_n: Optional[int] = 5) -> List[Location]:
+        top_n = 5 if top_n is None else top_n
+        if not 1 <= top_n <= MAX_SUGGESTIONS:
+            raise GraphQLError(message=f"topN must be between 1 and {MAX_SUGGESTIONS}", extensions=ERR_INVALID_ARGUMENT)
+        if in_async_context():
+            # boto3 has no async client, keep the call off the event loop and the request's ORM thread
+            async def resolved():
+                addresses = await sync_to_async(get_suggestion, thread_sensitive=False)(text, top_n)
+                return [parse_address(a) for a in addresses]
+
+            return resolved()
         addresses = get_suggestion(text, top_n)
         return [parse_address(a) for a in addresses]
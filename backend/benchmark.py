@@ -0,0 +1,241 @@
+import io
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from itertools import accumulate
+from typing import Callable, Dict, List
+
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory
+from strawberry import relay
+from strawberry.django.views import StrawberryDjangoContext
+
+from backend.bulkload import Dataset, USERNAME_PREFIX, load_dataset, zipf_weights
+from backend.metrics import QueryCounter
+from backend.models import Photo
+from backend.schema import schema
+
+
+def seeded() -> bool:
+    return User.objects.filter(username__startswith=USERNAME_PREFIX).exists()
+
+
+def seed(dataset: Dataset, log: Callable[[str], None] = print):
+    load_dataset(dataset, log=log)
+
+
+def execute(query: str, user: User, **variables):
+    request = RequestFactory().post("/graphql")
+    request.user = user
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+    context = StrawberryDjangoContext(request=request, response=HttpResponse())
+    result = schema.execute_sync(query, variable_values=variables, context_value=context)
+    if result.errors:
+        raise RuntimeError(result.errors)
+    return result.data
+
+
+class Context:
+    """Ids of the seeded rows the scenarios pick from."""
+
+    def __init__(self):
+        self.users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by("id"))
+        self.photo_ids = list(Photo.objects.filter(user__in=self.users).values_list("id", flat=True))
+        self.user_weights = list(accumulate(zipf_weights(len(self.users))))
+
+    def viewer(self, rng: random.Random) -> User:
+        return rng.choice(self.users)
+
+    def popular_user(self, rng: random.Random) -> User:
+        return rng.choices(self.users, cum_weights=self.user_weights)[0]
+
+    def photo_id(self, rng: random.Random) -> str:
+        return relay.to_base64("PhotoType", rng.choice(self.photo_ids))
+
+
+SCENARIOS: Dict[str, Callable[[Context, random.Random], None]] = {}
+
+
+def scenario(name: str):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+
+    return register
+
+
+PHOTO_FIELDS = """
+    id url(width: 640) ratio description location dateTime isLike
+    userLike { totalCount }
+    comments { totalCount }
+    user { id username profile { avatar(width: 32) isFollowing } }
+"""
+
+
+@scenario("feed_scroll")
+def feed_scroll(context: Context, rng: random.Random):
+    viewer = context.viewer(rng)
+    query = """
+        query Feed($viewer: GlobalID!, $after: String) {
+            feeds(first: 10, after: $after, filters: { user: { id: $viewer } }) {
+                pageInfo { hasNextPage endCursor }
+                edges { node { photo { %s } } }
+            }
+        }
+    """ % PHOTO_FIELDS
+    after = None
+    for _ in range(3):
+        page = execute(query, viewer, viewer=relay.to_base64("UserType", viewer.id), after=after)["feeds"]["pageInfo"]
+        if not page["hasNextPage"]:
+            break
+        after = page["endCursor"]
+
+
+@scenario("profile_page")
+def profile_page(context: Context, rng: random.Random):
+    query = """
+        query Profile($id: GlobalID!) {
+            user(id: $id) {
+                username firstName lastName
+                profile { description avatar isFollowing follower { totalCount } following { totalCount } }
+                photos(first: 12) { totalCount edges { node { id url(width: 320) ratio } } }
+            }
+        }
+    """
+    execute(query, context.viewer(rng), id=relay.to_base64("UserType", context.popular_user(rng).id))
+
+
+@scenario("photo_detail")
+def photo_detail(context: Context, rng: random.Random):
+    query = """
+        query Photo($id: GlobalID!) {
+            photo(id: $id) {
+                %s
+                tags { edges { node { tag } } }
+                recentComments: comments(first: 20) { edges { node { comment dateTime user { username } } } }
+            }
+        }
+    """ % PHOTO_FIELDS
+    execute(query, context.viewer(rng), id=context.photo_id(rng))
+
+
+@scenario("top_tags")
+def top_tags(context: Context, rng: random.Random):
+    query = "query TopTags($text: String) { topTags(topN: 10, text: $text) { tag count } }"
+    execute(query, context.viewer(rng), text=rng.choice(["", "t", "tag", "tag1", "tag2"]))
+
+
+@scenario("upload")
+def upload(context: Context, rng: random.Random):
+    content = io.BytesIO()
+    Image.new("RGB", (1080, 1350), tuple(rng.randrange(256) for _ in range(3))).save(content, "JPEG")
+    query = """
+        mutation Upload($photo: Upload!) {
+            uploadPhoto(input: { photo: $photo, description: "d", location: "l", tags: ["tag1", "new"] }) {
+                ... on PhotoType { id }
+            }
+        }
+    """
+    photo = SimpleUploadedFile("benchmark.jpg", content.getvalue(), content_type="image/jpeg")
+    execute(query, context.viewer(rng), photo=photo)
+
+
+@scenario("like")
+def like(context: Context, rng: random.Random):
+    query = """
+        mutation Like($id: GlobalID!, $like: Boolean!) {
+            updatePhotoLike(input: { photoId: $id, like: $like }) { ... on PhotoType { isLike userLike { totalCount } } }
+        }
+    """
+    execute(query, context.viewer(rng), id=context.photo_id(rng), like=rng.random() < 0.5)
+
+
+@scenario("follow")
+def follow(context: Context, rng: random.Random):
+    query = """
+        mutation Follow($id: GlobalID!, $follow: Boolean!) {
+            updateFollower(input: { userId: $id, follow: $follow }) {
+                ... on UpdateFollowerResult { followUser { profile { follower { totalCount } } } }
+            }
+        }
+    """
+    viewer, target = context.viewer(rng), context.popular_user(rng)
+    if viewer != target:
+        execute(query, viewer, id=relay.to_base64("UserType", target.id), follow=rng.random() < 0.5)
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    return values[max(0, min(len(values) - 1, round(p / 100 * len(values)) - 1))]
+
+
+def run_scenario(name: str, context: Context, iterations: int, concurrency: int, seed: int = 0) -> dict:
+    """Run a scenario ``iterations`` times over ``concurrency`` threads, returns its latency and SQL statistics."""
+    func = SCENARIOS[name]
+    latencies, queries, errors = [], [], []
+    lock = threading.Lock()
+
+    def worker(worker_id: int, count: int):
+        rng = random.Random(f"{seed}-{name}-{worker_id}")
+        try:
+            for _ in range(count):
+                counter = QueryCounter()
+                start = time.perf_counter()
+                try:
+                    with connections["default"].execute_wrapper(counter):
+                        func(context, rng)
+                except Exception as e:
+                    with lock:
+                        errors.append(repr(e))
+                    continue
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    latencies.append(elapsed)
+                    queries.append(counter.count)
+        finally:
+            connections.close_all()
+
+    shares = [iterations // concurrency + (i < iterations % concurrency) for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency), shares))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    result = {"iterations": len(latencies), "errors": len(errors), "throughput": len(latencies) / wall}
+    if latencies:
+        result.update({
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": statistics.fmean(latencies),
+            "queries_mean": statistics.fmean(queries),
+            "queries_max": max(queries),
+        })
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """Regressions of ``current`` against ``baseline``, latencies beyond ``threshold`` percent or more SQL queries."""
+    regressions = []
+    for name, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before or "p50" not in before or "p50" not in result:
+            continue
+        for metric in ("p50", "p95", "p99"):
+            change = (result[metric] - before[metric]) / before[metric] * 100
+            if change > threshold:
+                regressions.append(f"{name} {metric} {before[metric]:.1f}ms -> {result[metric]:.1f}ms (+{change:.0f}%)")
+        if result["queries_mean"] > before["queries_mean"]:
+            regressions.append(f"{name} queries {before['queries_mean']:.1f} -> {result['queries_mean']:.1f}")
+    return regressions
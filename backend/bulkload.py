@@ -0,0 +1,351 @@
+import csv
+import io
+import json
+import os
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import accumulate, chain, islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from backend.counters import reconcile, photo_counters, profile_counters, tag_counters
+from backend.models import Profile, Follow, Photo, PhotoTag, Comment, Feed
+
+USERNAME_PREFIX = "bench"
+
+PhotoTags = Photo.tags.through
+Like = Photo.user_like.through
+
+# Load order, rows only reference tables loaded before them
+MODELS: List[Type[models.Model]] = [User, Profile, Follow, PhotoTag, Photo, PhotoTags, Like, Comment, Feed]
+
+
+@dataclass
+class Dataset:
+    """Size of a synthetic dataset, per user and per photo figures are means of skewed distributions."""
+
+    users: int = 1000
+    photos_per_user: float = 5
+    follows_per_user: float = 20
+    likes_per_photo: float = 5
+    comments_per_photo: float = 2
+    tags: int = 500
+    tags_per_photo: int = 3
+    days: int = 90
+    seed: int = 0
+
+
+# Escapes of the COPY text format
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value).translate(COPY_ESCAPES)
+
+
+def zipf_weights(n: int, exponent: float = 1.1) -> List[float]:
+    return [1 / (rank ** exponent) for rank in range(1, n + 1)]
+
+
+def heavy_tailed(rng: random.Random, mean: float) -> int:
+    # Pareto with alpha 1.5 has a mean of 3, most users get a few, a handful get very many
+    return int(rng.paretovariate(1.5) * mean / 3)
+
+
+def next_id(model: Type[models.Model]) -> int:
+    return (model._base_manager.aggregate(last=models.Max("pk"))["last"] or 0) + 1
+
+
+class Generator:
+    """Rows of a synthetic dataset, generated table by table without holding more than a few ids per row.
+
+    Users are ranked by popularity, follows and tags follow a Zipf law. Each table draws from its own
+    random stream so tables generated separately stay consistent with each other.
+    """
+
+    def __init__(self, dataset: Dataset):
+        self.dataset = dataset
+        self.now = timezone.now()
+        self.user_id = next_id(User)
+        self.profile_id = next_id(Profile)
+        self.tag_id = next_id(PhotoTag)
+        self.photo_id = next_id(Photo)
+        rng = self.rng("photos")
+        self.photo_counts = [heavy_tailed(rng, dataset.photos_per_user) for _ in range(dataset.users)]
+        self.photos = sum(self.photo_counts)
+        self.user_weights = list(accumulate(zipf_weights(dataset.users)))
+
+    def rng(self, table: str) -> random.Random:
+        return random.Random(f"{self.dataset.seed}-{table}")
+
+    def rows(self, model: Type[models.Model]) -> Iterator[dict]:
+        return getattr(self, f"{model._meta.model_name}_rows")()
+
+    def user_rows(self):
+        password = make_password("password")
+        for i in range(self.dataset.users):
+            user_id = self.user_id + i
+            yield {"id": user_id, "username": f"{USERNAME_PREFIX}{user_id}", "password": password,
+                   "first_name": "Bench", "last_name": str(i), "date_joined": self.now}
+
+    def profile_rows(self):
+        for i in range(self.dataset.users):
+            yield {"id": self.profile_id + i, "user_id": self.user_id + i}
+
+    def follows(self) -> Iterator[Tuple[int, int]]:
+        rng = self.rng("follows")
+        users = range(self.dataset.users)
+        for follower in users:
+            count = min(heavy_tailed(rng, self.dataset.follows_per_user), self.dataset.users - 1)
+            for target in set(rng.choices(users, cum_weights=self.user_weights, k=count)) - {follower}:
+                yield follower, target
+
+    def follow_rows(self):
+        for follower, target in self.follows():
+            yield {"follower_id": self.user_id + follower, "followee_id": self.user_id + target, "created_at": self.now}
+
+    def phototag_rows(self):
+        for i in range(self.dataset.tags):
+            name = f"tag{self.tag_id + i}"
+            yield {"id": self.tag_id + i, "tag": name, "normalized": name}
+
+    def photo_rows(self):
+        rng = self.rng("photo-dates")
+        photo_id = self.photo_id
+        for user, count in enumerate(self.photo_counts):
+            for _ in range(count):
+                yield {"id": photo_id, "file": "images/benchmark.jpg", "width": 1080, "height": 1350,
+                       "ratio": 1350 / 1080, "user_id": self.user_id + user, "description": "benchmark photo",
+                       "location": "Somewhere",
+                       "date_time": self.now - timedelta(seconds=rng.uniform(0, self.dataset.days * 86400))}
+                photo_id += 1
+
+    def photo_tags_rows(self):
+        rng = self.rng("photo-tags")
+        tags = range(self.tag_id, self.tag_id + self.dataset.tags)
+        weights = list(accumulate(zipf_weights(self.dataset.tags)))
+        for photo_id in range(self.photo_id, self.photo_id + self.photos):
+            for tag_id in set(rng.choices(tags, cum_weights=weights, k=self.dataset.tags_per_photo)):
+                yield {"photo_id": photo_id, "phototag_id": tag_id}
+
+    def photo_user_like_rows(self):
+        rng = self.rng("likes")
+        users = range(self.user_id, self.user_id + self.dataset.users)
+        for photo_id in range(self.photo_id, self.photo_id + self.photos):
+            for user_id in set(rng.choices(users, k=heavy_tailed(rng, self.dataset.likes_per_photo))):
+                yield {"photo_id": photo_id, "user_id": user_id}
+
+    def comment_rows(self):
+        rng = self.rng("comments")
+        for photo_id in range(self.photo_id, self.photo_id + self.photos):
+            for _ in range(heavy_tailed(rng, self.dataset.comments_per_photo)):
+                yield {"photo_id": photo_id, "user_id": self.user_id + rng.randrange(self.dataset.users),
+                       "comment": "benchmark comment", "date_time": self.now}
+
+    def feed_rows(self):
+        # Built in SQL from the follow edges by build_feeds
+        return iter(())
+
+
+class Loader:
+    """Insert rows in streamed batches, with COPY on PostgreSQL and batched INSERTs elsewhere."""
+
+    def __init__(self, batch_size: int = 100_000, log: Callable[[str], None] = print):
+        self.batch_size = batch_size
+        self.log = log
+        self.copy = connection.vendor == "postgresql"
+        self.dropped: Dict[str, List[Tuple[str, str]]] = {}
+
+    @staticmethod
+    def columns(model: Type[models.Model], row: dict) -> List[models.Field]:
+        # Auto primary keys are left to the sequence unless the rows carry them
+        return [f for f in model._meta.concrete_fields if not (f.primary_key and f.attname not in row)]
+
+    def load(self, model: Type[models.Model], rows: Iterable[dict]) -> int:
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return 0
+        fields = self.columns(model, first)
+        defaults = {f.attname: f.get_default() for f in fields}
+        json_fields = {f.attname for f in fields if isinstance(f, models.JSONField)}
+
+        def values(row: dict) -> list:
+            result = []
+            for field in fields:
+                value = row.get(field.attname, defaults[field.attname])
+                result.append(json.dumps(value) if field.attname in json_fields else value)
+            return result
+
+        total = 0
+        start = time.perf_counter()
+        rows = chain([first], rows)
+        columns = [f.column for f in fields]
+        while batch := list(islice(rows, self.batch_size)):
+            with transaction.atomic():
+                if self.copy:
+                    self.copy_rows(model, columns, map(values, batch))
+                else:
+                    self.insert_rows(model, columns, map(values, batch))
+            total += len(batch)
+        self.report(model._meta.db_table, total, start)
+        return total
+
+    def load_csv(self, model: Type[models.Model], path: str) -> int:
+        """Load a CSV file with a header row of column names, streamed from disk by COPY."""
+        start = time.perf_counter()
+        table = model._meta.db_table
+        with open(path, newline="") as file:
+            columns = next(csv.reader(file))
+            if self.copy:
+                file.seek(0)
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.copy_expert(f'COPY {self.quote(table)} ({self.quote_all(columns)}) '
+                                       f'FROM STDIN WITH (FORMAT csv, HEADER true)', file)
+                    total = cursor.rowcount
+            else:
+                reader = csv.reader(file)
+                total = 0
+                while batch := list(islice(reader, self.batch_size)):
+                    with transaction.atomic():
+                        self.insert_rows(model, columns, [[None if v == "" else v for v in r] for r in batch])
+                    total += len(batch)
+        self.report(table, total, start)
+        return total
+
+    def copy_rows(self, model: Type[models.Model], columns: List[str], rows: Iterable[list]):
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write("\t".join(map(copy_value, row)))
+            buffer.write("\n")
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {self.quote(model._meta.db_table)} ({self.quote_all(columns)}) FROM STDIN", buffer)
+
+    def insert_rows(self, model: Type[models.Model], columns: List[str], rows: Iterable[list]):
+        placeholders = ", ".join(["%s"] * len(columns))
+        with connection.cursor() as cursor:
+            cursor.executemany(f"INSERT INTO {self.quote(model._meta.db_table)} ({self.quote_all(columns)}) "
+                               f"VALUES ({placeholders})", list(rows))
+
+    @staticmethod
+    def quote(name: str) -> str:
+        return connection.ops.quote_name(name)
+
+    def quote_all(self, names: List[str]) -> str:
+        return ", ".join(self.quote(name) for name in names)
+
+    def report(self, table: str, rows: int, start: float):
+        elapsed = time.perf_counter() - start
+        self.log(f"{table}: {rows} rows in {elapsed:.1f}s, {rows / elapsed if elapsed else 0:.0f} rows/s")
+
+    def drop_indexes(self, model: Type[models.Model]):
+        """Drop the non-unique indexes of the table, they are rebuilt in one pass by rebuild_indexes."""
+        if not self.copy:
+            return
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid) FROM pg_index "
+                           "WHERE indrelid = %s::regclass AND NOT indisunique AND NOT indisprimary", [table])
+            self.dropped[table] = cursor.fetchall()
+            for name, _ in self.dropped[table]:
+                cursor.execute(f"DROP INDEX {name}")
+        self.log(f"{table}: dropped {len(self.dropped[table])} indexes")
+
+    def rebuild_indexes(self, model: Type[models.Model]):
+        table = model._meta.db_table
+        if table not in self.dropped:
+            return
+        start = time.perf_counter()
+        if connection.in_atomic_block:
+            # Indexes cannot be built while the caller's transaction has deferred foreign key checks queued
+            connection.check_constraints()
+        with connection.cursor() as cursor:
+            for _, definition in self.dropped.pop(table):
+                cursor.execute(definition)
+            cursor.execute(f"ANALYZE {self.quote(table)}")
+        self.log(f"{table}: indexes rebuilt in {time.perf_counter() - start:.1f}s")
+
+    def reset_sequences(self):
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), MODELS):
+                cursor.execute(sql)
+
+
+def build_feeds(first_photo_id: int, batch_size: int = 10_000, log: Callable[[str], None] = print) -> int:
+    """Insert the feed rows of the fanned-out photos from ``first_photo_id`` on, from the follow edges."""
+    start = time.perf_counter()
+    last_photo_id = Photo.objects.aggregate(last=models.Max("pk"))["last"] or 0
+    feed, photo, follow = Feed._meta.db_table, Photo._meta.db_table, Follow._meta.db_table
+    total = 0
+    for low in range(first_photo_id, last_photo_id + 1, batch_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {feed} (user_id, photo_id, date_time) "
+                f"SELECT f.follower_id, p.id, p.date_time FROM {photo} p "
+                f"JOIN {follow} f ON f.followee_id = p.user_id "
+                f"WHERE p.fan_out = %s AND p.id >= %s AND p.id < %s",
+                [True, low, low + batch_size],
+            )
+            total += cursor.rowcount
+    elapsed = time.perf_counter() - start
+    log(f"{feed}: {total} rows in {elapsed:.1f}s, {total / elapsed if elapsed else 0:.0f} rows/s")
+    return total
+
+
+def finish(first_photo_id: int, batch_size: int, log: Callable[[str], None] = print):
+    """Recompute the counters of the loaded rows and mark the photos of popular users as pulled, not fanned out."""
+    reconcile(Profile.objects, profile_counters(), batch_size)
+    reconcile(Photo.objects.filter(id__gte=first_photo_id), photo_counters(), batch_size)
+    reconcile(PhotoTag.objects, tag_counters(), batch_size)
+    Photo.objects.filter(
+        id__gte=first_photo_id, user__profile__follower_count__gte=settings.FEED_FANOUT_THRESHOLD
+    ).update(fan_out=False)
+    log("counters reconciled")
+
+
+def load_dataset(dataset: Optional[Dataset] = None, directory: Optional[str] = None,
+                 batch_size: int = 100_000, log: Callable[[str], None] = print):
+    """Generate ``dataset``, or import the ``<table>.csv`` files of ``directory``, and bring the tables in shape.
+
+    Secondary indexes are dropped during the load and rebuilt afterwards, feeds are built from the
+    follow edges when no feed file is imported.
+    """
+    loader = Loader(batch_size, log)
+    first_photo_id = next_id(Photo)
+    generator = Generator(dataset) if dataset else None
+    for model in MODELS:
+        loader.drop_indexes(model)
+    try:
+        feeds_loaded = False
+        for model in MODELS:
+            if generator:
+                loader.load(model, generator.rows(model))
+            else:
+                path = os.path.join(directory, f"{model._meta.db_table}.csv")
+                if os.path.exists(path):
+                    loader.load_csv(model, path)
+                    feeds_loaded |= model is Feed
+        loader.reset_sequences()
+        for model in MODELS[:-1]:
+            loader.rebuild_indexes(model)
+        finish(first_photo_id, batch_size, log)
+        if not feeds_loaded:
+            build_feeds(first_photo_id, log=log)
+    finally:
+        for model in MODELS:
+            loader.rebuild_indexes(model)
@@ -0,0 +1,177 @@
+"""Static cost of GraphQL operations, checked before any resolver runs.
+
+The cost of an operation is the number of objects it may resolve. Every object field counts once per
+parent object, a connection counts once for its page and multiplies its edges by the page size, so
+``photos(first: 10) { edges { node { user { profile } } } }`` costs 1 + 10 * (1 + 1 + 1 + 1) = 41.
+"""
+import time
+from typing import Dict, Iterator, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from graphql import (
+    DocumentNode,
+    ExecutionResult,
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLField,
+    GraphQLList,
+    GraphQLNamedType,
+    GraphQLSchema,
+    OperationDefinitionNode,
+    SelectionSetNode,
+    get_named_type,
+    get_nullable_type,
+    get_operation_ast,
+    is_leaf_type,
+)
+from graphql.execution.values import get_argument_values, get_variable_values
+from strawberry.extensions import QueryDepthLimiter, SchemaExtension
+
+from backend.errors import ERR_QUERY_COST, ERR_QUERY_THROTTLED
+
+# Built once, DocumentCache keys the validation errors by the rule classes
+depth_rules = tuple(QueryDepthLimiter(max_depth=settings.GRAPHQL_MAX_DEPTH).validation_rules)
+
+
+def page_size(arguments: Dict) -> int:
+    """Nodes a connection returns for its arguments, the default page size without first or last."""
+    size = arguments.get("first")
+    if size is None:
+        size = arguments.get("last")
+    if size is None:
+        size = settings.GRAPHQL_DEFAULT_PAGE_SIZE
+    return max(0, min(size, settings.GRAPHQL_MAX_PAGE_SIZE))
+
+
+def is_connection(named_type: GraphQLNamedType) -> bool:
+    fields = getattr(named_type, "fields", {})
+    return "edges" in fields and "pageInfo" in fields
+
+
+class CostAnalyzer:
+    """Cost of the operations of a valid document for coerced variable values."""
+
+    def __init__(self, schema: GraphQLSchema, document: DocumentNode, variables: Dict):
+        self.schema = schema
+        self.variables = variables
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions if isinstance(definition, FragmentDefinitionNode)
+        }
+
+    def operation_cost(self, operation: OperationDefinitionNode) -> int:
+        return self.selection_cost(operation.selection_set, self.schema.get_root_type(operation.operation), 1)
+
+    def selection_cost(self, selection_set: SelectionSetNode, parent_type: GraphQLNamedType, size: int) -> int:
+        """Cost of a selection, ``size`` is the length of its list fields, the page size within a connection."""
+        cost = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                # Introspection fields are not in the type fields, they read no rows
+                field = getattr(parent_type, "fields", {}).get(selection.name.value)
+                if field is not None:
+                    cost += self.field_cost(selection, field, size)
+                continue
+            if isinstance(selection, FragmentSpreadNode):
+                selection = self.fragments[selection.name.value]
+            fragment_type = parent_type
+            if selection.type_condition is not None:
+                fragment_type = self.schema.get_type(selection.type_condition.name.value)
+            # Fragments on the members of a union are all counted, an upper bound
+            cost += self.selection_cost(selection.selection_set, fragment_type, size)
+        return cost
+
+    def field_cost(self, node: FieldNode, field: GraphQLField, size: int) -> int:
+        named_type = get_named_type(field.type)
+        if is_leaf_type(named_type) or node.selection_set is None:
+            return 0
+        arguments = get_argument_values(field, node, self.variables)
+        if is_connection(named_type):
+            return 1 + self.selection_cost(node.selection_set, named_type, page_size(arguments))
+        count = 1
+        if isinstance(get_nullable_type(field.type), GraphQLList):
+            # The resolvers check topN, the cost of an invalid one is still bounded and positive
+            count = max(1, min(arguments.get("topN") or size, settings.GRAPHQL_MAX_PAGE_SIZE))
+        return count * (1 + self.selection_cost(node.selection_set, named_type, 1))
+
+
+def client_key(request) -> str:
+    user_id = getattr(getattr(request, "user", None), "id", None)
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"address:{getattr(request, 'META', {}).get('REMOTE_ADDR')}"
+
+
+def spend(client: str, cost: int) -> int:
+    """Add ``cost`` to what the client spent in the current minute, returns the total."""
+    key = f"query-cost:{client}:{int(time.time() // 60)}"
+    cache = caches[settings.QUERY_COST_CACHE]
+    cache.add(key, 0, 60)
+    try:
+        return cache.incr(key, cost)
+    except ValueError:
+        # Expired between add and incr
+        cache.set(key, cost, 60)
+        return cost
+
+
+class QueryCost(SchemaExtension):
+    """Reject operations nested deeper than GRAPHQL_MAX_DEPTH or costing more than GRAPHQL_MAX_COST.
+
+    The depth is checked with the validation rules. The cost depends on the variables, it is computed
+    after validation, so DocumentCache never caches it, and enforced before execution. Responses
+    report it in the ``cost`` extension.
+    """
+
+    cost: Optional[int] = None
+    spent: Optional[int] = None
+
+    def on_operation(self) -> Iterator[None]:
+        self.execution_context.validation_rules = self.execution_context.validation_rules + depth_rules
+        yield
+
+    def on_validate(self) -> Iterator[None]:
+        yield
+        execution_context = self.execution_context
+        document = execution_context.graphql_document
+        if execution_context.errors or document is None:
+            return
+        operation = get_operation_ast(document, execution_context.operation_name)
+        if operation is None:
+            return
+        schema = execution_context.schema._schema
+        variables = get_variable_values(schema, operation.variable_definitions or (), execution_context.variables or {})
+        if isinstance(variables, list):
+            # Invalid variables are reported by the execution
+            return
+        self.cost = CostAnalyzer(schema, document, variables).operation_cost(operation)
+
+    def on_execute(self) -> Iterator[None]:
+        error = self.check() if self.cost is not None else None
+        if error is not None:
+            self.execution_context.result = ExecutionResult(data=None, errors=[error])
+        yield
+
+    def check(self) -> Optional[GraphQLError]:
+        if self.cost > settings.GRAPHQL_MAX_COST:
+            return GraphQLError(
+                f"query cost {self.cost} exceeds the maximum of {settings.GRAPHQL_MAX_COST}",
+                extensions=ERR_QUERY_COST,
+            )
+        if settings.GRAPHQL_COST_PER_MINUTE:
+            request = getattr(self.execution_context.context, "request", None)
+            self.spent = spend(client_key(request), self.cost)
+            if self.spent > settings.GRAPHQL_COST_PER_MINUTE:
+                return GraphQLError("query budget of the minute exhausted, retry later", extensions=ERR_QUERY_THROTTLED)
+        return None
+
+    def get_results(self) -> Dict:
+        if self.cost is None:
+            return {}
+        result = {"requested": self.cost, "maximum": settings.GRAPHQL_MAX_COST}
+        if self.spent is not None:
+            result["remaining"] = max(0, settings.GRAPHQL_COST_PER_MINUTE - self.spent)
+        return {"cost": result}
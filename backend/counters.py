@@ -0,0 +1,48 @@
+from django.db import models
+from django.db.models import F, OuterRef, Subquery, Count, Value
+from django.db.models.functions import Coalesce
+
+from backend.models import Photo, Comment, Follow
+
+
+def increment(qs: models.QuerySet, **deltas: int):
+    """Atomically add the deltas to the counter columns of every row in the queryset."""
+    qs.update(**{column: F(column) + delta for column, delta in deltas.items() if delta})
+
+
+def count_of(qs: models.QuerySet, field: str, ref: str = "pk"):
+    counts = qs.filter(**{field: OuterRef(ref)}).order_by().values(field).annotate(count=Count("*")).values("count")
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def photo_counters():
+    return {
+        "like_count": count_of(Photo.user_like.through.objects, "photo_id"),
+        "comment_count": count_of(Comment.objects, "photo_id"),
+    }
+
+
+def profile_counters():
+    return {
+        "follower_count": count_of(Follow.objects, "followee_id", ref="user_id"),
+        "following_count": count_of(Follow.objects, "follower_id", ref="user_id"),
+        "photo_count": count_of(Photo.objects, "user_id", ref="user_id"),
+    }
+
+
+def tag_counters():
+    return {
+        "photo_count": count_of(Photo.tags.through.objects.filter(photo__deleted_at__isnull=True), "phototag_id"),
+    }
+
+
+def reconcile(qs: models.QuerySet, counters: dict, batch_size: int) -> int:
+    """Recompute the counters from the relation tables in primary key batches, returns the rows updated."""
+    updated = 0
+    last_pk = 0
+    while True:
+        pks = list(qs.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return updated
+        updated += qs.filter(pk__in=pks).update(**counters)
+        last_pk = pks[-1]
@@ -4,3 +4,8 @@ ERR_USERNAME_EXIST = {"code": 1003, "msg": "username already exist"}
 ERR_PHOTO_NOT_FOUND = {"code": 1004, "msg": "photo not found"}
 ERR_SAVE_FILE = {"code": 1005, "msg": "save file failed"}
 ERR_ALREADY_DELETE = {"code": 1006, "msg": "resource not exist or has already been delete"}
+ERR_INVALID_UPLOAD = {"code": 1007, "msg": "upload is missing or not a valid image"}
+ERR_QUERY_COST = {"code": 1008, "msg": "query is too costly"}
+ERR_QUERY_THROTTLED = {"code": 1009, "msg": "query budget exhausted"}
+ERR_TOO_MANY_CHANGES = {"code": 1010, "msg": "too many changes in one request"}
+ERR_INVALID_ARGUMENT = {"code": 1011, "msg": "argument out of range"}
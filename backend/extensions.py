@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import inspect
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from cachetools import LRUCache
+from django.conf import settings
+from django.db import connections
+from graphql import DocumentNode, GraphQLError
+from strawberry.extensions import SchemaExtension
+from strawberry.utils.inspect import in_async_context
+
+from backend.metrics import OPERATION_SECONDS, OPERATION_ERRORS, observe_queries, operation_label
+from backend.models import Trace
+
+logger = logging.getLogger(__name__)
+
+
+class CachedDocument:
+    def __init__(self, document: DocumentNode):
+        self.document = document
+        # Validation errors by the validation rules they were checked against
+        self.errors: Dict[Tuple, List[GraphQLError]] = {}
+
+
+class DocumentCache(SchemaExtension):
+    """Parse and validate every distinct query document once, keyed by the SHA-256 of its text.
+
+    Documents that fail to parse are not cached, invalid documents are cached with their validation
+    errors and keep being rejected.
+    """
+
+    documents: LRUCache = LRUCache(maxsize=settings.GRAPHQL_DOCUMENT_CACHE_SIZE)
+    lock = threading.Lock()
+    hits = 0
+    misses = 0
+
+    entry: Optional[CachedDocument] = None
+
+    @classmethod
+    def stats(cls) -> Dict[str, int]:
+        with cls.lock:
+            return {"hits": cls.hits, "misses": cls.misses, "size": len(cls.documents), "maxsize": cls.documents.maxsize}
+
+    @classmethod
+    def clear(cls):
+        with cls.lock:
+            cls.documents.clear()
+            cls.hits = cls.misses = 0
+
+    def on_parse(self) -> Iterator[None]:
+        execution_context = self.execution_context
+        key = hashlib.sha256(execution_context.query.encode()).hexdigest()
+        cls = type(self)
+        with cls.lock:
+            self.entry = cls.documents.get(key)
+            if self.entry is None:
+                cls.misses += 1
+            else:
+                cls.hits += 1
+                execution_context.graphql_document = self.entry.document
+        yield
+        if self.entry is None and execution_context.graphql_document is not None:
+            self.entry = CachedDocument(execution_context.graphql_document)
+            with cls.lock:
+                cls.documents[key] = self.entry
+
+    def on_validate(self) -> Iterator[None]:
+        execution_context = self.execution_context
+        rules = tuple(execution_context.validation_rules)
+        errors = self.entry.errors.get(rules) if self.entry else None
+        if errors is not None:
+            execution_context.errors = list(errors)
+        yield
+        if self.entry and errors is None and execution_context.errors is not None:
+            self.entry.errors[rules] = list(execution_context.errors)
+
+
+class MetricsExtension(SchemaExtension):
+    """Record the latency of every operation by name and the errors it returned by error code."""
+
+    def on_operation(self) -> Iterator[None]:
+        start = time.perf_counter()
+        yield
+        execution_context = self.execution_context
+        operation = operation_label(execution_context.operation_name)
+        try:
+            operation_type = execution_context.operation_type.value
+        except Exception:
+            operation_type = "invalid"
+        OPERATION_SECONDS.labels(operation, operation_type).observe(time.perf_counter() - start)
+
+        result = execution_context.result
+        for error in (result.errors if result else None) or execution_context.errors or []:
+            code = (error.extensions or {}).get("code", "none")
+            OPERATION_ERRORS.labels(operation, code).inc()
+
+
+class TracingExtension(SchemaExtension):
+    """Record a span per resolver with the SQL issued while it ran.
+
+    A fraction TRACING_SAMPLE_RATE of the operations and every operation slower than TRACING_SLOW_MS
+    is stored as a Trace, view them with ``manage.py traces``. Only added to the schema when
+    TRACING_ENABLED is set, as timing every resolver has a cost.
+    """
+
+    def on_operation(self) -> Iterator[None]:
+        self.spans: List[Dict[str, Any]] = []
+        self.stack: List[Dict[str, Any]] = []
+        self.root = {"path": "", "start": 0.0, "queries": []}
+        self.start = time.perf_counter()
+        with observe_queries(self.record_query):
+            yield
+        duration = self.elapsed()
+
+        if duration >= settings.TRACING_SLOW_MS or random.random() < settings.TRACING_SAMPLE_RATE:
+            if in_async_context():
+                # The ORM cannot run on the event loop, store the trace from a worker thread
+                asyncio.get_running_loop().run_in_executor(None, self.store_in_thread, duration)
+            else:
+                self.store(duration)
+
+    def elapsed(self, since: float = 0.0) -> float:
+        return (time.perf_counter() - self.start) * 1000 - since
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            span = self.stack[-1] if self.stack else self.root
+            span["queries"].append({"sql": sql[:500], "duration": (time.perf_counter() - start) * 1000})
+
+    def resolve(self, _next, root, info, *args, **kwargs) -> Any:
+        span = {"path": ".".join(str(key) for key in info.path.as_list()), "start": self.elapsed(), "queries": []}
+        self.stack.append(span)
+        try:
+            result = _next(root, info, *args, **kwargs)
+        finally:
+            self.stack.pop()
+            span["duration"] = self.elapsed(span["start"])
+            self.spans.append(span)
+        if inspect.isawaitable(result):
+            return self.finish_async(span, result)
+        return result
+
+    async def finish_async(self, span: Dict[str, Any], result) -> Any:
+        try:
+            return await result
+        finally:
+            span["duration"] = self.elapsed(span["start"])
+
+    def store(self, duration: float):
+        try:
+            self.save(duration)
+        except Exception:
+            logger.exception("saving trace failed")
+
+    def store_in_thread(self, duration: float):
+        try:
+            self.store(duration)
+        finally:
+            connections.close_all()
+
+    def save(self, duration: float):
+        self.root["duration"] = duration
+        spans = [self.root] + sorted(
+            (s for s in self.spans if s["queries"] or s["duration"] >= settings.TRACING_MIN_SPAN_MS),
+            key=lambda s: s["start"],
+        )
+        Trace.objects.create(
+            operation=operation_label(self.execution_context.operation_name),
+            duration=duration,
+            query_count=sum(len(s["queries"]) for s in spans),
+            spans=spans,
+        )
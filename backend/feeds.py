@@ -0,0 +1,121 @@
+import dataclasses
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Set
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction, connections
+from django.db.models import Exists, F, OuterRef
+from strawberry import UNSET, relay
+from strawberry.types import Info
+
+from backend.models import Photo, Feed, Follow
+from backend.pagination import ExtraNodes
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=settings.FEED_FANOUT_WORKERS, thread_name_prefix="feed-fanout")
+
+
+def use_fan_out(user: User) -> bool:
+    """Accounts with more followers than the threshold are pulled at read time instead of fanned out."""
+    return user.profile.follower_count < settings.FEED_FANOUT_THRESHOLD
+
+
+def schedule_fan_out(photo: Photo):
+    """Fan the photo out to the followers of its owner after the upload transaction commits."""
+    if not photo.fan_out:
+        return
+    if settings.FEED_FANOUT_ASYNC:
+        transaction.on_commit(lambda: executor.submit(_run_fan_out, photo.id))
+    else:
+        transaction.on_commit(lambda: fan_out(photo.id))
+
+
+def _run_fan_out(photo_id: int):
+    try:
+        fan_out(photo_id)
+    except Exception:
+        logger.exception("feed fan-out failed for photo %s", photo_id)
+    finally:
+        connections.close_all()
+
+
+def fan_out(photo_id: int):
+    """Insert one feed row per follower in batches of FEED_FANOUT_BATCH_SIZE, each in its own transaction."""
+    photo = Photo.objects.filter(pk=photo_id).only("id", "user_id", "date_time").first()
+    if photo is None:
+        return
+
+    # Seeks the (followee, follower) index, one range scan per batch
+    followers = Follow.objects.filter(followee_id=photo.user_id).order_by("follower_id")
+    last_id = 0
+    while True:
+        batch = list(followers.filter(follower_id__gt=last_id).values_list("follower_id", flat=True)[
+                     :settings.FEED_FANOUT_BATCH_SIZE])
+        if not batch:
+            break
+        with transaction.atomic():
+            Feed.objects.bulk_create(
+                [Feed(user_id=user_id, photo_id=photo.id, date_time=photo.date_time) for user_id in batch],
+                ignore_conflicts=True,
+            )
+        last_id = batch[-1]
+
+
+def filtered_users(user_filter) -> Set[int]:
+    """Ids of the users matching the ``user`` input of a feeds filter."""
+    lookups = {}
+    for field in dataclasses.fields(user_filter):
+        value = getattr(user_filter, field.name)
+        if value is None or value is UNSET:
+            continue
+        if isinstance(value, relay.GlobalID):
+            value = value.node_id
+        lookups["pk" if field.name == "id" else field.name] = value
+    return set(User.objects.filter(**lookups).values_list("pk", flat=True))
+
+
+def feed_owners(filters) -> Optional[Set[int]]:
+    """Ids of the users whose feed a feeds filter keeps, None when it keeps every user's."""
+    if filters is None or filters is UNSET:
+        return None
+    owners = None
+    user = getattr(filters, "user", None)
+    if user is not None and user is not UNSET:
+        owners = filtered_users(user)
+    both = getattr(filters, "AND", None)
+    if both is not None and both is not UNSET:
+        nested = feed_owners(both)
+        owners = nested if owners is None else owners if nested is None else owners & nested
+    either = getattr(filters, "OR", None)
+    if either is not None and either is not UNSET:
+        nested = feed_owners(either)
+        owners = None if owners is None or nested is None else owners | nested
+    return owners
+
+
+def pulled_feeds(info: Info, filters) -> Optional[ExtraNodes]:
+    """Photos of followed accounts that are not fanned out, merged into the feed when it is read.
+
+    Nothing is stored, the feeds query stays read-only, and the photos are paged by the feed's own
+    cursor, however old. The entries are unsaved ``Feed`` rows with the negated id of their photo.
+    They are merged into the feed of the one user the filter keeps, the viewer's when it keeps every
+    user's, and into none when it keeps several.
+    """
+    owners = feed_owners(filters)
+    if owners is None:
+        owners = {info.context.request.user.id}
+    if len(owners) != 1:
+        return None
+    owner_id = owners.pop()
+    following = Follow.objects.filter(follower_id=owner_id).values("followee_id")
+    photos = Photo.objects \
+        .filter(fan_out=False, user_id__in=following) \
+        .filter(~Exists(Feed.objects.filter(user_id=owner_id, photo_id=OuterRef("pk")))) \
+        .annotate(node_id=-F("pk"))
+    return ExtraNodes(
+        qs=photos,
+        to_node=lambda photo: Feed(id=photo.node_id, user_id=owner_id, photo=photo, date_time=photo.date_time),
+    )
@@ -0,0 +1,151 @@
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Type
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import models, transaction, connections
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from backend.metrics import external_call
+from backend.models import Photo, Profile
+from backend.rendering import render_variants
+from backend.utils import lock_name
+
+logger = logging.getLogger(__name__)
+
+# Pillow work runs in worker processes, storage reads and writes in threads of the web process
+render_pool: Optional[ProcessPoolExecutor] = None
+io_pool = ThreadPoolExecutor(max_workers=max(1, settings.IMAGE_VARIANT_WORKERS), thread_name_prefix="image-variants")
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    global render_pool
+    if render_pool is None:
+        # Spawned, by now the web process runs threads and a forked child could inherit locks they hold
+        render_pool = ProcessPoolExecutor(max_workers=settings.IMAGE_VARIANT_WORKERS,
+                                          mp_context=multiprocessing.get_context("spawn"))
+    return render_pool
+
+
+def render(path: str) -> Dict[int, bytes]:
+    args = (path, settings.IMAGE_VARIANT_WIDTHS, settings.IMAGE_VARIANT_QUALITY)
+    if not settings.IMAGE_VARIANT_WORKERS:
+        return render_variants(*args)
+    return get_render_pool().submit(render_variants, *args).result()
+
+
+def variant_name(name: str, width: int) -> str:
+    root, _ = os.path.splitext(name)
+    return f"{root}_{width}w.webp"
+
+
+def variant_url(file, variants: List[int], width: Optional[int]) -> str:
+    """URL of the smallest variant at least ``width`` wide, the original when there is none."""
+    if width is not None:
+        candidates = [w for w in variants if w >= width]
+        if candidates:
+            return default_storage.url(variant_name(file.name, min(candidates)))
+    return file.url
+
+
+def generate_variants(model: Type[models.Model], pk: int, file_field: str, variants_field: str):
+    try:
+        instance = model.objects.filter(pk=pk).only(file_field).first()
+        file = getattr(instance, file_field, None)
+        if not file:
+            return
+
+        # Content is stored once per hash, reuse the variants of a row sharing the same file
+        rows = model.objects.filter(**{file_field: file.name}).exclude(pk=pk)
+        widths = next((v for v in rows.values_list(variants_field, flat=True) if v), None)
+        if widths is None:
+            widths = render_and_store(file)
+
+        # Only publish the variants if the file was not replaced in the meantime
+        model.objects.filter(pk=pk, **{file_field: file.name}).update(**{variants_field: widths})
+    except Exception:
+        logger.exception("generating variants of %s %s failed", model.__name__, pk)
+
+
+def _run_variants(model: Type[models.Model], pk: int, file_field: str, variants_field: str):
+    try:
+        generate_variants(model, pk, file_field, variants_field)
+    finally:
+        connections.close_all()
+
+
+def render_and_store(file) -> List[int]:
+    # Spool the original to a local file in chunks, the worker process decodes it from there
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(file.name)[1]) as tmp:
+        with file.open("rb") as f:
+            for chunk in f.chunks():
+                tmp.write(chunk)
+        tmp.flush()
+        rendered = render(tmp.name)
+    for width, content in rendered.items():
+        name = variant_name(file.name, width)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        default_storage.save(name, ContentFile(content))
+    return sorted(rendered)
+
+
+def schedule_variants(instance: models.Model, file_field: str, variants_field: str):
+    """Render the variants of the instance's image once the transaction commits, in the background by default."""
+    args = (type(instance), instance.pk, file_field, variants_field)
+    if settings.IMAGE_VARIANT_ASYNC:
+        transaction.on_commit(lambda: io_pool.submit(_run_variants, *args))
+    else:
+        transaction.on_commit(lambda: generate_variants(*args))
+
+
+def image_names(name: str, variants: List[int]) -> List[str]:
+    return [name, *(variant_name(name, width) for width in variants)]
+
+
+def in_use(name: str) -> bool:
+    # Deleted photos keep their image until they are purged
+    return Photo.all_objects.filter(file=name).exists() or Profile.objects.filter(avatar=name).exists()
+
+
+def delete_files(names: List[str]):
+    """Delete stored files, on S3 with one DeleteObjects request per 1000 keys instead of one request per file."""
+    if not isinstance(default_storage, S3Boto3Storage):
+        for name in names:
+            default_storage.delete(name)
+        return
+    for start in range(0, len(names), 1000):
+        keys = [{"Key": default_storage._normalize_name(name)} for name in names[start:start + 1000]]
+        with external_call("s3", "delete_objects"):
+            response = default_storage.bucket.delete_objects(Delete={"Objects": keys, "Quiet": True})
+        if response.get("Errors"):
+            raise OSError(f"deleting {len(response['Errors'])} objects failed: {response['Errors'][0]}")
+
+
+def release(name: str, variants: List[int]):
+    try:
+        # Locked like in save_image, an upload of the same content either sees the file gone or is committed
+        with transaction.atomic():
+            lock_name(name)
+            if not in_use(name):
+                delete_files(image_names(name, variants))
+    except Exception:
+        logger.exception("deleting image %s failed", name)
+
+
+def _run_release(name: str, variants: List[int]):
+    try:
+        release(name, variants)
+    finally:
+        connections.close_all()
+
+
+def schedule_release(name: str, variants: List[int]):
+    """Delete an image and its variants once the transaction commits, unless another row still uses the content."""
+    if name:
+        transaction.on_commit(lambda: io_pool.submit(_run_release, name, variants))
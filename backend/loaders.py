@@ -0,0 +1,96 @@
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Set, Tuple, Type, Optional
+
+from django.db import models
+from strawberry.types import Info
+
+from backend.models import Follow, Photo, Profile
+
+ViewerRelation = Callable[[int, Set[int]], Iterable[int]]
+
+relations: Dict[str, Tuple[Type[models.Model], ViewerRelation]] = {}
+
+
+def viewer_relation(name: str, model: Type[models.Model]):
+    """Register ``fn(viewer_id, pks)``, returning the pks among ``pks`` the viewer is related to, as a batched boolean."""
+
+    def decorator(fn: ViewerRelation) -> ViewerRelation:
+        relations[name] = (model, fn)
+        return fn
+
+    return decorator
+
+
+@viewer_relation("is_like", Photo)
+def liked_photos(viewer_id: int, photo_ids: Set[int]) -> Iterable[int]:
+    return Photo.user_like.through.objects \
+        .filter(user_id=viewer_id, photo_id__in=photo_ids) \
+        .values_list("photo_id", flat=True)
+
+
+@viewer_relation("is_following", Profile)
+def followed_profiles(viewer_id: int, profile_ids: Set[int]) -> Iterable[int]:
+    return Follow.objects \
+        .filter(follower_id=viewer_id, followee__profile__id__in=profile_ids) \
+        .values_list("followee__profile__id", flat=True)
+
+
+class BatchLoader:
+    """Resolves a boolean per primary key, loading every primed key that is not cached yet in one query."""
+
+    def __init__(self, load: Callable[[Set[int]], Iterable[int]]):
+        self.load_fn = load
+        self.pending: Set[int] = set()
+        self.cache: Dict[int, bool] = {}
+
+    def prime(self, pk: int):
+        if pk not in self.cache:
+            self.pending.add(pk)
+
+    def load(self, pk: int) -> bool:
+        if pk not in self.cache:
+            keys = self.pending | {pk}
+            found = set(self.load_fn(keys))
+            self.cache.update({key: key in found for key in keys})
+            self.pending.clear()
+        return self.cache[pk]
+
+
+class ViewerLoaders:
+    """Per-request loaders of every registered viewer relation."""
+
+    def __init__(self, viewer_id: Optional[int]):
+        self.viewer_id = viewer_id
+        self.loaders = {
+            name: (model, BatchLoader(lambda pks, fn=fn: fn(viewer_id, pks)))
+            for name, (model, fn) in relations.items()
+        }
+        # Primary keys of the primed nodes by model, the parents whose nested pages are loaded together
+        self.nodes: Dict[Type[models.Model], Set[int]] = defaultdict(set)
+
+    def prime(self, nodes: Iterable[models.Model]):
+        """Queue the nodes, and the related objects already cached on them, for the next batch."""
+        seen = set()
+        stack = list(nodes)
+        while stack:
+            obj = stack.pop()
+            if not isinstance(obj, models.Model) or id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            self.nodes[type(obj)].add(obj.pk)
+            for model, loader in self.loaders.values():
+                if isinstance(obj, model):
+                    loader.prime(obj.pk)
+            stack.extend(obj._state.fields_cache.values())
+
+    def load(self, name: str, obj: models.Model) -> bool:
+        if self.viewer_id is None:
+            return False
+        return self.loaders[name][1].load(obj.pk)
+
+
+def get_viewer_loaders(info: Info) -> ViewerLoaders:
+    request = info.context.request
+    if not hasattr(request, "viewer_loaders"):
+        request.viewer_loaders = ViewerLoaders(request.user.id)
+    return request.viewer_loaders
@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import BaseCommand
+
+from backend.models import Photo
+from backend.utils import image_dimensions
+
+
+def read_dimensions(photo: Photo) -> Photo:
+    with photo.file.open("rb") as file:
+        photo.width, photo.height = image_dimensions(file)
+    photo.ratio = photo.height / photo.width
+    return photo
+
+
+class Command(BaseCommand):
+    help = 'Read width, height and ratio from the image header of photos uploaded before they were stored'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=8, help='images read from storage concurrently')
+
+    def handle(self, *args, **options):
+        photos = Photo.objects.filter(width__isnull=True).only("id", "file").order_by("id")
+        done = failed = 0
+        last_id = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                batch = list(photos.filter(id__gt=last_id)[:options['batch_size']])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+                futures = [executor.submit(read_dimensions, photo) for photo in batch]
+                updated = []
+                for photo, future in zip(batch, futures):
+                    try:
+                        updated.append(future.result())
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'photo {photo.id}: {e}')
+                Photo.objects.bulk_update(updated, ["width", "height", "ratio"])
+                done += len(updated)
+                self.stdout.write(f'{done} photos updated')
+        self.stdout.write(f'done, {done} updated, {failed} failed')
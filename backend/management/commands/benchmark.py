@@ -0,0 +1,86 @@
+import json
+import subprocess
+import tempfile
+from dataclasses import asdict, fields
+
+from django.core.management import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases, override_settings
+from django.utils import timezone
+
+from backend import benchmark
+from backend.benchmark import SCENARIOS
+from backend.bulkload import Dataset
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+class Command(BaseCommand):
+    help = 'Seed a synthetic dataset in a test database and report latency and SQL queries of GraphQL scenarios'
+
+    def add_arguments(self, parser):
+        for field in fields(Dataset):
+            parser.add_argument(f'--{field.name.replace("_", "-")}', type=field.type, default=field.default)
+        parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10, help='iterations of each scenario not measured')
+        parser.add_argument('--concurrency', type=int, default=1, help='threads running each scenario')
+        parser.add_argument('--keepdb', action='store_true', help='keep the seeded test database for the next run')
+        parser.add_argument('--output', help='write the results to this JSON file')
+        parser.add_argument('--compare', help='JSON results of a previous run to compare against')
+        parser.add_argument('--threshold', type=float, default=20, help='percent of latency increase to report')
+
+    def handle(self, *args, **options):
+        dataset = Dataset(**{f.name: options[f.name] for f in fields(Dataset)})
+        verbosity = options['verbosity']
+        old_config = setup_databases(verbosity, interactive=False, keepdb=options['keepdb'])
+        try:
+            # Uploads go to a throwaway directory whatever the configured storage
+            with override_settings(DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage',
+                                   MEDIA_ROOT=tempfile.mkdtemp()):
+                results = self.run(dataset, options)
+        finally:
+            if not options['keepdb']:
+                teardown_databases(old_config, verbosity)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+        if options['compare']:
+            with open(options['compare']) as f:
+                regressions = benchmark.compare(json.load(f), results, options['threshold'])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(f'regression: {regression}'))
+            if regressions:
+                raise CommandError(f'{len(regressions)} regressions against {options["compare"]}')
+
+    def run(self, dataset: Dataset, options) -> dict:
+        if not benchmark.seeded():
+            start = timezone.now()
+            benchmark.seed(dataset, log=lambda message: self.stdout.write(f'seeded {message}'))
+            self.stdout.write(f'seeded in {(timezone.now() - start).total_seconds():.1f}s')
+        context = benchmark.Context()
+
+        results = {
+            "commit": current_commit(),
+            "created_at": timezone.now().isoformat(),
+            "dataset": asdict(dataset),
+            "iterations": options['iterations'],
+            "concurrency": options['concurrency'],
+            "scenarios": {},
+        }
+        self.stdout.write(f'{"scenario":<14}{"p50":>9}{"p95":>9}{"p99":>9}{"ops/s":>9}{"queries":>9}{"errors":>8}')
+        for name in options['scenarios']:
+            benchmark.run_scenario(name, context, options['warmup'], 1, seed=-1)
+            result = benchmark.run_scenario(name, context, options['iterations'], options['concurrency'])
+            results["scenarios"][name] = result
+            if "p50" in result:
+                self.stdout.write(f'{name:<14}{result["p50"]:>9.1f}{result["p95"]:>9.1f}{result["p99"]:>9.1f}'
+                                  f'{result["throughput"]:>9.1f}{result["queries_mean"]:>9.1f}{result["errors"]:>8}')
+            else:
+                self.stdout.write(f'{name:<14} failed: {result.get("first_error")}')
+        return results
@@ -0,0 +1,24 @@
+from dataclasses import fields
+
+from django.core.management import BaseCommand, CommandError
+
+from backend.bulkload import Dataset, load_dataset
+
+
+class Command(BaseCommand):
+    help = ('Generate a synthetic dataset, or import <table>.csv files, with COPY on PostgreSQL. Secondary indexes '
+            'are dropped during the load, then counters and feeds are rebuilt')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--import', dest='directory', help='directory of CSV files named after the tables, '
+                                                               'with a header row of column names')
+        for field in fields(Dataset):
+            parser.add_argument(f'--{field.name.replace("_", "-")}', type=field.type, default=field.default)
+        parser.add_argument('--batch-size', type=int, default=100_000, help='rows per COPY or INSERT batch')
+
+    def handle(self, *args, **options):
+        dataset = None if options['directory'] else Dataset(**{f.name: options[f.name] for f in fields(Dataset)})
+        try:
+            load_dataset(dataset, options['directory'], options['batch_size'], log=self.stdout.write)
+        except FileNotFoundError as e:
+            raise CommandError(e)
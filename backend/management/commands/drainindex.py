@@ -0,0 +1,24 @@
+import time
+
+from django.core.management import BaseCommand
+
+from backend.outbox import drain
+
+
+class Command(BaseCommand):
+    help = 'Send queued Algolia index changes from the outbox as batched requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--loop', action='store_true', help='keep draining until interrupted')
+        parser.add_argument('--interval', type=float, default=1.0, help='seconds to wait when the outbox is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = drain(batch_size=options['batch_size'])
+            while sent:
+                self.stdout.write(f'sent {sent} index changes')
+                sent = drain(batch_size=options['batch_size'])
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,41 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from backend.images import delete_files
+from backend.purge import orphans, purge_deleted
+
+
+class Command(BaseCommand):
+    help = 'Purge deleted photos whose background purge failed, and optionally delete stored files no row references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=settings.PHOTO_PURGE_MIN_AGE,
+                            help='seconds since deletion, younger photos are left to their background purge')
+        parser.add_argument('--loop', action='store_true', help='keep purging until interrupted')
+        parser.add_argument('--interval', type=float, default=60.0, help='seconds to wait when nothing is left')
+        parser.add_argument('--orphans', action='store_true',
+                            help='also delete images without a row and direct uploads never finalized')
+        parser.add_argument('--older-than', type=float, default=24,
+                            help='hours, younger files may belong to an upload in progress')
+        parser.add_argument('--dry-run', action='store_true', help='list the orphaned files without deleting them')
+
+    def handle(self, *args, **options):
+        if options['orphans']:
+            found = orphans(timedelta(hours=options['older_than']))
+            for name in found:
+                self.stdout.write(name)
+            if not options['dry_run']:
+                delete_files(found)
+            self.stdout.write(f'{"found" if options["dry_run"] else "deleted"} {len(found)} orphaned files')
+
+        while True:
+            purged = purge_deleted(timedelta(seconds=options['min_age']))
+            while purged:
+                self.stdout.write(f'purged {purged} photos')
+                purged = purge_deleted(timedelta(seconds=options['min_age']))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
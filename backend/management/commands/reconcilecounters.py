@@ -0,0 +1,20 @@
+from django.core.management import BaseCommand
+
+from backend.counters import reconcile, photo_counters, profile_counters, tag_counters
+from backend.models import Photo, Profile, PhotoTag
+
+
+class Command(BaseCommand):
+    help = 'Recompute the like, comment, follower, following, photo and tag counters from their relation tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        photos = reconcile(Photo.objects, photo_counters(), batch_size)
+        self.stdout.write(f'reconciled {photos} photos')
+        profiles = reconcile(Profile.objects, profile_counters(), batch_size)
+        self.stdout.write(f'reconciled {profiles} profiles')
+        tags = reconcile(PhotoTag.objects, tag_counters(), batch_size)
+        self.stdout.write(f'reconciled {tags} tags')
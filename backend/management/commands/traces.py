@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from backend.models import Trace
+
+
+class Command(BaseCommand):
+    help = 'List recorded resolver traces, or print the span tree of one trace'
+
+    def add_arguments(self, parser):
+        parser.add_argument('id', nargs='?', type=int, help='trace to print')
+        parser.add_argument('--slowest', action='store_true', help='list by duration instead of date')
+        parser.add_argument('--operation', help='only list traces of this operation')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--sql', action='store_true', help='print the SQL issued by every span')
+        parser.add_argument('--purge-days', type=int, help='delete traces older than this many days')
+
+    def handle(self, *args, **options):
+        if options['purge_days'] is not None:
+            cutoff = timezone.now() - timedelta(days=options['purge_days'])
+            deleted, _ = Trace.objects.filter(created_at__lt=cutoff).delete()
+            self.stdout.write(f'deleted {deleted} traces')
+        elif options['id'] is not None:
+            self.print_trace(Trace.objects.get(id=options['id']), options['sql'])
+        else:
+            self.list_traces(options)
+
+    def list_traces(self, options):
+        traces = Trace.objects.defer("spans").order_by("-duration" if options['slowest'] else "-created_at")
+        if options['operation']:
+            traces = traces.filter(operation=options['operation'])
+        for trace in traces[:options['limit']]:
+            self.stdout.write(f'{trace.id:>8}  {trace.created_at:%Y-%m-%d %H:%M:%S}  {trace.duration:>9.1f}ms  '
+                              f'{trace.query_count:>4} queries  {trace.operation}')
+
+    def print_trace(self, trace: Trace, sql: bool):
+        self.stdout.write(f'{trace.operation}  {trace.duration:.1f}ms  {trace.query_count} queries')
+        for span in trace.spans[1:]:
+            depth = span["path"].count(".")
+            queries = span["queries"]
+            self.stdout.write(f'{"  " * depth}{span["path"].rsplit(".", 1)[-1]}  +{span["start"]:.1f}ms  '
+                              f'{span["duration"]:.1f}ms  {len(queries)} queries '
+                              f'{sum(q["duration"] for q in queries):.1f}ms  ({span["path"]})')
+            if sql:
+                for query in queries:
+                    self.stdout.write(f'{"  " * (depth + 1)}> {query["duration"]:.1f}ms {query["sql"]}')
+        if trace.spans and trace.spans[0]["queries"]:
+            self.stdout.write(f'outside resolvers: {len(trace.spans[0]["queries"])} queries')
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from typing import Callable, Tuple
+
+from asgiref.sync import markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time spent handling a request", ["method", "route", "status"]
+)
+REQUEST_SQL_QUERIES = Histogram(
+    "http_request_sql_queries", "SQL queries issued by a request", ["route"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+REQUEST_SQL_SECONDS = Histogram(
+    "http_request_sql_duration_seconds", "Time a request spent in SQL queries", ["route"]
+)
+OPERATION_SECONDS = Histogram(
+    "graphql_operation_duration_seconds", "Time spent executing a GraphQL operation", ["operation", "type"]
+)
+OPERATION_ERRORS = Counter(
+    "graphql_errors", "Errors returned by GraphQL operations, by the code of backend.errors", ["operation", "code"]
+)
+EXTERNAL_CALL_SECONDS = Histogram(
+    "external_call_duration_seconds", "Latency of calls to external services", ["service", "call", "outcome"]
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a free pooled database connection", ["alias"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10),
+)
+DB_CONNECTION_CHECKOUTS = Counter(
+    "db_connection_checkouts", "Connections taken from the pool, reused from it or newly opened", ["alias", "outcome"]
+)
+
+# Operation names come from clients, past this many distinct names new ones are reported as "other"
+MAX_OPERATION_NAMES = 200
+operation_names = set()
+operation_names_lock = threading.Lock()
+
+
+def operation_label(name: str) -> str:
+    if not name:
+        return "anonymous"
+    if name in operation_names:
+        return name
+    with operation_names_lock:
+        if len(operation_names) >= MAX_OPERATION_NAMES:
+            return "other"
+        operation_names.add(name)
+    return name
+
+
+@contextmanager
+def external_call(service: str, call: str):
+    """Record the latency of a call to ``service`` and whether it raised."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        EXTERNAL_CALL_SECONDS.labels(service, call, outcome).observe(time.perf_counter() - start)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+# Execute wrappers of the current request or operation. Connections are per thread and the async view
+# runs the ORM in other threads, so wrappers are looked up in the context, which sync_to_async carries.
+query_wrappers: ContextVar[Tuple[Callable, ...]] = ContextVar("query_wrappers", default=())
+
+
+def run_query_wrappers(execute, sql, params, many, context):
+    for wrapper in query_wrappers.get():
+        execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def install_query_wrappers(connection, **kwargs):
+    if run_query_wrappers not in connection.execute_wrappers:
+        connection.execute_wrappers.append(run_query_wrappers)
+
+
+connection_created.connect(install_query_wrappers)
+
+
+@contextmanager
+def observe_queries(wrapper: Callable):
+    """Pass every query of the current context, whichever thread runs it, through ``wrapper``."""
+    for connection in connections.all(initialized_only=True):
+        install_query_wrappers(connection)
+    token = query_wrappers.set(query_wrappers.get() + (wrapper,))
+    try:
+        yield
+    finally:
+        query_wrappers.reset(token)
+
+
+class MetricsMiddleware:
+    """Record the latency, SQL query count and SQL time of every request."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.acall(request)
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with observe_queries(counter):
+            response = self.get_response(request)
+        self.record(request, response, counter, time.perf_counter() - start)
+        return response
+
+    async def acall(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with observe_queries(counter):
+            response = await self.get_response(request)
+        self.record(request, response, counter, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def record(request, response, counter: QueryCounter, elapsed: float):
+        match = request.resolver_match
+        route = match.route if match else "unmatched"
+        REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(elapsed)
+        REQUEST_SQL_QUERIES.labels(route).observe(counter.count)
+        REQUEST_SQL_SECONDS.labels(route).observe(counter.seconds)
+
+
+def collect() -> bytes:
+    """Metrics in the Prometheus text format, merged across gunicorn workers in multiprocess mode."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
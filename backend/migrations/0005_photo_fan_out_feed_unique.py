@@ -0,0 +1,38 @@
+# Generated by Django 4.1.3 on 2026-10-18 08:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0004_photo_backend_pho_date_ti_6c521b_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='fan_out',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='photo',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='backend.photo'),
+        ),
+        migrations.AlterField(
+            model_name='feed',
+            name='date_time',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(condition=models.Q(('fan_out', False)), fields=['user', '-date_time'], name='photo_pull_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feed',
+            constraint=models.UniqueConstraint(fields=('user', 'photo'), name='unique_feed_user_photo'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.3 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_photo_fan_out_feed_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='feed',
+            index=models.Index(fields=['user', '-date_time'], name='backend_fee_user_id_b12436_idx'),
+        ),
+    ]
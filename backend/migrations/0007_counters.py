@@ -0,0 +1,62 @@
+# Generated by Django 4.1.3 on 2026-10-18 08:41
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Count, Value
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, field, ref="pk"):
+    counts = model.objects.filter(**{field: OuterRef(ref)}).order_by().values(field) \
+        .annotate(count=Count("*")).values("count")
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def backfill_counters(apps, schema_editor):
+    Photo = apps.get_model("backend", "Photo")
+    Profile = apps.get_model("backend", "Profile")
+    Comment = apps.get_model("backend", "Comment")
+    Photo.objects.update(
+        like_count=count_of(Photo.user_like.through, "photo_id"),
+        comment_count=count_of(Comment, "photo_id"),
+    )
+    Profile.objects.update(
+        follower_count=count_of(Profile.follower.through, "profile_id"),
+        following_count=count_of(Profile.following.through, "profile_id"),
+        photo_count=count_of(Photo, "user_id", ref="user_id"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_feed_backend_fee_user_id_b12436_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='comment_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='like_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='follower_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='photo_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.1.3 on 2026-10-18 08:44
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Count, Value
+from django.db.models.functions import Coalesce, Lower, Trim
+
+
+def backfill_tag_statistics(apps, schema_editor):
+    PhotoTag = apps.get_model("backend", "PhotoTag")
+    Through = PhotoTag.photo_set.through
+    counts = Through.objects.filter(phototag_id=OuterRef("pk")).order_by().values("phototag_id") \
+        .annotate(count=Count("*")).values("count")
+    PhotoTag.objects.update(normalized=Lower(Trim("tag")), photo_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='phototag',
+            name='normalized',
+            field=models.CharField(default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='phototag',
+            name='photo_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='phototag',
+            index=models.Index(fields=['normalized'], name='tag_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='phototag',
+            index=models.Index(condition=models.Q(('photo_count__gte', 1)), fields=['-photo_count'], name='tag_popularity_idx'),
+        ),
+        migrations.RunPython(backfill_tag_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.3 on 2026-10-18 08:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_tag_statistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.BigIntegerField()),
+                ('operation', models.CharField(choices=[('save', 'save'), ('update', 'update'), ('delete', 'delete')], max_length=10)),
+                ('fields', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.3 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_index_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='height',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='width',
+            field=models.IntegerField(null=True),
+        ),
+    ]
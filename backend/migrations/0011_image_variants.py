@@ -0,0 +1,23 @@
+# Generated by Django 4.1.3 on 2026-10-18 08:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_photo_dimensions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='variants',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_variants',
+            field=models.JSONField(default=list),
+        ),
+    ]
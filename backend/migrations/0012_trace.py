@@ -0,0 +1,28 @@
+# Generated by Django 4.1.3 on 2026-10-18 08:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Trace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation', models.CharField(max_length=200)),
+                ('duration', models.FloatField(help_text='milliseconds')),
+                ('query_count', models.IntegerField(default=0)),
+                ('spans', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='trace',
+            index=models.Index(fields=['-created_at'], name='backend_tra_created_957abb_idx'),
+        ),
+    ]
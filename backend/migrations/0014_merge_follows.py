@@ -0,0 +1,75 @@
+from django.db import migrations, transaction
+from django.db.models import OuterRef, Subquery, Count, Value
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 10000
+
+
+def count_of(model, field, ref="pk"):
+    counts = model.objects.filter(**{field: OuterRef(ref)}).order_by().values(field) \
+        .annotate(count=Count("*")).values("count")
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def batches(queryset):
+    """Rows of ``queryset`` by ascending id, one committed batch at a time."""
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by("id")[:BATCH_SIZE])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def merge_follows(apps, schema_editor):
+    Profile = apps.get_model("backend", "Profile")
+    Follow = apps.get_model("backend", "Follow")
+    # A row of profile.follower is a user following the profile's owner, a row of profile.following
+    # the profile's owner following a user. Both tables usually hold each edge, the unique constraint
+    # keeps one of them.
+    for through, follower, followee in [
+        (Profile.follower.through, "user_id", "profile__user_id"),
+        (Profile.following.through, "profile__user_id", "user_id"),
+    ]:
+        for rows in batches(through.objects.values_list("id", follower, followee)):
+            with transaction.atomic(using=schema_editor.connection.alias):
+                Follow.objects.bulk_create(
+                    [Follow(follower_id=row[1], followee_id=row[2]) for row in rows],
+                    ignore_conflicts=True,
+                )
+
+    Profile.objects.update(
+        follower_count=count_of(Follow, "followee_id", ref="user_id"),
+        following_count=count_of(Follow, "follower_id", ref="user_id"),
+    )
+
+
+def split_follows(apps, schema_editor):
+    Profile = apps.get_model("backend", "Profile")
+    Follow = apps.get_model("backend", "Follow")
+    profile_ids = dict(Profile.objects.values_list("user_id", "id"))
+    for rows in batches(Follow.objects.values_list("id", "follower_id", "followee_id")):
+        with transaction.atomic(using=schema_editor.connection.alias):
+            Profile.follower.through.objects.bulk_create([
+                Profile.follower.through(profile_id=profile_ids[followee], user_id=follower)
+                for _, follower, followee in rows if followee in profile_ids
+            ], ignore_conflicts=True)
+            Profile.following.through.objects.bulk_create([
+                Profile.following.through(profile_id=profile_ids[follower], user_id=followee)
+                for _, follower, followee in rows if follower in profile_ids
+            ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+    # Each batch of the merge commits on its own, large follow graphs do not hold one long transaction.
+    # The schema is created by 0013 in a transaction of its own, a failed merge can simply be run again.
+    atomic = False
+
+    dependencies = [
+        ('backend', '0013_follow'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_follows, split_follows),
+    ]
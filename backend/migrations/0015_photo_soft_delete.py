@@ -0,0 +1,22 @@
+# Generated by Django 4.1.3 on 2026-10-18 09:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0014_merge_follows'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='photo_deleted_idx'),
+        ),
+    ]
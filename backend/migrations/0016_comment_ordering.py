@@ -0,0 +1,21 @@
+# Generated by Django 4.1.3 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0015_photo_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='comment',
+            options={'ordering': ['date_time', 'id']},
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['photo', 'date_time', 'id'], name='comment_photo_date_idx'),
+        ),
+    ]
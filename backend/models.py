@@ -1,14 +1,24 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
+from django_cleanup import cleanup
 from strawberry import relay
 
 
+# Images are stored once per content hash and shared between rows, backend.images deletes them
+@cleanup.ignore
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     description = models.CharField(max_length=200)
     avatar = models.ImageField(upload_to="avatar/")
+    avatar_variants = models.JSONField(default=list)
+    # Superseded by Follow. Kept for one release so the previous code still running during the deploy can
+    # write them, the migration dropping them runs merge_follows of 0014 again first.
     follower = models.ManyToManyField(User, related_name="follower")
     following = models.ManyToManyField(User, related_name="following")
+    follower_count = models.IntegerField(default=0)
+    following_count = models.IntegerField(default=0)
+    photo_count = models.IntegerField(default=0)
 
     @property
     def global_id(self):
@@ -27,22 +37,68 @@ class Profile(models.Model):
         return self.user.username
 
 
+class Follow(models.Model):
+    """Directed edge of the follow graph, ``follower`` follows ``followee``."""
+
+    follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name="follows")
+    followee = models.ForeignKey(User, on_delete=models.CASCADE, related_name="followed_by")
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # The unique index serves the accounts a user follows, the other one the followers of an account
+        constraints = [models.UniqueConstraint(fields=["follower", "followee"], name="unique_follow")]
+        indexes = [models.Index(fields=["followee", "follower"], name="follow_followee_idx")]
+
+
 class PhotoTag(models.Model):
     tag = models.CharField(max_length=200, unique=True)
+    normalized = models.CharField(max_length=200, default="")
+    photo_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["normalized"], opclasses=["varchar_pattern_ops"], name="tag_prefix_idx"),
+            models.Index(fields=["-photo_count"], condition=models.Q(photo_count__gte=1), name="tag_popularity_idx"),
+        ]
+
+    @staticmethod
+    def normalize(tag: str) -> str:
+        return tag.strip().lower()
+
 
+class VisiblePhotoManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
 
+
+@cleanup.ignore
 class Photo(models.Model):
     file = models.ImageField(upload_to="images/")
     ratio = models.FloatField(default=-1)
+    width = models.IntegerField(null=True)
+    height = models.IntegerField(null=True)
+    variants = models.JSONField(default=list)
     date_time = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     user_like = models.ManyToManyField(User, related_name="user_like")
     description = models.CharField(max_length=400, default="")
     tags = models.ManyToManyField(PhotoTag)
     location = models.CharField(max_length=200, default="")
+    fan_out = models.BooleanField(default=True)
+    like_count = models.IntegerField(default=0)
+    comment_count = models.IntegerField(default=0)
+    # Set by deletePhoto, the photo is hidden at once and purged in the background by backend.purge
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = VisiblePhotoManager()
+    all_objects = models.Manager()
 
     class Meta:
-        indexes = [models.Index(fields=["-date_time"])]
+        indexes = [
+            models.Index(fields=["-date_time"]),
+            models.Index(fields=["user", "-date_time"], condition=models.Q(fan_out=False), name="photo_pull_idx"),
+            models.Index(fields=["deleted_at"], condition=models.Q(deleted_at__isnull=False), name="photo_deleted_idx"),
+        ]
 
     @property
     def user_fullname(self):
@@ -75,8 +131,43 @@ class Comment(models.Model):
     photo = models.ForeignKey(Photo, on_delete=models.CASCADE, related_name="comments")
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        # Oldest first, comments pages seek this index from their cursor
+        ordering = ["date_time", "id"]
+        indexes = [models.Index(fields=["photo", "date_time", "id"], name="comment_photo_date_idx")]
+
 
 class Feed(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     photo = models.ForeignKey(Photo, on_delete=models.CASCADE)
-    date_time = models.DateTimeField(auto_now_add=True)
+    date_time = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "photo"], name="unique_feed_user_photo")]
+        indexes = [models.Index(fields=["user", "-date_time"])]
+
+
+class IndexOutbox(models.Model):
+    SAVE = "save"
+    UPDATE = "update"
+    DELETE = "delete"
+    OPERATIONS = [(SAVE, "save"), (UPDATE, "update"), (DELETE, "delete")]
+
+    model = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    operation = models.CharField(max_length=10, choices=OPERATIONS)
+    fields = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class Trace(models.Model):
+    """Resolver spans of a sampled or slow GraphQL operation, recorded by backend.extensions.TracingExtension."""
+
+    operation = models.CharField(max_length=200)
+    duration = models.FloatField(help_text="milliseconds")
+    query_count = models.IntegerField(default=0)
+    spans = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["-created_at"])]
@@ -1,11 +1,12 @@
-from typing import Optional, cast, Type, List
+from enum import Enum
+from typing import Optional, cast, Type, List, Annotated, Dict, Union
 
 import strawberry.django
-from algoliasearch_django import update_records, save_record
-from algoliasearch_django.decorators import disable_auto_indexing
+from django.conf import settings
 from django.contrib.auth import get_user_model, authenticate, login, logout
 from django.contrib.auth.models import User
 from django.db import transaction, IntegrityError
+from django.utils import timezone
 from graphql import GraphQLError
 from strawberry.file_uploads import Upload
 from strawberry.relay import GlobalID
@@ -13,10 +14,17 @@ from strawberry.types import Info
 from strawberry_django import auth
 from strawberry_django.mutations import resolvers
 
+from .counters import increment
 from .directive import IsAuthenticated
-from .errors import ERR_USERNAME_EXIST, ERR_LOGIN
-from .models import Profile, Photo, Comment, PhotoTag, Feed
+from .errors import ERR_USERNAME_EXIST, ERR_LOGIN, ERR_TOO_MANY_CHANGES, ERR_ALREADY_DELETE
+from .feeds import schedule_fan_out, use_fan_out
+from .images import schedule_variants, schedule_release
+from .models import Profile, Photo, Comment, PhotoTag, Follow
+from .outbox import save_record, update_record, delete_record
+from .purge import schedule_purge
 from .types import UserType, CommentType, PhotoType, ProfileType
+from .uploads import upload_key, presign, validate_upload, promote
+from .utils import image_dimensions, save_image
 
 UserModel = cast(Type[User], get_user_model())
 
@@ -27,6 +35,137 @@ class UpdateFollowerResult:
     follow_user: UserType
 
 
+@strawberry.input
+class PhotoLikeChange:
+    photo_id: GlobalID
+    like: bool
+
+
+@strawberry.type
+class PhotoLikeResult:
+    photo_id: GlobalID
+    changed: bool
+    # Null when the photo does not exist
+    photo: Optional[PhotoType]
+
+
+@strawberry.input
+class FollowChange:
+    user_id: GlobalID
+    follow: bool
+
+
+@strawberry.type
+class FollowResult:
+    user_id: GlobalID
+    changed: bool
+    # Null when the user does not exist
+    follow_user: Optional[UserType]
+
+
+@strawberry.type
+class UpdateFollowersResult:
+    user: UserType
+    results: List[FollowResult]
+
+
+@strawberry.enum
+class UploadKind(Enum):
+    PHOTO = "photo"
+    AVATAR = "avatar"
+
+
+@strawberry.type
+class UploadField:
+    name: str
+    value: str
+
+
+@strawberry.type
+class UploadTarget:
+    """Form to POST the file to (as the last field, named ``file``), then finalize ``key``."""
+    key: str
+    url: str
+    fields: List[UploadField]
+
+
+def set_avatar(profile: Profile, name: str) -> Profile:
+    # The profile may come from the user cache and its variants are written in the background, read the stored ones
+    old_avatar, old_variants = Profile.objects.select_for_update() \
+        .values_list("avatar", "avatar_variants").get(pk=profile.pk)
+    profile.avatar = name
+    profile.avatar_variants = []
+    profile.save(update_fields=["avatar", "avatar_variants"])
+    save_record(profile)
+    schedule_variants(profile, "avatar", "avatar_variants")
+    if old_avatar != name:
+        schedule_release(old_avatar, old_variants)
+    return profile
+
+
+def create_photo(
+        user: User, name: str, width: int, height: int, description: str, location: str, tags: List[str]
+) -> Photo:
+    photo = Photo(
+        file=name,
+        width=width,
+        height=height,
+        ratio=height / width,
+        user=user,
+        description=description,
+        location=location,
+        fan_out=use_fan_out(user),
+    )
+    photo.save()
+    increment(Profile.objects.filter(user=user), photo_count=1)
+
+    attach_tags(photo, tags)
+    save_record(photo)
+    schedule_fan_out(photo)
+    schedule_variants(photo, "file", "variants")
+    return photo
+
+
+def attach_tags(photo: Photo, tags: List[str]):
+    """Create the missing tags and attach them all to the photo, in four queries whatever the number of tags."""
+    tags = list(dict.fromkeys(tags))
+    if not tags:
+        return
+    PhotoTag.objects.bulk_create(
+        [PhotoTag(tag=tag, normalized=PhotoTag.normalize(tag)) for tag in tags], ignore_conflicts=True
+    )
+    tag_ids = list(PhotoTag.objects.filter(tag__in=tags).values_list("id", flat=True))
+    Photo.tags.through.objects.bulk_create(
+        [Photo.tags.through(photo_id=photo.id, phototag_id=tag_id) for tag_id in tag_ids], ignore_conflicts=True
+    )
+    increment(PhotoTag.objects.filter(pk__in=tag_ids), photo_count=1)
+
+
+def last_changes(changes: list, key: str) -> Dict[int, Union[PhotoLikeChange, FollowChange]]:
+    """The last change requested for every node, by primary key, ids that are not keys are rejected."""
+    if len(changes) > settings.BULK_MUTATION_MAX_ITEMS:
+        raise GraphQLError(
+            message=f"at most {settings.BULK_MUTATION_MAX_ITEMS} changes per request", extensions=ERR_TOO_MANY_CHANGES
+        )
+    requested = {}
+    for change in changes:
+        node_id = getattr(change, key).node_id
+        try:
+            requested[int(node_id)] = change
+        except ValueError:
+            raise GraphQLError(message=f"no node with id {node_id!r}", extensions=ERR_ALREADY_DELETE) from None
+    return requested
+
+
+def lock_profiles(user_ids: List[int]):
+    """Lock the profiles of a follow change in primary key order, before reading the edges they count.
+
+    The follower's own profile is locked too, two users following each other in concurrent batches
+    would otherwise deadlock on it.
+    """
+    list(Profile.objects.filter(user_id__in=user_ids).order_by("pk").select_for_update().values_list("pk", flat=True))
+
+
 # noinspection PyShadowingBuiltins
 @strawberry.type
 class Mutation:
@@ -61,7 +200,7 @@ class Mutation:
                 last_name=last_name,
                 password=password,
             )
-            Profile.objects.create(user=user, description=description)
+            save_record(Profile.objects.create(user=user, description=description))
             return cast(UserType, user)
         except IntegrityError:
             raise GraphQLError(message="username already exist", extensions=ERR_USERNAME_EXIST)
@@ -74,11 +213,8 @@ class Mutation:
             user=info.context.request.user,
             photo_id=photo_id.node_id,
         )
-        update_records(
-            model=Photo,
-            qs=Photo.objects.filter(pk=photo_id.node_id),
-            photo_comments={'_operation': 'Add', 'value': comment}
-        )
+        increment(Photo.objects.filter(pk=photo_id.node_id), comment_count=1)
+        update_record(Photo, photo_id.node_id, "photo_comments")
         return cast(CommentType, new_comment)
 
     @strawberry.django.input_mutation(handle_django_errors=False, extensions=[IsAuthenticated()])
@@ -90,56 +226,146 @@ class Mutation:
         user.profile.description = description
         user.save()
         user.profile.save()
+        save_record(user.profile)
         return cast(UserType, user)
 
     @strawberry.django.input_mutation(handle_django_errors=False, extensions=[IsAuthenticated()])
     @transaction.atomic
     def update_photo_like(self, info: Info, photo_id: GlobalID, like: bool) -> PhotoType:
         user = info.context.request.user
-        photo = Photo.objects.get(pk=photo_id.node_id)
+        # Like changes lock the photo first, a concurrent updatePhotoLikes cannot count the same edge
+        photo = Photo.objects.select_for_update().get(pk=photo_id.node_id)
+        likes = Photo.user_like.through.objects
         if like:
-            photo.user_like.add(user)
+            _, changed = likes.get_or_create(photo_id=photo.id, user_id=user.id)
         else:
-            photo.user_like.remove(user)
+            changed, _ = likes.filter(photo_id=photo.id, user_id=user.id).delete()
+        if changed:
+            increment(Photo.objects.filter(pk=photo.id), like_count=1 if like else -1)
+            photo.refresh_from_db(fields=["like_count"])
         return cast(PhotoType, photo)
 
+    @strawberry.django.input_mutation(handle_django_errors=False, extensions=[IsAuthenticated()])
+    @transaction.atomic
+    def update_photo_likes(self, info: Info, changes: List[PhotoLikeChange]) -> List[PhotoLikeResult]:
+        """Like and unlike many photos with a constant number of queries, one result per change."""
+        user = info.context.request.user
+        requested = last_changes(changes, "photo_id")
+        # Locked in primary key order, the edges read next stay current until commit and the counter
+        # deltas match the rows inserted and deleted
+        photo_ids = set(
+            Photo.objects.filter(pk__in=requested).order_by("pk").select_for_update().values_list("id", flat=True)
+        )
+        likes = Photo.user_like.through.objects.filter(user_id=user.id)
+        liked = set(likes.filter(photo_id__in=photo_ids).values_list("photo_id", flat=True))
+
+        to_like = [pk for pk in photo_ids if requested[pk].like and pk not in liked]
+        to_unlike = [pk for pk in photo_ids if not requested[pk].like and pk in liked]
+        if to_like:
+            likes.bulk_create(
+                [Photo.user_like.through(photo_id=pk, user_id=user.id) for pk in to_like], ignore_conflicts=True
+            )
+            increment(Photo.objects.filter(pk__in=to_like), like_count=1)
+        if to_unlike:
+            likes.filter(photo_id__in=to_unlike).delete()
+            increment(Photo.objects.filter(pk__in=to_unlike), like_count=-1)
+
+        photos = Photo.objects.in_bulk(photo_ids)
+        changed = set(to_like) | set(to_unlike)
+        return [
+            PhotoLikeResult(
+                photo_id=change.photo_id,
+                changed=int(change.photo_id.node_id) in changed,
+                photo=cast(Optional[PhotoType], photos.get(int(change.photo_id.node_id))),
+            )
+            for change in changes
+        ]
+
     @strawberry.django.input_mutation(handle_django_errors=False, extensions=[IsAuthenticated()])
     @transaction.atomic
     def update_follower(self, info: Info, user_id: GlobalID, follow: bool) -> UpdateFollowerResult:
         logged_in_user: User = info.context.request.user
         follow_user: User = UserModel.objects.get(pk=user_id.node_id)
+        lock_profiles([logged_in_user.pk, follow_user.pk])
+        edge = {"follower_id": logged_in_user.pk, "followee_id": follow_user.pk}
         if follow:
-            logged_in_user.profile.following.add(follow_user)
-            follow_user.profile.follower.add(logged_in_user)
+            _, changed = Follow.objects.get_or_create(**edge)
         else:
-            logged_in_user.profile.following.remove(follow_user)
-            follow_user.profile.follower.remove(logged_in_user)
+            changed, _ = Follow.objects.filter(**edge).delete()
+        if changed:
+            delta = 1 if follow else -1
+            increment(Profile.objects.filter(pk=logged_in_user.profile.pk), following_count=delta)
+            increment(Profile.objects.filter(pk=follow_user.profile.pk), follower_count=delta)
+            logged_in_user.profile.refresh_from_db(fields=["following_count"])
+            follow_user.profile.refresh_from_db(fields=["follower_count"])
         return UpdateFollowerResult(user=logged_in_user, follow_user=follow_user)
 
     @strawberry.django.input_mutation(handle_django_errors=False, extensions=[IsAuthenticated()])
+    @transaction.atomic
+    def update_followers(self, info: Info, changes: List[FollowChange]) -> UpdateFollowersResult:
+        """Follow and unfollow many users with a constant number of queries, one result per change."""
+        logged_in_user: User = info.context.request.user
+        requested = last_changes(changes, "user_id")
+        user_ids = set(UserModel.objects.filter(pk__in=requested).values_list("id", flat=True))
+        lock_profiles([logged_in_user.pk, *user_ids])
+        follows = Follow.objects.filter(follower_id=logged_in_user.pk)
+        followed = set(follows.filter(followee_id__in=user_ids).values_list("followee_id", flat=True))
+
+        to_follow = [pk for pk in user_ids if requested[pk].follow and pk not in followed]
+        to_unfollow = [pk for pk in user_ids if not requested[pk].follow and pk in followed]
+        if to_follow:
+            follows.bulk_create(
+                [Follow(follower_id=logged_in_user.pk, followee_id=pk) for pk in to_follow], ignore_conflicts=True
+            )
+            increment(Profile.objects.filter(user_id__in=to_follow), follower_count=1)
+        if to_unfollow:
+            follows.filter(followee_id__in=to_unfollow).delete()
+            increment(Profile.objects.filter(user_id__in=to_unfollow), follower_count=-1)
+        if len(to_follow) != len(to_unfollow):
+            increment(Profile.objects.filter(pk=logged_in_user.profile.pk),
+                      following_count=len(to_follow) - len(to_unfollow))
+            logged_in_user.profile.refresh_from_db(fields=["following_count"])
+
+        users = UserModel.objects.select_related("profile").in_bulk(user_ids)
+        changed = set(to_follow) | set(to_unfollow)
+        return UpdateFollowersResult(user=logged_in_user, results=[
+            FollowResult(
+                user_id=change.user_id,
+                changed=int(change.user_id.node_id) in changed,
+                follow_user=cast(Optional[UserType], users.get(int(change.user_id.node_id))),
+            )
+            for change in changes
+        ])
+
+    @strawberry.django.input_mutation(handle_django_errors=False, extensions=[IsAuthenticated()])
+    @transaction.atomic
     def delete_photo(self, info: Info, id: GlobalID) -> PhotoType:
-        photo = Photo.objects.get(pk=id.node_id)
-        return cast(PhotoType, resolvers.delete(info, photo))
+        photo = Photo.objects.select_for_update().get(pk=id.node_id)
+        increment(Profile.objects.filter(user_id=photo.user_id), photo_count=-1)
+        increment(PhotoTag.objects.filter(photo=photo), photo_count=-1)
+        delete_record(photo)
+        # Hidden now, its rows and files are purged in the background
+        photo.deleted_at = timezone.now()
+        photo.save(update_fields=["deleted_at"])
+        schedule_purge(photo.id)
+        return cast(PhotoType, photo)
 
     @strawberry.django.input_mutation(handle_django_errors=False, extensions=[IsAuthenticated()])
     @transaction.atomic
     def delete_comment(self, info: Info, id: GlobalID) -> CommentType:
         comment = Comment.objects.get(pk=id.node_id)
         comment = resolvers.delete(info, comment)
-
-        qs = Photo.objects.filter(pk=comment.photo_id)
-        update_records(model=Photo, qs=qs, photo_comments=qs[0].photo_comments)
+        increment(Photo.objects.filter(pk=comment.photo_id), comment_count=-1)
+        update_record(Photo, comment.photo_id, "photo_comments")
         return cast(CommentType, comment)
 
     @strawberry.django.input_mutation(handle_django_errors=False, extensions=[IsAuthenticated()])
+    @transaction.atomic
     def upload_avatar(self, info: Info, avatar: Upload) -> ProfileType:
         profile = info.context.request.user.profile
-        profile.avatar = avatar
-        profile.save()
-        return cast(ProfileType, profile)
+        return cast(ProfileType, set_avatar(profile, save_image(avatar, "avatar/")))
 
     @strawberry.django.input_mutation(handle_django_errors=False, extensions=[IsAuthenticated()])
-    @disable_auto_indexing(model=Photo)
     @transaction.atomic
     def upload_photo(
             self,
@@ -148,25 +374,34 @@ class Mutation:
             description: str,
             location: str,
             tags: List[str],
-            ratio: float
+            ratio: Annotated[Optional[float], strawberry.argument(
+                deprecation_reason="computed from the uploaded image")] = None
     ) -> PhotoType:
-        user = info.context.request.user
-        photo = Photo(
-            file=photo,
-            ratio=ratio,
-            user=user,
-            description=description,
-            location=location
+        width, height = image_dimensions(photo)
+        photo = create_photo(
+            info.context.request.user, save_image(photo, "images/"), width, height, description, location, tags
         )
-        photo.save()
+        return cast(PhotoType, photo)
 
-        for tagName in tags:
-            tag, _ = PhotoTag.objects.get_or_create(tag=tagName)
-            photo.tags.add(tag)
+    @strawberry.django.input_mutation(handle_django_errors=False, extensions=[IsAuthenticated()])
+    def create_upload(self, info: Info, kind: UploadKind, content_type: str) -> UploadTarget:
+        key = upload_key(kind.value, info.context.request.user.id, content_type)
+        url, fields = presign(key, content_type)
+        return UploadTarget(key=key, url=url, fields=[UploadField(name=k, value=v) for k, v in fields.items()])
 
-        save_record(photo)
+    @strawberry.django.input_mutation(handle_django_errors=False, extensions=[IsAuthenticated()])
+    @transaction.atomic
+    def finalize_avatar_upload(self, info: Info, key: str) -> ProfileType:
+        profile = info.context.request.user.profile
+        validate_upload(key, UploadKind.AVATAR.value, profile.user_id)
+        return cast(ProfileType, set_avatar(profile, promote(key, "avatar/")))
 
-        followers = user.profile.follower.all()
-        feeds = [Feed(user=follower, photo=photo) for follower in followers]
-        Feed.objects.bulk_create(feeds)
+    @strawberry.django.input_mutation(handle_django_errors=False, extensions=[IsAuthenticated()])
+    @transaction.atomic
+    def finalize_photo_upload(
+            self, info: Info, key: str, description: str, location: str, tags: List[str]
+    ) -> PhotoType:
+        user = info.context.request.user
+        width, height = validate_upload(key, UploadKind.PHOTO.value, user.id)
+        photo = create_photo(user, promote(key, "images/"), width, height, description, location, tags)
         return cast(PhotoType, photo)
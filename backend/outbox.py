@@ -0,0 +1,109 @@
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple, Type
+
+from algoliasearch_django import algolia_engine, get_adapter
+from django.apps import apps
+from django.db import models, transaction
+
+from backend.metrics import external_call
+from backend.models import IndexOutbox, Photo, Profile
+
+logger = logging.getLogger(__name__)
+
+# Related rows read by the index fields of each model, loaded in bulk when records are built
+RECORD_QUERYSETS = {
+    Photo: lambda: Photo.objects.select_related("user").prefetch_related("tags", "comments"),
+    Profile: lambda: Profile.objects.select_related("user"),
+}
+
+
+def enqueue(model: Type[models.Model], object_id: int, operation: str, fields: Optional[List[str]] = None):
+    """Record an index change in the caller's transaction, it is sent to Algolia by the drainindex command."""
+    IndexOutbox.objects.create(
+        model=model._meta.label,
+        object_id=object_id,
+        operation=operation,
+        fields=fields or [],
+    )
+
+
+def save_record(instance: models.Model):
+    enqueue(type(instance), instance.pk, IndexOutbox.SAVE)
+
+
+def update_record(model: Type[models.Model], object_id: int, *fields: str):
+    enqueue(model, object_id, IndexOutbox.UPDATE, list(fields))
+
+
+def delete_record(instance: models.Model):
+    enqueue(type(instance), instance.pk, IndexOutbox.DELETE)
+
+
+def coalesce(entries: List[IndexOutbox]) -> Dict[Tuple[str, int], Tuple[str, List[str]]]:
+    """Reduce the entries of each record to one operation.
+
+    Records are rebuilt from the database when they are sent, so a save covers every earlier or later
+    partial update of the same record and a delete discards everything queued before it.
+    """
+    changes: Dict[Tuple[str, int], Tuple[str, List[str]]] = {}
+    for entry in entries:
+        key = (entry.model, entry.object_id)
+        operation, fields = changes.get(key, (None, []))
+        if entry.operation != IndexOutbox.UPDATE:
+            changes[key] = (entry.operation, [])
+        elif operation == IndexOutbox.SAVE:
+            continue
+        elif operation is None or operation == IndexOutbox.UPDATE:
+            changes[key] = (IndexOutbox.UPDATE, fields + [f for f in entry.fields if f not in fields])
+    return changes
+
+
+def send(changes: Dict[Tuple[str, int], Tuple[str, List[str]]], client):
+    by_model = defaultdict(dict)
+    for (label, object_id), change in changes.items():
+        by_model[label][object_id] = change
+
+    for label, model_changes in by_model.items():
+        model = apps.get_model(label)
+        adapter = get_adapter(model)
+        index = client.init_index(adapter.index_name)
+        queryset = RECORD_QUERYSETS.get(model, model._default_manager.all)()
+        instances = queryset.in_bulk([pk for pk, (op, _) in model_changes.items() if op != IndexOutbox.DELETE])
+
+        saves, updates, deletes = [], [], []
+        for pk, (operation, fields) in model_changes.items():
+            instance = instances.get(pk)
+            if operation == IndexOutbox.DELETE or instance is None:
+                deletes.append(pk)
+            elif operation == IndexOutbox.SAVE:
+                saves.append(adapter.get_raw_record(instance))
+            else:
+                updates.append(adapter.get_raw_record(instance, update_fields=fields))
+
+        if saves:
+            with external_call("algolia", "save_objects"):
+                index.save_objects(saves)
+        if updates:
+            with external_call("algolia", "partial_update_objects"):
+                index.partial_update_objects(updates)
+        if deletes:
+            with external_call("algolia", "delete_objects"):
+                index.delete_objects(deletes)
+        logger.info("%s: saved %d, updated %d, deleted %d records", label, len(saves), len(updates), len(deletes))
+
+
+def drain(batch_size: int = 1000, client=None) -> int:
+    """Send up to ``batch_size`` outbox entries as batched Algolia calls, returns the entries processed.
+
+    Entries are locked with SKIP LOCKED so several workers can drain concurrently, and only deleted
+    once Algolia accepted the batch, a failed batch is retried by the next drain.
+    """
+    client = client or algolia_engine.client
+    with transaction.atomic():
+        entries = list(IndexOutbox.objects.select_for_update(skip_locked=True).order_by("id")[:batch_size])
+        if not entries:
+            return 0
+        send(coalesce(entries), client)
+        IndexOutbox.objects.filter(id__in=[e.id for e in entries]).delete()
+    return len(entries)
@@ -0,0 +1,392 @@
+import inspect
+from datetime import datetime
+from operator import attrgetter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Set, cast, Tuple, Sized
+
+import strawberry
+from django.conf import settings
+from django.db import models
+from django.db.models import Func, F, Value, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from django.db.models.sql.where import WhereNode
+from strawberry import relay, UNSET
+from strawberry.extensions import FieldExtension
+from strawberry.relay.types import PREFIX, NodeIterableType
+from strawberry.type import StrawberryContainer, get_object_definition
+from strawberry.types import Info
+from strawberry.utils.inspect import in_async_context
+from strawberry_django.relay import ListConnectionWithTotalCount
+from strawberry_django.resolvers import django_resolver
+
+from backend.loaders import get_viewer_loaders
+
+CURSOR_PREFIX = "keyset"
+
+
+class Row(Func):
+    """SQL row value, ``(date_time, id) < (%s, %s)`` lets the database seek the ordering index."""
+    template = "(%(expressions)s)"
+    output_field = models.DateTimeField()
+
+
+def to_cursor(node: models.Model) -> str:
+    return relay.to_base64(CURSOR_PREFIX, f"{node.date_time.isoformat()}|{node.pk}")
+
+
+def from_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        prefix, value = relay.from_base64(cursor)
+        date_time, pk = value.rsplit("|", 1)
+        if prefix == CURSOR_PREFIX:
+            return datetime.fromisoformat(date_time), int(pk)
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid cursor '{cursor}'.")
+
+
+def load_key(qs: models.QuerySet, *extra: str) -> models.QuerySet:
+    """Make sure ``date_time`` and ``extra`` are not deferred by the optimizer, the cursors of every node need it."""
+    keep = {"date_time", *extra}
+    fields, defer = qs.query.deferred_loading
+    if not defer:
+        return qs.only(*fields, *keep)
+    if fields & keep:
+        return qs.defer(None).defer(*(fields - keep))
+    return qs
+
+
+def related_parent(qs: models.QuerySet) -> Optional[Tuple[models.ForeignKey, models.Model]]:
+    """The foreign key and parent of a reverse relation queryset like ``photo.comments.all()`` filtered by nothing else."""
+    known = qs._known_related_objects
+    if len(known) != 1 or len(qs.query.where.children) != 1:
+        return None
+    field, parents = next(iter(known.items()))
+    if len(parents) != 1:
+        return None
+    return field, next(iter(parents.values()))
+
+
+class PageLoader:
+    """Pages of a reverse relation for every primed parent of the request, ranked by a window function in one query.
+
+    The optimizer does not prefetch nested connections, ``photos { edges { node { comments } } }``
+    would otherwise cost a query per photo.
+    """
+
+    def __init__(self, qs: models.QuerySet, field: models.ForeignKey, ordering: Tuple[str, ...], size: int):
+        self.qs = qs
+        self.field = field
+        self.ordering = ordering
+        self.size = size
+        self.pages: Dict[int, List[models.Model]] = {}
+
+    def batch(self, parent_id: int, parent_ids: Set[int]) -> Tuple[Set[int], Optional[models.QuerySet]]:
+        """The parents not loaded yet and the query of their pages, no query when the page of ``parent_id`` is loaded."""
+        if parent_id in self.pages:
+            return set(), None
+        keys = (parent_ids - self.pages.keys()) | {parent_id}
+        column = self.field.attname
+        order_by = [F(name[1:]).desc() if name.startswith("-") else F(name).asc() for name in self.ordering]
+        ranked = self.qs.model._default_manager.filter(**{f"{column}__in": keys}) \
+            .annotate(page_rank=Window(RowNumber(), partition_by=F(column), order_by=order_by)) \
+            .values("pk", "page_rank").order_by()
+        sql, params = ranked.query.sql_with_params()
+        pk = self.qs.model._meta.pk.column
+        in_pages = RawSQL(f'SELECT "{pk}" FROM ({sql}) AS ranked WHERE page_rank <= %s', (*params, self.size))
+        return keys, self.qs.filter(pk__in=in_pages).order_by(column, *self.ordering)
+
+    def store(self, keys: Set[int], rows: List[models.Model]) -> None:
+        self.pages.update({key: [] for key in keys})
+        for row in rows:
+            self.pages[getattr(row, self.field.attname)].append(row)
+
+
+def get_page_loader(info: Info, nodes: models.QuerySet, field: models.ForeignKey, ordering: Tuple[str, ...],
+                    size: int) -> PageLoader:
+    """The request's loader of the pages of ``nodes`` sharing its relation, ordering, size and loaded fields."""
+    request = info.context.request
+    if not hasattr(request, "page_loaders"):
+        request.page_loaders = {}
+    fields, defer = nodes.query.deferred_loading
+    key = (field, ordering, size, frozenset(fields), defer, repr(nodes.query.select_related))
+    if key not in request.page_loaders:
+        # Every parent is filtered by the window query instead
+        qs = load_key(nodes.all(), field.attname)
+        qs.query.where = WhereNode()
+        qs._known_related_objects = {}
+        request.page_loaders[key] = PageLoader(qs, field, ordering, size)
+    return request.page_loaders[key]
+
+
+def page_arguments(first: Optional[int], last: Optional[int], before: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """Page a connection queried without first or last by GRAPHQL_DEFAULT_PAGE_SIZE instead of returning every node."""
+    if first is None and last is None:
+        if before is None:
+            first = settings.GRAPHQL_DEFAULT_PAGE_SIZE
+        else:
+            last = settings.GRAPHQL_DEFAULT_PAGE_SIZE
+    return first, last
+
+
+def seek(qs: models.QuerySet, cursor: str, descending: bool, pk: str = "pk") -> models.QuerySet:
+    date_time, pk_value = from_cursor(cursor)
+    lookup = "key__lt" if descending else "key__gt"
+    return qs.alias(key=Row(F("date_time"), F(pk))).filter(**{lookup: Row(Value(date_time), Value(pk_value))})
+
+
+@dataclass
+class ExtraNodes:
+    """Nodes merged into a keyset connection that are not rows of its queryset.
+
+    ``qs`` rows have a ``date_time`` and a ``node_id`` annotation, the id of the node ``to_node``
+    builds from them, so they are sought and ordered like the rows of the connection.
+    """
+    qs: models.QuerySet
+    to_node: Callable[[models.Model], models.Model]
+
+
+@strawberry.type(name="Connection", description="A connection to a list of items.")
+class CountedConnection(ListConnectionWithTotalCount[relay.NodeType]):
+    """Connection whose ``totalCount`` can be served from a counter column of the parent row."""
+    counter: strawberry.Private[Optional[int]] = None
+
+    @strawberry.field(description="Total quantity of existing nodes.")
+    @django_resolver
+    def total_count(self) -> Optional[int]:
+        if self.counter is not None:
+            return self.counter
+        assert self.nodes is not None
+        if isinstance(self.nodes, models.QuerySet):
+            extra = getattr(self.nodes, "extra_nodes", None)
+            return self.nodes.count() + (extra.qs.count() if extra else 0)
+        return len(self.nodes) if isinstance(self.nodes, Sized) else None
+
+    @classmethod
+    def resolve_connection(
+            cls,
+            nodes: NodeIterableType[relay.NodeType],
+            *,
+            info: Info,
+            before: Optional[str] = None,
+            first: Optional[int] = None,
+            last: Optional[int] = None,
+            **kwargs: Any,
+    ):
+        first, last = page_arguments(first, last, before)
+        if last is not None and first is None and before is None and isinstance(nodes, models.QuerySet):
+            # The offset slice would read every row to keep the last ones, count them and slice from the end
+            if in_async_context():
+                async def counted():
+                    end = relay.to_base64(PREFIX, await nodes.acount())
+                    conn = cls.resolve_connection(nodes, info=info, before=end, last=last, **kwargs)
+                    return await conn if inspect.isawaitable(conn) else conn
+
+                return counted()
+            before = relay.to_base64(PREFIX, nodes.count())
+
+        conn = super().resolve_connection(nodes, info=info, before=before, first=first, last=last, **kwargs)
+        if inspect.isawaitable(conn):
+            async def resolved():
+                return cls.on_resolved(await conn, nodes, info)
+
+            return resolved()
+        return cls.on_resolved(conn, nodes, info)
+
+    @staticmethod
+    def on_resolved(conn: "CountedConnection", nodes: NodeIterableType[relay.NodeType], info: Info):
+        conn.counter = getattr(nodes, "counter", None)
+        get_viewer_loaders(info).prime(edge.node for edge in conn.edges)
+        return conn
+
+
+class ExtraNodesExtension(FieldExtension):
+    """Merge the nodes returned by ``func(info, filters)``, an ``ExtraNodes`` or None, into a keyset connection."""
+
+    def __init__(self, func: Callable[[Info, Any], Optional[ExtraNodes]]):
+        self.func = func
+
+    def set_extra_nodes(self, nodes: Any, info: Info, filters: Any):
+        if isinstance(nodes, models.QuerySet):
+            nodes.extra_nodes = self.func(info, filters)
+        return nodes
+
+    def resolve(self, next_, source, info, **kwargs):
+        nodes = next_(source, info, **kwargs)
+        if inspect.isawaitable(nodes):
+            async def resolved():
+                return self.set_extra_nodes(await nodes, info, kwargs.get("filters"))
+
+            return resolved()
+        return self.set_extra_nodes(nodes, info, kwargs.get("filters"))
+
+    async def resolve_async(self, next_, source, info, **kwargs):
+        nodes = await next_(source, info, **kwargs)
+        return self.set_extra_nodes(nodes, info, kwargs.get("filters"))
+
+
+class CounterExtension(FieldExtension):
+    """Use the parent's ``column`` (a dotted attribute path) as totalCount when the connection is not filtered.
+
+    The counter is attached to the resolved queryset and picked up by ``CountedConnection``. The column
+    must be loaded with the parent, so declare it in the field's ``only`` hint for the optimizer.
+    """
+
+    def __init__(self, column: str):
+        self.counter = attrgetter(column)
+
+    def set_counter(self, nodes: Any, source: Any, filters: Any):
+        if isinstance(nodes, models.QuerySet) and filters in (None, UNSET):
+            nodes.counter = self.counter(source)
+        return nodes
+
+    def resolve(self, next_, source, info, **kwargs):
+        nodes = next_(source, info, **kwargs)
+        if inspect.isawaitable(nodes):
+            async def resolved():
+                return self.set_counter(await nodes, source, kwargs.get("filters"))
+
+            return resolved()
+        return self.set_counter(nodes, source, kwargs.get("filters"))
+
+    async def resolve_async(self, next_, source, info, **kwargs):
+        nodes = await next_(source, info, **kwargs)
+        return self.set_counter(nodes, source, kwargs.get("filters"))
+
+
+@strawberry.type(name="KeysetConnection", description="A connection to a list of items ordered by date.")
+class KeysetConnection(CountedConnection[relay.NodeType]):
+    """Connection whose cursors encode ``(date_time, id)`` of the node instead of its offset.
+
+    Pages are fetched with a ``WHERE (date_time, id) < (...)`` seek so every page costs the same
+    regardless of its depth, and rows inserted while scrolling do not shift the following pages.
+    """
+
+    @classmethod
+    def resolve_connection(
+            cls,
+            nodes: NodeIterableType[relay.NodeType],
+            *,
+            info: Info,
+            before: Optional[str] = None,
+            after: Optional[str] = None,
+            first: Optional[int] = None,
+            last: Optional[int] = None,
+            **kwargs: Any,
+    ):
+        first, last = page_arguments(first, last, before)
+        if not isinstance(nodes, models.QuerySet):
+            return super().resolve_connection(
+                nodes, info=info, before=before, after=after, first=first, last=last, **kwargs
+            )
+
+        max_results = info.schema.config.relay_max_results
+        for name, value in (("first", first), ("last", last)):
+            if value is not None and value < 0:
+                raise ValueError(f"Argument '{name}' must be a non-negative integer.")
+            if value is not None and value > max_results:
+                raise ValueError(f"Argument '{name}' cannot be higher than {max_results}.")
+
+        # Keep the direction requested by the client ordering or the model's, newest first otherwise
+        ordering = nodes.query.order_by or nodes.model._meta.ordering
+        descending = tuple(ordering[:1]) != ("date_time",)
+        backwards = last is not None and first is None
+        # Walk backwards from `before` and restore the order afterwards
+        sign = "-" if descending != backwards else ""
+        page_ordering = (f"{sign}date_time", f"{sign}pk")
+        limit = last if backwards else first if first is not None else max_results
+
+        def paginate(rows: List[models.Model]):
+            if backwards:
+                has_previous_page = len(rows) > last
+                page = rows[:last][::-1]
+                has_next_page = before is not None
+            else:
+                has_next_page = len(rows) > limit
+                page = rows[:limit]
+                if last is not None:
+                    page = page[-last:] if last else []
+                has_previous_page = after is not None
+            return cls.build(nodes, page, has_previous_page, has_next_page, info, **kwargs)
+
+        related = related_parent(nodes)
+        if related is not None and not after and not before:
+            field, parent = related
+            loader = get_page_loader(info, nodes, field, page_ordering, limit + 1)
+            keys, batch = loader.batch(parent.pk, get_viewer_loaders(info).nodes[type(parent)])
+            if batch is not None and in_async_context():
+                async def loaded():
+                    loader.store(keys, [node async for node in batch])
+                    return paginate(loader.pages[parent.pk])
+
+                return loaded()
+            if batch is not None:
+                loader.store(keys, list(batch))
+            return paginate(loader.pages[parent.pk])
+
+        # The rows of a reverse relation read the foreign key to attach the parent
+        qs = load_key(nodes, *(field.attname for field in nodes._known_related_objects))
+        if after:
+            qs = seek(qs, after, descending)
+        if before:
+            qs = seek(qs, before, not descending)
+        page_qs = qs.order_by(*page_ordering)[:limit + 1]
+
+        # Extra nodes are paged like the rows and merged with them, a page takes the first of both
+        extra = getattr(nodes, "extra_nodes", None)
+        extra_qs = None
+        if extra is not None:
+            extra_qs = extra.qs
+            if after:
+                extra_qs = seek(extra_qs, after, descending, "node_id")
+            if before:
+                extra_qs = seek(extra_qs, before, not descending, "node_id")
+            extra_qs = extra_qs.order_by(f"{sign}date_time", f"{sign}node_id")[:limit + 1]
+
+        def merge(rows: List[models.Model], extra_rows: Optional[List[models.Model]]) -> List[models.Model]:
+            if not extra_rows:
+                return rows
+            rows = rows + [extra.to_node(row) for row in extra_rows]
+            rows.sort(key=lambda node: (node.date_time, node.pk), reverse=sign == "-")
+            return rows[:limit + 1]
+
+        # Under the async view the page is fetched with the async ORM instead of blocking the event loop
+        if in_async_context():
+            async def resolved():
+                rows = [node async for node in page_qs]
+                extra_rows = [row async for row in extra_qs] if extra_qs is not None else None
+                return paginate(merge(rows, extra_rows))
+
+            return resolved()
+        return paginate(merge(list(page_qs), list(extra_qs) if extra_qs is not None else None))
+
+    @classmethod
+    def build(
+            cls,
+            nodes: models.QuerySet,
+            page: List[models.Model],
+            has_previous_page: bool,
+            has_next_page: bool,
+            info: Info,
+            **kwargs: Any,
+    ):
+        type_def = get_object_definition(cls)
+        assert type_def
+        edge_class = type_def.get_field("edges").resolve_type(type_definition=type_def)
+        while isinstance(edge_class, StrawberryContainer):
+            edge_class = edge_class.of_type
+
+        edges = [edge_class(cursor=to_cursor(node), node=cls.resolve_node(node, info=info, **kwargs)) for node in page]
+
+        conn = cls(
+            edges=edges,
+            page_info=relay.PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_previous_page,
+                has_next_page=has_next_page,
+            ),
+        )
+        conn.nodes = cast(NodeIterableType[relay.NodeType], nodes)
+        return cls.on_resolved(conn, nodes, info)
@@ -0,0 +1,58 @@
+import hashlib
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, set_response_etag
+from strawberry.http.exceptions import HTTPException
+
+
+class PersistedQueryNotFound(Exception):
+    """The client sent only the hash of a query that is not registered, it retries with the query text."""
+
+
+def persisted_query_key(sha256_hash: str) -> str:
+    return f"persisted-query:{sha256_hash}"
+
+
+def resolve_query(query: Optional[str], persisted: Optional[dict], method: str) -> Optional[str]:
+    """Query text of a request following the automatic persisted queries protocol.
+
+    A request with the query and its hash registers the query, later requests send the hash only.
+    GET requests must be persisted, so their URL stays short and cacheable.
+    """
+    if not persisted:
+        if method == "GET":
+            raise HTTPException(400, "GET requests must use a persisted query")
+        return query
+    if persisted.get("version") != 1:
+        raise HTTPException(400, "Unsupported persisted query version")
+
+    sha256_hash = persisted.get("sha256Hash", "")
+    cache = caches[settings.PERSISTED_QUERY_CACHE]
+    if query is None:
+        query = cache.get(persisted_query_key(sha256_hash))
+        if query is None:
+            raise PersistedQueryNotFound()
+        return query
+
+    if hashlib.sha256(query.encode()).hexdigest() != sha256_hash:
+        raise HTTPException(400, "provided sha does not match query")
+    cache.set(persisted_query_key(sha256_hash), query, timeout=None)
+    return query
+
+
+def cache_response(request: HttpRequest, response: HttpResponse, succeeded: bool) -> HttpResponse:
+    """Cache headers of a GET query, public and kept by the CDN unless resolving it read the session of the viewer."""
+    if not succeeded or response.status_code != 200:
+        patch_cache_control(response, no_store=True)
+        return response
+
+    if request.session.accessed:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        max_age = settings.PERSISTED_QUERY_MAX_AGE
+        patch_cache_control(response, public=True, max_age=max_age, s_maxage=max_age)
+    set_response_etag(response)
+    return get_conditional_response(request, etag=response["ETag"], response=response)
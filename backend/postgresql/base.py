@@ -0,0 +1,160 @@
+"""PostgreSQL backend keeping a bounded pool of open connections per process.
+
+Django opens a connection on the first query of a request and closes it when the request finishes,
+with CONN_MAX_AGE = 0. This backend hands out a pooled connection instead and takes it back on close,
+so requests skip the connection setup and TLS handshake. Configure it with the ``POOL`` key of the
+database settings, a SIZE of 0 disables the pool. Idle connections are closed when the process
+exits and before the test database is dropped.
+"""
+import atexit
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+import psycopg2
+from django.db.backends.postgresql import base, creation
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from backend.metrics import DB_CONNECTION_CHECKOUTS, DB_POOL_WAIT_SECONDS
+
+
+class ConnectionPool:
+    """At most ``size`` connections, idle ones are pinged before reuse and retired after ``max_age`` seconds."""
+
+    def __init__(self, alias: str, size: int, timeout: float, max_age: float, check_after: float):
+        self.alias = alias
+        self.timeout = timeout
+        self.max_age = max_age
+        self.check_after = check_after
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        # Idle connections with the time they were opened and released, the most recent last
+        self.idle: List[Tuple[psycopg2.extensions.connection, float, float]] = []
+        self.opened: Dict[int, float] = {}
+
+    def checkout(self, connect: Callable[[], psycopg2.extensions.connection]) -> psycopg2.extensions.connection:
+        start = time.perf_counter()
+        acquired = self.slots.acquire(timeout=self.timeout)
+        DB_POOL_WAIT_SECONDS.labels(self.alias).observe(time.perf_counter() - start)
+        if not acquired:
+            raise psycopg2.OperationalError(f"no connection of the {self.alias} pool was free within {self.timeout}s")
+
+        try:
+            while True:
+                with self.lock:
+                    if not self.idle:
+                        break
+                    connection, opened, released = self.idle.pop()
+                if self.usable(connection, opened, released):
+                    DB_CONNECTION_CHECKOUTS.labels(self.alias, "reused").inc()
+                    return connection
+                self.discard(connection)
+
+            connection = connect()
+            self.opened[id(connection)] = time.monotonic()
+            DB_CONNECTION_CHECKOUTS.labels(self.alias, "new").inc()
+            return connection
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, connection: psycopg2.extensions.connection, reusable: bool = True):
+        try:
+            if reusable and not connection.closed and connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                try:
+                    connection.rollback()
+                except psycopg2.Error:
+                    reusable = False
+            opened = self.opened.get(id(connection), 0.0)
+            if reusable and not connection.closed and time.monotonic() - opened < self.max_age:
+                with self.lock:
+                    self.idle.append((connection, opened, time.monotonic()))
+            else:
+                self.discard(connection)
+        finally:
+            self.slots.release()
+
+    def usable(self, connection: psycopg2.extensions.connection, opened: float, released: float) -> bool:
+        now = time.monotonic()
+        if connection.closed or now - opened >= self.max_age:
+            return False
+        if now - released < self.check_after:
+            return True
+        # Idle for a while, the server or a proxy may have dropped it, or the serverless instance was frozen
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except psycopg2.Error:
+            return False
+
+    def close(self):
+        """Close the idle connections, the checked out ones are closed when released."""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection, _, _ in idle:
+            self.discard(connection)
+
+    def discard(self, connection: psycopg2.extensions.connection):
+        self.opened.pop(id(connection), None)
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+
+pools: Dict[str, ConnectionPool] = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(alias: str, conn_params: dict, options: dict) -> ConnectionPool:
+    # Keyed by the connection parameters, the test runner connects the same alias to other databases
+    key = repr(sorted(conn_params.items()))
+    with pools_lock:
+        if key not in pools:
+            pools[key] = ConnectionPool(
+                alias,
+                size=options["SIZE"],
+                timeout=options.get("TIMEOUT", 10),
+                max_age=options.get("MAX_AGE", 600),
+                check_after=options.get("CHECK_AFTER", 30),
+            )
+        return pools[key]
+
+
+@atexit.register
+def close_pools():
+    """Close the idle connections of every pool, when the process exits and before a test database is dropped."""
+    with pools_lock:
+        for pool in pools.values():
+            pool.close()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections to the test database would make DROP DATABASE fail
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def pool_options(self) -> dict:
+        return self.settings_dict.get("POOL") or {}
+
+    def get_new_connection(self, conn_params):
+        options = self.pool_options()
+        if not options.get("SIZE"):
+            return super().get_new_connection(conn_params)
+
+        self.pool = get_pool(self.alias, conn_params, options)
+        connection = self.pool.checkout(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        self.isolation_level = self.settings_dict["OPTIONS"].get("isolation_level", connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None or not self.pool_options().get("SIZE"):
+            return super()._close()
+        # A connection closed inside an atomic block is in an unknown state, do not hand it out again
+        self.pool.release(self.connection, reusable=not self.in_atomic_block)
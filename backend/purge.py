@@ -0,0 +1,160 @@
+"""Background purge of deleted photos and of stored files no row references.
+
+``deletePhoto`` only sets ``deleted_at``, which hides the photo at once. The rows referencing it are
+then deleted in batches of PHOTO_PURGE_BATCH_SIZE, each in its own short transaction instead of one
+cascade, then its image and variants with bulk storage calls, and the photo row last. A purge that
+fails leaves the photo marked deleted, ``manage.py purgephotos`` retries it. On Vercel, where the
+purge thread is frozen once the response is sent, a cron job calls ``/cron/purge`` instead.
+"""
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Tuple, Type
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections, models, transaction
+from django.utils import timezone
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from backend.images import delete_files, image_names
+from backend.models import Comment, Feed, Photo, Profile
+from backend.utils import lock_name
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="photo-purge")
+
+# Rows referencing a photo, the largest first
+DEPENDENTS: List[Callable[[int], models.QuerySet]] = [
+    lambda photo_id: Feed.objects.filter(photo_id=photo_id),
+    lambda photo_id: Photo.user_like.through.objects.filter(photo_id=photo_id),
+    lambda photo_id: Comment.objects.filter(photo_id=photo_id),
+    lambda photo_id: Photo.tags.through.objects.filter(photo_id=photo_id),
+]
+
+VARIANT_SUFFIX = re.compile(r"_\d+w\.webp$")
+
+
+def schedule_purge(photo_id: int):
+    """Purge the photo in the background once the soft delete commits."""
+    if settings.PHOTO_PURGE_ASYNC:
+        transaction.on_commit(lambda: executor.submit(_run_purge, photo_id))
+    else:
+        transaction.on_commit(lambda: purge_photo(photo_id))
+
+
+def _run_purge(photo_id: int):
+    try:
+        purge_photo(photo_id)
+    except Exception:
+        logger.exception("purging photo %s failed, purgephotos will retry", photo_id)
+    finally:
+        connections.close_all()
+
+
+def delete_in_batches(qs: models.QuerySet, batch_size: int) -> int:
+    """Delete the rows of ``qs`` by primary key batches, each in its own transaction, returns the rows deleted."""
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            pks = list(qs.order_by("pk").values_list("pk", flat=True)[:batch_size])
+            if not pks:
+                return deleted
+            deleted += qs.model._base_manager.filter(pk__in=pks).delete()[0]
+
+
+def with_retries(fn: Callable[[], None], attempts: int):
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(settings.PHOTO_PURGE_RETRY_DELAY * 2 ** attempt)
+
+
+def purge_photo(photo_id: int) -> bool:
+    """Delete a soft-deleted photo with its rows and files, returns whether there was one to purge."""
+    photo = Photo.all_objects.filter(pk=photo_id, deleted_at__isnull=False).only("id", "file", "variants").first()
+    if photo is None:
+        return False
+
+    for dependents in DEPENDENTS:
+        delete_in_batches(dependents(photo.id), settings.PHOTO_PURGE_BATCH_SIZE)
+
+    # Content is stored once per hash, keep it while another row uses it. Locked like in save_image, an
+    # upload of the same content either sees the file gone or is committed before the check.
+    name = photo.file.name
+    if name:
+        with transaction.atomic():
+            lock_name(name)
+            if not Photo.all_objects.filter(file=name).exclude(pk=photo.id).exists():
+                with_retries(lambda: delete_files(image_names(name, photo.variants)), settings.PHOTO_PURGE_ATTEMPTS)
+
+    # Rows added since, like comments posted on a stale page, go with the cascade
+    photo.delete()
+    return True
+
+
+def purge_deleted(min_age: timedelta, limit: int = 100) -> int:
+    """Purge photos deleted at least ``min_age`` ago, oldest first, returns how many were purged."""
+    photo_ids = Photo.all_objects.filter(deleted_at__lte=timezone.now() - min_age) \
+        .order_by("deleted_at").values_list("id", flat=True)[:limit]
+    purged = 0
+    for photo_id in photo_ids:
+        try:
+            purged += purge_photo(photo_id)
+        except Exception:
+            logger.exception("purging photo %s failed", photo_id)
+    return purged
+
+
+def stored_files(prefix: str) -> Iterator[Tuple[str, datetime]]:
+    """Names and modification times of the files under ``prefix``, from the bucket listing on S3."""
+    if isinstance(default_storage, S3Boto3Storage):
+        key_prefix = default_storage._normalize_name(prefix)
+        location = key_prefix[:len(key_prefix) - len(prefix)]
+        for obj in default_storage.bucket.objects.filter(Prefix=key_prefix):
+            yield obj.key[len(location):], obj.last_modified
+        return
+    if not default_storage.exists(prefix):
+        return
+    directories, files = default_storage.listdir(prefix)
+    for name in files:
+        yield prefix + name, default_storage.get_modified_time(prefix + name)
+    for directory in directories:
+        yield from stored_files(f"{prefix}{directory}/")
+
+
+def orphaned_files(prefix: str, model: Type[models.Model], field: str, before: datetime) -> Iterator[str]:
+    """Images under ``prefix`` older than ``before`` whose original no row of ``model`` references, and their variants."""
+    # Files by the name of their original without extension, variants are named after it
+    groups: Dict[str, List[Tuple[str, datetime]]] = defaultdict(list)
+    for name, modified in stored_files(prefix):
+        root = VARIANT_SUFFIX.sub("", name) if VARIANT_SUFFIX.search(name) else os.path.splitext(name)[0]
+        groups[root].append((name, modified))
+
+    roots = list(groups)
+    for start in range(0, len(roots), 1000):
+        batch = roots[start:start + 1000]
+        names = [name for root in batch for name, _ in groups[root]]
+        referenced = model._base_manager.filter(**{f"{field}__in": names}).values_list(field, flat=True)
+        referenced_roots = {os.path.splitext(name)[0] for name in referenced}
+        for root in batch:
+            if root not in referenced_roots:
+                yield from (name for name, modified in groups[root] if modified < before)
+
+
+def orphans(older_than: timedelta) -> List[str]:
+    """Stored files nothing references: photo and avatar images without a row, and abandoned direct uploads."""
+    before = timezone.now() - older_than
+    found = list(orphaned_files(Photo.file.field.upload_to, Photo, "file", before))
+    found += orphaned_files(Profile.avatar.field.upload_to, Profile, "avatar", before)
+    # Direct uploads are moved out of uploads/ when finalized, what is left was never finalized
+    found += [name for name, modified in stored_files("uploads/") if modified < before]
+    return found
@@ -0,0 +1,27 @@
+"""Pillow work run in the image worker processes.
+
+Workers are spawned, not forked, and import this module on their own: it must not import Django.
+"""
+import io
+from typing import Dict, Sequence
+
+from PIL import Image, ImageOps
+
+
+def render_variants(path: str, widths: Sequence[int], quality: int) -> Dict[int, bytes]:
+    """Encode a WebP copy of the image for every width smaller than the original."""
+    variants = {}
+    with Image.open(path) as img:
+        # Let the JPEG decoder downscale while decoding, the largest variant is all we need
+        img.draft("RGB", (max(widths), max(widths)))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        for width in sorted(widths, reverse=True):
+            if width >= img.width:
+                continue
+            img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+            buffer = io.BytesIO()
+            img.save(buffer, "WEBP", quality=quality)
+            variants[width] = buffer.getvalue()
+    return variants
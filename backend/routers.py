@@ -0,0 +1,84 @@
+import random
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from strawberry.extensions import SchemaExtension
+from strawberry.types.graphql import OperationType
+
+# Set while a GraphQL query operation executes, sync_to_async carries it to the ORM threads
+read_replicas: ContextVar[bool] = ContextVar("read_replicas", default=False)
+
+
+def sticky_key(user_id: int) -> str:
+    return f"primary-reads:{user_id}"
+
+
+def stick_to_primary(user_id: int):
+    caches[settings.REPLICA_PIN_CACHE].set(sticky_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def reads_from_primary(user_id: Optional[int]) -> bool:
+    return user_id is not None and caches[settings.REPLICA_PIN_CACHE].get(sticky_key(user_id), False)
+
+
+class ReplicaRouter:
+    """Read from a random replica during query operations, write and read everything else on the primary.
+
+    Sessions are always read from the primary, a replica may not have the session of a fresh login yet.
+    """
+
+    def db_for_read(self, model, **hints):
+        if read_replicas.get() and settings.DATABASE_REPLICAS and model._meta.app_label != "sessions":
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRouting(SchemaExtension):
+    """Route query operations to the replicas, unless the viewer ran a mutation in the last REPLICA_STICKY_SECONDS.
+
+    Mutations stick their user to the primary for that window, so it reads its own writes despite the
+    replication lag. The pins are kept in the shared cache, without it everything reads from the primary,
+    a pin set by one worker would not be seen by the next request landing on another.
+    """
+
+    def on_execute(self) -> Iterator[None]:
+        if not settings.DATABASE_REPLICAS or not settings.SHARED_CACHE:
+            yield
+            return
+
+        execution_context = self.execution_context
+        try:
+            operation_type = execution_context.operation_type
+        except Exception:
+            operation_type = None
+        request = getattr(execution_context.context, "request", None)
+
+        if operation_type == OperationType.QUERY and not reads_from_primary(viewer_id(request)):
+            token = read_replicas.set(True)
+            try:
+                yield
+            finally:
+                read_replicas.reset(token)
+            return
+
+        yield
+        # Read after the operation, login and createUser change the user of the request
+        if operation_type == OperationType.MUTATION and viewer_id(request) is not None:
+            stick_to_primary(viewer_id(request))
+
+
+def viewer_id(request) -> Optional[int]:
+    return getattr(getattr(request, "user", None), "id", None)
@@ -1,15 +1,24 @@
-from typing import List, Optional
+from typing import List, Optional, Iterable
 
+from django.conf import settings
 from django.core.files.storage import default_storage
-from django.db.models import Count
+from graphql import GraphQLError
 from strawberry import UNSET
+from strawberry.schema.config import StrawberryConfig
+from strawberry.utils.inspect import in_async_context
 from strawberry_django.optimizer import DjangoOptimizerExtension
 
 from backend.aws import AWSQuery
-from backend.models import PhotoTag
+from backend.cost import QueryCost
+from backend.extensions import DocumentCache, MetricsExtension, TracingExtension
+from backend.feeds import pulled_feeds
+from backend.models import PhotoTag, Feed
 from backend.mutations import Mutation
+from backend.pagination import ExtraNodesExtension
+from backend.routers import ReplicaRouting
 from backend.types import *
 from backend.directive import IsAuthenticated
+from backend.errors import ERR_INVALID_ARGUMENT
 
 
 @strawberry.type
@@ -21,30 +30,43 @@ class CostumeQuery:
 
     @strawberry.field(extensions=[IsAuthenticated()])
     def top_tags(self, top_n: Optional[int] = 5, text: Optional[str] = UNSET) -> List[HotTag]:
-        tags = PhotoTag.objects
-        if text is not UNSET:
-            tags = tags.filter(tag__istartswith=text)
-        tags = tags.annotate(Count('photo')).filter(photo__count__gte=1).order_by("-photo__count")[:top_n]
-        return [HotTag(tag=t.tag, count=t.photo__count) for t in tags]
+        top_n = 5 if top_n is None else top_n
+        if not 0 <= top_n <= settings.GRAPHQL_MAX_PAGE_SIZE:
+            raise GraphQLError(message=f"topN must be between 0 and {settings.GRAPHQL_MAX_PAGE_SIZE}",
+                               extensions=ERR_INVALID_ARGUMENT)
+        tags = PhotoTag.objects.filter(photo_count__gte=1)
+        if text:
+            tags = tags.filter(normalized__startswith=PhotoTag.normalize(text))
+        tags = tags.order_by("-photo_count").only("tag", "photo_count")[:top_n]
+        if in_async_context():
+            async def resolved():
+                return [HotTag(tag=t.tag, count=t.photo_count) async for t in tags]
+
+            return resolved()
+        return [HotTag(tag=t.tag, count=t.photo_count) for t in tags]
 
 
 @strawberry.type
 class ModelQuery:
     user: Optional[UserType] = strawberry_django.node(extensions=[IsAuthenticated()])
 
-    users: ListConnectionWithTotalCount[UserType] = strawberry_django.connection(extensions=[IsAuthenticated()])
+    users: CountedConnection[UserType] = strawberry_django.connection(extensions=[IsAuthenticated()])
 
     profile: Optional[relay.Node] = strawberry_django.node(extensions=[IsAuthenticated()])
 
-    profiles: ListConnectionWithTotalCount[ProfileType] = strawberry_django.connection(extensions=[IsAuthenticated()])
+    profiles: CountedConnection[ProfileType] = strawberry_django.connection(extensions=[IsAuthenticated()])
 
     photo: Optional[PhotoType] = strawberry_django.node(extensions=[IsAuthenticated()])
 
-    photos: ListConnectionWithTotalCount[PhotoType] = strawberry_django.connection(extensions=[IsAuthenticated()])
+    photos: KeysetConnection[PhotoType] = strawberry_django.connection(extensions=[IsAuthenticated()])
 
     comment: Optional[CommentType] = strawberry_django.node(extensions=[IsAuthenticated()])
 
-    feeds: ListConnectionWithTotalCount[FeedType] = strawberry_django.connection(extensions=[IsAuthenticated()])
+    @strawberry_django.connection(KeysetConnection[FeedType],
+                                  extensions=[IsAuthenticated(), ExtraNodesExtension(pulled_feeds)])
+    def feeds(self, info: Info) -> Iterable[FeedType]:
+        # Rows of deleted photos remain until the photo is purged
+        return Feed.objects.filter(photo__deleted_at__isnull=True)
 
 
 @strawberry.type
@@ -57,5 +79,11 @@ schema = strawberry.Schema(
     mutation=Mutation,
     extensions=[
         DjangoOptimizerExtension,
+        DocumentCache,
+        QueryCost,
+        MetricsExtension,
+        ReplicaRouting,
+        *([TracingExtension] if settings.TRACING_ENABLED else []),
     ],
+    config=StrawberryConfig(relay_max_results=settings.GRAPHQL_MAX_PAGE_SIZE),
 )
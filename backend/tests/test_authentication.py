@@ -0,0 +1,79 @@
+import tempfile
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import KEY_PREFIX as SESSION_KEY_PREFIX
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from backend.authentication import CachedModelBackend, user_cache_key
+from backend.errors import ERR_NOT_LOGIN
+from backend.models import Profile
+
+
+# A file cache stands in for Redis, a second instance over the same directory plays another worker
+SHARED_CACHE_DIR = tempfile.mkdtemp()
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": SHARED_CACHE_DIR}},
+    SHARED_CACHE=True,
+    SESSION_ENGINE="django.contrib.sessions.backends.cached_db",
+    AUTHENTICATION_BACKENDS=["backend.authentication.CachedModelBackend"],
+)
+class CachedUserTest(TestCase):
+    def setUp(self):
+        caches[settings.USER_CACHE].clear()
+        self.user = User.objects.create_user(username="user", password="password", first_name="old")
+        Profile.objects.create(user=self.user, description="old")
+        self.client.force_login(self.user)
+
+    def post(self, query: str) -> dict:
+        response = self.client.post("/graphql", {"query": query}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_authenticated_requests_skip_session_and_user_queries(self):
+        self.post("{ topTags { tag } }")
+        with CaptureQueriesContext(connection) as queries:
+            self.post("{ topTags { tag } }")
+        self.assertEqual(len(queries), 1, [q["sql"] for q in queries])
+
+    def test_profile_update_invalidates_the_cached_user(self):
+        self.post("{ topTags { tag } }")
+        result = self.post('mutation { updateProfile(input: {firstName: "new", lastName: "", description: "new"}) '
+                           '{ ... on UserType { firstName profile { description } } } }')
+        self.assertEqual(result["data"]["updateProfile"]["profile"]["description"], "new")
+
+        cached = caches[settings.USER_CACHE].get(user_cache_key(self.user.pk))
+        self.assertIsNone(cached)
+        self.post("{ topTags { tag } }")
+        cached = caches[settings.USER_CACHE].get(user_cache_key(self.user.pk))
+        self.assertEqual((cached.first_name, cached.profile.description), ("new", "new"))
+
+    def test_counters_are_not_cached(self):
+        self.post("{ topTags { tag } }")
+        Profile.objects.filter(user=self.user).update(follower_count=5)
+        self.assertEqual(CachedModelBackend().get_user(self.user.pk).profile.follower_count, 5)
+
+    def test_password_change_ends_other_sessions(self):
+        self.post("{ topTags { tag } }")
+        self.user.set_password("changed")
+        self.user.save()
+        self.assertEqual(self.post("{ topTags { tag } }")["errors"][0]["extensions"]["code"], ERR_NOT_LOGIN["code"])
+
+    def test_invalidation_reaches_other_workers(self):
+        self.post("{ topTags { tag } }")
+        other_worker = FileBasedCache(SHARED_CACHE_DIR, {})
+        session_key = SESSION_KEY_PREFIX + self.client.session.session_key
+        self.assertIsNotNone(other_worker.get(user_cache_key(self.user.pk)))
+        self.assertIsNotNone(other_worker.get(session_key))
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(other_worker.get(user_cache_key(self.user.pk)))
+        self.client.logout()
+        self.assertIsNone(other_worker.get(session_key))
@@ -0,0 +1,72 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from backend import aws
+from backend.tests.utils import execute
+
+
+class FakeLocationClient:
+    """Stand-in for the boto3 AWS Location client, knows a few places per prefix."""
+
+    def __init__(self, places, delay=0.0):
+        self.places = places
+        self.delay = delay
+        self.calls = []
+
+    def search_place_index_for_suggestions(self, IndexName, MaxResults, Text):
+        self.calls.append((Text, MaxResults))
+        time.sleep(self.delay)
+        return {"Results": [{"Text": place} for place in self.places.get(Text.lower(), [])][:MaxResults]}
+
+
+class LocationSuggestionTest(TestCase):
+    places = {"par": [f"Paris {i}, France" for i in range(10)], "pa": ["Palo Alto, CA"]}
+
+    def setUp(self):
+        caches[settings.LOCATION_SUGGESTION_CACHE].clear()
+        self.location = FakeLocationClient(self.places)
+        patcher = mock.patch.object(aws, "location_client", self.location)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_larger_results_serve_smaller_requests(self):
+        self.assertEqual(len(aws.get_suggestion("par", 8)), 8)
+        self.assertEqual(aws.get_suggestion("Par ", 3), self.places["par"][:3])
+        self.assertEqual(len(aws.get_suggestion("par", 10)), 10)
+        self.assertEqual(self.location.calls, [("par", 8), ("par", 10)])
+
+    def test_short_results_are_complete(self):
+        self.assertEqual(aws.get_suggestion("pa", 5), ["Palo Alto, CA"])
+        self.assertEqual(aws.get_suggestion("pa", 15), ["Palo Alto, CA"])
+        self.assertEqual(len(self.location.calls), 1)
+
+    def test_empty_results_are_cached_briefly(self):
+        cache = caches[settings.LOCATION_SUGGESTION_CACHE]
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            self.assertEqual(aws.get_suggestion("xyz", 5), [])
+        self.assertEqual(cache_set.call_args.args[2], settings.LOCATION_SUGGESTION_NEGATIVE_TTL)
+        self.assertEqual(aws.get_suggestion("xyz", 5), [])
+        self.assertEqual(aws.get_suggestion("  ", 5), [])
+        self.assertEqual(len(self.location.calls), 1)
+
+    def test_top_n_is_bounded(self):
+        query = "query ($topN: Int) { locationSuggestions(text: \"par\", topN: $topN) { main } }"
+        user = User.objects.create_user(username="user", password="password")
+        for top_n in (0, aws.MAX_SUGGESTIONS + 1):
+            with self.assertRaisesMessage(AssertionError, f"topN must be between 1 and {aws.MAX_SUGGESTIONS}"):
+                execute(query, user, topN=top_n)
+        self.assertEqual(len(execute(query, user, topN=3)["locationSuggestions"]), 3)
+        self.assertEqual(len(execute(query, user, topN=None)["locationSuggestions"]), 5)
+
+    def test_concurrent_lookups_are_coalesced(self):
+        self.location.delay = 0.2
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: aws.get_suggestion("par", 5), range(8)))
+        self.assertTrue(all(result == self.places["par"][:5] for result in results))
+        self.assertEqual(len(self.location.calls), 1)
@@ -0,0 +1,79 @@
+import io
+import json
+import tempfile
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from backend import benchmark
+from backend.models import Photo
+
+
+class BulkLoadCommandTest(TestCase):
+    def test_generate(self):
+        out = io.StringIO()
+        call_command("bulkload", "--users", "20", "--photos-per-user", "1.5", "--follows-per-user", "2.5",
+                     "--tags", "5", "--days", "2", stdout=out)
+        self.assertIn("backend_photo: ", out.getvalue())
+        self.assertEqual(User.objects.count(), 20)
+        user = Photo.objects.first().user
+        self.assertEqual(user.profile.photo_count, Photo.objects.filter(user=user).count())
+
+    def test_counts_must_be_integers(self):
+        with self.assertRaisesMessage(CommandError, "invalid int value: '0.5'"):
+            call_command("bulkload", "--users", "0.5")
+
+
+class BenchmarkCommandTest(TransactionTestCase):
+    @mock.patch("backend.management.commands.benchmark.teardown_databases")
+    @mock.patch("backend.management.commands.benchmark.setup_databases")
+    def test_scenarios_run_against_a_seeded_dataset(self, setup_databases, teardown_databases):
+        output = tempfile.NamedTemporaryFile(suffix=".json")
+        call_command("benchmark", "--users", "10", "--photos-per-user", "1.5", "--tags", "5", "--iterations", "2",
+                     "--warmup", "0", "--scenarios", "feed_scroll", "top_tags", "--output", output.name,
+                     stdout=io.StringIO())
+        results = json.load(output)
+        self.assertEqual(results["dataset"]["photos_per_user"], 1.5)
+        self.assertEqual(set(results["scenarios"]), {"feed_scroll", "top_tags"})
+        self.assertTrue(all(result["errors"] == 0 for result in results["scenarios"].values()))
+        teardown_databases.assert_called_once()
+
+        baseline = tempfile.NamedTemporaryFile("w", suffix=".json")
+        results["scenarios"]["top_tags"].update(p50=0.001, queries_mean=0)
+        json.dump(results, baseline)
+        baseline.flush()
+        out = io.StringIO()
+        with self.assertRaisesMessage(CommandError, f"regressions against {baseline.name}"):
+            call_command("benchmark", "--iterations", "2", "--warmup", "0", "--scenarios", "top_tags",
+                         "--compare", baseline.name, stdout=out)
+        self.assertIn("regression: top_tags p50 0.0ms", out.getvalue())
+        self.assertIn("regression: top_tags queries 0.0", out.getvalue())
+
+
+class BenchmarkCompareTest(SimpleTestCase):
+    @staticmethod
+    def results(**scenarios) -> dict:
+        return {"scenarios": {
+            name: {"p50": p50, "p95": p50 * 2, "p99": p50 * 3, "queries_mean": queries}
+            for name, (p50, queries) in scenarios.items()
+        }}
+
+    def test_percentile_is_nearest_rank(self):
+        values = [float(v) for v in range(1, 101)]
+        self.assertEqual([benchmark.percentile(values, p) for p in (50, 95, 99, 100)], [50, 95, 99, 100])
+        self.assertEqual(benchmark.percentile([7.0], 99), 7.0)
+
+    def test_regressions_beyond_the_threshold(self):
+        baseline = self.results(feed=(10, 5), like=(10, 3))
+        current = self.results(feed=(11.5, 5), like=(13, 2), upload=(100, 50))
+        self.assertEqual(benchmark.compare(baseline, current, threshold=20), [
+            "like p50 10.0ms -> 13.0ms (+30%)", "like p95 20.0ms -> 26.0ms (+30%)", "like p99 30.0ms -> 39.0ms (+30%)",
+        ])
+        self.assertEqual(benchmark.compare(baseline, self.results(feed=(10, 6)), threshold=20), ["feed queries 5.0 -> 6.0"])
+
+    def test_failed_scenarios_are_skipped(self):
+        baseline = self.results(feed=(10, 5))
+        self.assertEqual(benchmark.compare(baseline, {"scenarios": {"feed": {"iterations": 0, "errors": 2}}}, 20), [])
+        self.assertEqual(benchmark.compare({}, self.results(feed=(10, 5)), 20), [])
@@ -0,0 +1,130 @@
+import io
+from typing import Optional
+
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from strawberry import relay
+
+from backend.models import Comment, Follow, Photo, PhotoTag, Profile
+from backend.mutations import create_photo
+from backend.tests.utils import create_user, execute, jpeg
+
+
+class TagCounterTest(TestCase):
+    top_tags = """
+        query ($topN: Int, $text: String) { topTags(topN: $topN, text: $text) { tag count } }
+    """
+    delete = """
+        mutation ($id: GlobalID!) { deletePhoto(input: { id: $id }) { ... on PhotoType { id } } }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("user")
+        cls.photos = [
+            create_photo(cls.user, f"images/{i}.jpg", 10, 10, "d", "l", tags) for i, tags in enumerate([
+                ["Cat", "dog", "Cat"], [" cat ", "Catalina", "dog"], ["cat", "dog", "Catalina"], ["dog", "car"]
+            ])
+        ]
+
+    def tags(self, top_n: Optional[int], text: str = None) -> list:
+        return [(t["tag"], t["count"]) for t in execute(self.top_tags, self.user, topN=top_n, text=text)["topTags"]]
+
+    def test_counts_follow_uploads_and_deletes(self):
+        self.assertEqual(self.tags(2), [("dog", 4), ("Catalina", 2)])
+        with self.captureOnCommitCallbacks():
+            execute(self.delete, self.user, id=relay.to_base64("PhotoType", self.photos[0].id))
+        self.assertEqual(dict(PhotoTag.objects.values_list("tag", "photo_count")),
+                         {"Cat": 0, "dog": 3, " cat ": 1, "Catalina": 2, "cat": 1, "car": 1})
+        self.assertNotIn("Cat", dict(self.tags(10)))
+
+        PhotoTag.objects.update(photo_count=7)
+        call_command("reconcilecounters", stdout=io.StringIO())
+        self.assertEqual(dict(PhotoTag.objects.values_list("tag", "photo_count")),
+                         {"Cat": 0, "dog": 3, " cat ": 1, "Catalina": 2, "cat": 1, "car": 1})
+
+    @override_settings(PHOTO_PURGE_ASYNC=False)
+    def test_counts_match_reconciled_after_upload_and_purge(self):
+        upload = """
+            mutation ($photo: Upload!, $tags: [String!]!) {
+                uploadPhoto(input: { photo: $photo, description: "d", location: "l", tags: $tags }) {
+                    ... on PhotoType { id }
+                }
+            }
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            photo = execute(upload, self.user, photo=SimpleUploadedFile("photo.jpg", jpeg()),
+                            tags=["car", "bird", "car"])["uploadPhoto"]
+        with self.captureOnCommitCallbacks(execute=True):
+            execute(self.delete, self.user, id=relay.to_base64("PhotoType", self.photos[3].id))
+        self.assertFalse(Photo.objects.filter(pk=self.photos[3].id).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            execute(self.delete, self.user, id=photo["id"])
+
+        maintained = dict(PhotoTag.objects.values_list("tag", "photo_count"))
+        self.assertEqual(maintained, {"Cat": 1, "dog": 3, " cat ": 1, "Catalina": 2, "cat": 1, "car": 0, "bird": 0})
+        call_command("reconcilecounters", stdout=io.StringIO())
+        self.assertEqual(dict(PhotoTag.objects.values_list("tag", "photo_count")), maintained)
+        top = self.tags(None)
+        self.assertEqual((len(top), top[:2]), (5, [("dog", 3), ("Catalina", 2)]))
+
+    def test_prefix_suggestions(self):
+        self.assertEqual(self.tags(10, " CA")[0], ("Catalina", 2))
+        self.assertEqual(sorted(self.tags(10, "cat")), [(" cat ", 1), ("Cat", 1), ("Catalina", 2), ("cat", 1)])
+        self.assertEqual(self.tags(10, "do"), [("dog", 4)])
+        self.assertEqual(self.tags(10, "bird"), [])
+
+
+class ConnectionCounterTest(TestCase):
+    query = """
+        query ($id: GlobalID!) {
+            user(id: $id) {
+                profile { follower { totalCount } following { totalCount } }
+                photos(first: 5) { totalCount edges { node { userLike { totalCount } comments { totalCount } } } }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, *cls.others = [create_user(name) for name in ("owner", "a", "b")]
+        cls.photos = Photo.objects.bulk_create([Photo(file="images/photo.png", user=cls.owner) for _ in range(2)])
+        cls.photos[0].user_like.add(*cls.others)
+        Comment.objects.create(photo=cls.photos[1], user=cls.others[0], comment="nice")
+        Follow.objects.bulk_create([Follow(follower=user, followee=cls.owner) for user in cls.others] +
+                                   [Follow(follower=cls.owner, followee=cls.others[0])])
+
+    def counts(self) -> dict:
+        user = execute(self.query, self.owner, id=relay.to_base64("UserType", self.owner.id))["user"]
+        return {
+            "follower": user["profile"]["follower"]["totalCount"],
+            "following": user["profile"]["following"]["totalCount"],
+            "photos": user["photos"]["totalCount"],
+            "likes": [edge["node"]["userLike"]["totalCount"] for edge in user["photos"]["edges"]],
+            "comments": [edge["node"]["comments"]["totalCount"] for edge in user["photos"]["edges"]],
+        }
+
+    def test_total_count_is_read_from_the_counter_columns(self):
+        # Wrong on purpose, a count of the relation tables would not return them
+        Profile.objects.filter(user=self.owner).update(follower_count=7, following_count=8, photo_count=9)
+        Photo.objects.update(like_count=5, comment_count=6)
+        with CaptureQueriesContext(connection) as queries:
+            counts = self.counts()
+        self.assertEqual(counts, {"follower": 7, "following": 8, "photos": 9, "likes": [5, 5], "comments": [6, 6]})
+        self.assertFalse([query["sql"] for query in queries if "COUNT(" in query["sql"].upper()])
+
+        call_command("reconcilecounters", "--batch-size", "1", stdout=io.StringIO())
+        self.assertEqual(self.counts(), {"follower": 2, "following": 1, "photos": 2, "likes": [0, 2], "comments": [1, 0]})
+
+    def test_filtered_connections_are_counted(self):
+        Profile.objects.filter(user=self.owner).update(follower_count=7)
+        query = """
+            query ($id: GlobalID!) {
+                user(id: $id) { profile { follower(filters: { username: { exact: "a" } }) { totalCount } } }
+            }
+        """
+        user = execute(query, self.owner, id=relay.to_base64("UserType", self.owner.id))["user"]
+        self.assertEqual(user["profile"]["follower"]["totalCount"], 1)
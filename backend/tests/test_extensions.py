@@ -0,0 +1,106 @@
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from backend.errors import ERR_INVALID_ARGUMENT, ERR_QUERY_COST, ERR_QUERY_THROTTLED
+from backend.extensions import DocumentCache, TracingExtension
+from backend.models import Photo, Trace
+from backend.schema import schema
+from backend.tests.utils import create_user, execute
+
+
+class DocumentCacheTest(TestCase):
+    def setUp(self):
+        DocumentCache.clear()
+
+    def test_repeated_documents_are_parsed_once(self):
+        for _ in range(3):
+            self.assertIn("backgroundImage", schema.execute_sync("{ backgroundImage }").data)
+        self.assertEqual((DocumentCache.stats()["hits"], DocumentCache.stats()["misses"]), (2, 1))
+
+    def test_invalid_documents_are_still_rejected(self):
+        for _ in range(2):
+            self.assertTrue(schema.execute_sync("{ backgroundImage unknownField }").errors)
+            self.assertTrue(schema.execute_sync("{ backgroundImage").errors)
+        self.assertEqual(DocumentCache.stats()["size"], 1)
+
+
+class QueryCostTest(TestCase):
+    users = "query ($first: Int) { users(first: $first) { edges { node { username profile { description } } } } }"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.accounts = [create_user(f"user{i:02}") for i in range(25)]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.accounts[0])
+
+    def post(self, query: str, **variables) -> dict:
+        response = self.client.post("/graphql", {"query": query, "variables": variables}, content_type="application/json")
+        return response.json()
+
+    def test_cost_is_reported(self):
+        result = self.post(self.users, first=5)
+        self.assertEqual(len(result["data"]["users"]["edges"]), 5)
+        # The connection, then edge, node and profile of 5 users
+        self.assertEqual(result["extensions"]["cost"], {"requested": 16, "maximum": settings.GRAPHQL_MAX_COST})
+
+    def test_costly_and_deep_queries_are_rejected(self):
+        nested = "{ users(first: 100) { edges { node { photos(first: 100) { edges { node { id } } } } } } }"
+        result = self.post(nested)
+        self.assertIsNone(result["data"])
+        self.assertEqual(result["errors"][0]["extensions"]["code"], ERR_QUERY_COST["code"])
+
+        deep = "{ users { edges { node { profile { follower { edges { node { profile { following { edges { node { id } } } } } } } } } } } }"
+        self.assertIn("exceeds maximum operation depth", self.post(deep)["errors"][0]["message"])
+
+    def test_default_page_size(self):
+        self.assertEqual(len(self.post(self.users)["data"]["users"]["edges"]), settings.GRAPHQL_DEFAULT_PAGE_SIZE)
+        last = self.post("{ users(last: 3) { pageInfo { hasPreviousPage } edges { node { username } } } }")["data"]
+        self.assertEqual(len(last["users"]["edges"]), 3)
+        self.assertTrue(last["users"]["pageInfo"]["hasPreviousPage"])
+
+    def test_top_n_is_checked(self):
+        result = self.post("{ topTags(topN: -100000) { tag } users(first: 100) { edges { node { username } } } }")
+        self.assertEqual(result["errors"][0]["extensions"]["code"], ERR_INVALID_ARGUMENT["code"])
+        # topTags counts once, the connection then edge and node of 100 users
+        self.assertEqual(result["extensions"]["cost"]["requested"], 202)
+
+        result = self.post("{ topTags(topN: null) { tag } }")
+        self.assertEqual(result["data"], {"topTags": []})
+
+    @override_settings(GRAPHQL_COST_PER_MINUTE=20)
+    def test_throttling(self):
+        self.assertEqual(self.post(self.users, first=5)["extensions"]["cost"]["remaining"], 4)
+        result = self.post(self.users, first=5)
+        self.assertEqual(result["errors"][0]["extensions"]["code"], ERR_QUERY_THROTTLED["code"])
+
+
+class TracingTest(TestCase):
+    query = "query Photos { photos(first: 5) { edges { node { isLike comments { totalCount } } } } }"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("user")
+        Photo.objects.bulk_create([Photo(file="images/photo.png", user=cls.user) for _ in range(3)])
+
+    def execute(self):
+        with mock.patch.object(schema, "extensions", [*schema.extensions, TracingExtension]):
+            execute(self.query, self.user)
+
+    @override_settings(TRACING_SAMPLE_RATE=1)
+    def test_spans_record_their_sql(self):
+        self.execute()
+        trace = Trace.objects.get()
+        self.assertEqual(trace.operation, "Photos")
+        photos = next(span for span in trace.spans if span["path"] == "photos")
+        self.assertTrue(photos["queries"])
+        self.assertEqual(trace.query_count, sum(len(span["queries"]) for span in trace.spans))
+
+    @override_settings(TRACING_SAMPLE_RATE=0, TRACING_SLOW_MS=10_000)
+    def test_unsampled_fast_operations_are_not_stored(self):
+        self.execute()
+        self.assertFalse(Trace.objects.exists())
@@ -0,0 +1,102 @@
+import tempfile
+from datetime import timedelta
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from strawberry import relay
+
+from backend.models import Photo, Feed, Follow
+from backend.tests.utils import create_user, execute, jpeg
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), FEED_FANOUT_THRESHOLD=3, FEED_FANOUT_BATCH_SIZE=1,
+                   FEED_FANOUT_ASYNC=False, IMAGE_VARIANT_ASYNC=False, IMAGE_VARIANT_WORKERS=0)
+class FeedTest(TestCase):
+    upload = """
+        mutation ($photo: Upload!, $description: String!) {
+            uploadPhoto(input: { photo: $photo, description: $description, location: "l", tags: [] }) {
+                ... on PhotoType { id }
+            }
+        }
+    """
+    feeds = """
+        query ($id: GlobalID!, $after: String) {
+            feeds(first: 2, after: $after, filters: { user: { id: $id } }) {
+                totalCount
+                pageInfo { hasNextPage endCursor }
+                edges { node { photo { description } } }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.star = create_user("star", follower_count=3)
+        cls.friend, *cls.readers = [create_user(name) for name in ("friend", "a", "b", "c")]
+        Follow.objects.bulk_create([Follow(follower=user, followee=cls.star) for user in cls.readers] +
+                                   [Follow(follower=cls.readers[i], followee=cls.friend) for i in (0, 2)])
+
+    def post(self, user: User, description: str):
+        with self.captureOnCommitCallbacks(execute=True):
+            execute(self.upload, user, photo=SimpleUploadedFile("photo.jpg", jpeg()),
+                    description=description)
+
+    def read(self, reader: User) -> list:
+        descriptions, after = [], None
+        while True:
+            page = execute(self.feeds, reader, id=relay.to_base64("UserType", reader.id), after=after)["feeds"]
+            descriptions += [edge["node"]["photo"]["description"] for edge in page["edges"]]
+            if not page["pageInfo"]["hasNextPage"]:
+                return [page["totalCount"], *descriptions]
+            after = page["pageInfo"]["endCursor"]
+
+    def test_uploads_are_fanned_out_to_followers(self):
+        self.post(self.friend, "hello")
+        photo = Photo.objects.get()
+        self.assertTrue(photo.fan_out)
+        self.assertEqual(list(Feed.objects.order_by("user_id").values_list("user_id", "photo_id", "date_time")),
+                         [(self.readers[i].id, photo.id, photo.date_time) for i in (0, 2)])
+
+    def test_large_accounts_are_merged_on_read(self):
+        for description in ("star 1", "friend 1", "star 2", "friend 2", "star 3"):
+            self.post(self.star if description.startswith("star") else self.friend, description)
+        self.assertFalse(Feed.objects.filter(photo__user=self.star).exists())
+        Photo.objects.filter(description="star 3").update(deleted_at=timezone.now())
+
+        with CaptureQueriesContext(connection) as queries:
+            feed = self.read(self.readers[0])
+        self.assertEqual(feed, [4, "friend 2", "star 2", "friend 1", "star 1"])
+        self.assertFalse(any(query["sql"].startswith(("INSERT", "UPDATE")) for query in queries))
+        self.assertEqual(self.read(self.readers[1]), [2, "star 2", "star 1"])
+        self.assertEqual(self.read(self.friend), [0])
+
+    def test_old_photos_of_large_accounts_are_merged(self):
+        self.post(self.star, "old")
+        Photo.objects.update(date_time=timezone.now() - timedelta(days=365))
+        self.post(self.star, "new")
+        self.assertEqual(self.read(self.readers[0]), [2, "new", "old"])
+
+    def test_pulled_feed_owner_follows_the_filter(self):
+        self.post(self.star, "star 1")
+        query = """
+            query ($filters: FeedFilter) {
+                feeds(first: 5, filters: $filters) { totalCount edges { node { user { username } } } }
+            }
+        """
+        reader = {"user": {"id": relay.to_base64("UserType", self.readers[1].id)}}
+        friend = {"user": {"id": relay.to_base64("UserType", self.friend.id)}}
+        for filters, expected in (
+                (None, ["a"]),
+                ({"AND": reader}, ["b"]),
+                ({**reader, "AND": reader}, ["b"]),
+                ({**reader, "AND": friend}, []),
+                ({**reader, "OR": friend}, []),
+                (friend, [])):
+            with self.subTest(filters=filters):
+                feeds = execute(query, self.readers[0], filters=filters)["feeds"]
+                self.assertEqual([edge["node"]["user"]["username"] for edge in feeds["edges"]], expected)
+                self.assertEqual(feeds["totalCount"], len(expected))
@@ -0,0 +1,256 @@
+import hashlib
+import io
+import random
+import tempfile
+from unittest import mock
+
+from PIL import Image, ImageFile
+
+from django.core.files.base import File
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import FileSystemStorage, Storage, default_storage
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from strawberry import relay
+
+from backend.models import Photo, Profile
+from backend.images import _run_release, _run_variants, delete_files, generate_variants, image_names, release, \
+    schedule_release, schedule_variants, variant_name
+from backend.purge import stored_files
+from backend.tests.utils import create_user, execute, jpeg
+from backend.utils import UPLOAD_CHUNK_SIZE, image_dimensions, save_image
+
+
+class ChunkedReader(io.BytesIO):
+    """Upload content that records the largest read, a read of everything counts as its full size."""
+
+    def __init__(self, content: bytes):
+        super().__init__(content)
+        self.largest_read = 0
+
+    def read(self, size=-1):
+        self.largest_read = max(self.largest_read, len(self.getvalue()) if size is None or size < 0 else size)
+        return super().read(size)
+
+
+class FakeS3Storage(Storage):
+    """In-memory stand-in for S3Boto3Storage, writes arrive as multipart upload parts."""
+
+    part_size = 8 * 1024 * 1024
+
+    def __init__(self):
+        self.objects = {}
+        self.puts = 0
+
+    def _save(self, name, content):
+        self.puts += 1
+        self.objects[name] = b"".join(content.chunks(chunk_size=self.part_size))
+        return name
+
+    def exists(self, name):
+        return name in self.objects
+
+    def delete(self, name):
+        self.objects.pop(name, None)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class SaveImageTest(TestCase):
+    @staticmethod
+    def upload(content: bytes) -> File:
+        return File(ChunkedReader(content), name="photo.JPG")
+
+    def test_identical_content_is_stored_once(self):
+        storage = FileSystemStorage(location=tempfile.mkdtemp())
+        content = random.randbytes(3 * UPLOAD_CHUNK_SIZE + 1)
+        upload = self.upload(content)
+        name = save_image(upload, "images/", storage)
+        self.assertEqual(name, f"images/{hashlib.sha256(content).hexdigest()}.jpg")
+        self.assertLessEqual(upload.file.largest_read, UPLOAD_CHUNK_SIZE)
+        self.assertEqual(save_image(self.upload(content), "images/", storage), name)
+        self.assertEqual(storage.listdir("images/")[1], [name.rsplit("/", 1)[1]])
+        with storage.open(name) as file:
+            self.assertEqual(file.read(), content)
+        self.assertNotEqual(save_image(self.upload(b"other"), "images/", storage), name)
+
+    def test_s3_stand_in(self):
+        storage = FakeS3Storage()
+        content = random.randbytes(FakeS3Storage.part_size + 1)
+        upload = self.upload(content)
+        name = save_image(upload, "images/", storage)
+        self.assertEqual(save_image(self.upload(content), "images/", storage), name)
+        self.assertEqual((storage.puts, storage.objects[name]), (1, content))
+        self.assertLessEqual(upload.file.largest_read, FakeS3Storage.part_size)
+
+    def test_released_content_is_written_again(self):
+        user = User.objects.create_user(username="user", password="password")
+        name = save_image(self.upload(b"image"), "images/")
+        photo = Photo.objects.create(file=name, user=user)
+        release(name, [])
+        self.assertTrue(default_storage.exists(name))
+
+        Photo.objects.filter(pk=photo.pk).delete()
+        release(name, [])
+        self.assertFalse(default_storage.exists(name))
+        self.assertEqual(save_image(self.upload(b"image"), "images/"), name)
+        self.assertTrue(default_storage.exists(name))
+
+    def test_scheduled_release_runs_on_the_io_pool(self):
+        with mock.patch("backend.images.io_pool.submit") as submit, self.captureOnCommitCallbacks(execute=True):
+            schedule_release("images/photo.jpg", [320])
+        submit.assert_called_once_with(_run_release, "images/photo.jpg", [320])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImageDimensionsTest(TestCase):
+    upload = """
+        mutation ($photo: Upload!) {
+            uploadPhoto(input: { photo: $photo, description: "d", location: "l", tags: [] }) {
+                ... on PhotoType { width height ratio }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("user")
+
+    def test_dimensions_are_read_as_displayed(self):
+        photo = execute(self.upload, self.user, photo=SimpleUploadedFile("photo.jpg", jpeg()))["uploadPhoto"]
+        self.assertEqual((photo["width"], photo["height"], photo["ratio"]), (300, 200, 200 / 300))
+        self.assertEqual(image_dimensions(io.BytesIO(jpeg(orientation=6))), (200, 300))
+
+    def test_non_images_are_rejected(self):
+        with self.assertRaisesMessage(AssertionError, "upload is not an image"):
+            execute(self.upload, self.user, photo=SimpleUploadedFile("photo.jpg", b"not an image"))
+        self.assertFalse(Photo.objects.exists())
+
+    def test_backfill(self):
+        default_storage.save("images/legacy.jpg", io.BytesIO(jpeg(orientation=8)))
+        default_storage.save("images/broken.jpg", io.BytesIO(b"not an image"))
+        legacy = Photo.objects.create(file="images/legacy.jpg", user=self.user)
+        broken = Photo.objects.create(file="images/broken.jpg", user=self.user)
+        Photo.objects.update(width=None, height=None)
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command("backfilldimensions", "--batch-size", "1", stdout=out, stderr=err)
+        self.assertIn("done, 1 updated, 1 failed", out.getvalue())
+        self.assertIn(f"photo {broken.id}: upload is not an image", err.getvalue())
+        legacy.refresh_from_db()
+        self.assertEqual((legacy.width, legacy.height, legacy.ratio), (200, 300, 300 / 200))
+
+    def test_header_is_read_without_decoding(self):
+        content = io.BytesIO(jpeg((4000, 3000)))
+        with mock.patch.object(ImageFile.ImageFile, "load", side_effect=AssertionError("pixel data decoded")):
+            self.assertEqual(image_dimensions(content), (4000, 3000))
+
+    def test_client_ratio_is_ignored(self):
+        upload = """
+            mutation ($photo: Upload!) {
+                uploadPhoto(input: { photo: $photo, description: "d", location: "l", tags: [], ratio: 5 }) {
+                    ... on PhotoType { ratio }
+                }
+            }
+        """
+        photo = execute(upload, self.user, photo=SimpleUploadedFile("photo.jpg", jpeg()))["uploadPhoto"]
+        self.assertEqual(photo["ratio"], 200 / 300)
+
+    def test_legacy_rows_are_read_without_storage(self):
+        photo = Photo.objects.create(file="images/missing.jpg", user=self.user, ratio=-1)
+        query = "query ($id: GlobalID!) { photo(id: $id) { ratio } }"
+        with mock.patch.object(default_storage, "open", side_effect=AssertionError("storage read")):
+            result = execute(query, self.user, id=relay.to_base64("PhotoType", photo.id))
+        self.assertEqual(result["photo"]["ratio"], 1.0)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_VARIANT_WIDTHS=[32, 320, 640], IMAGE_VARIANT_ASYNC=False)
+class ImageVariantTest(TestCase):
+    upload = """
+        mutation ($photo: Upload!) {
+            uploadPhoto(input: { photo: $photo, description: "d", location: "l", tags: [] }) {
+                ... on PhotoType { id }
+            }
+        }
+    """
+    urls = """
+        query ($id: GlobalID!) { photo(id: $id) { url small: url(width: 100) large: url(width: 1000) } }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("user")
+
+    def tearDown(self):
+        delete_files([name for name, _ in stored_files("")])
+
+    def test_variants_are_rendered_in_worker_processes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = execute(self.upload, self.user, photo=SimpleUploadedFile("photo.jpg", jpeg((500, 400), "red")))
+        photo = Photo.objects.get()
+        self.assertEqual(photo.variants, [32, 320])
+        with default_storage.open(variant_name(photo.file.name, 320)) as file, Image.open(file) as img:
+            self.assertEqual((img.format, img.size), ("WEBP", (320, 256)))
+
+        urls = execute(self.urls, self.user, id=result["uploadPhoto"]["id"])["photo"]
+        self.assertEqual(urls["small"], default_storage.url(variant_name(photo.file.name, 320)))
+        self.assertEqual(urls["large"], urls["url"])
+        self.assertEqual(urls["url"], default_storage.url(photo.file.name))
+
+    @override_settings(IMAGE_VARIANT_WORKERS=0)
+    def test_rows_sharing_content_reuse_its_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            execute(self.upload, self.user, photo=SimpleUploadedFile("photo.jpg", jpeg((500, 400), "red")))
+        with mock.patch("backend.images.render_and_store") as render, self.captureOnCommitCallbacks(execute=True):
+            execute(self.upload, self.user, photo=SimpleUploadedFile("photo.jpg", jpeg((500, 400), "red")))
+        render.assert_not_called()
+        self.assertEqual([photo.variants for photo in Photo.objects.all()], [[32, 320], [32, 320]])
+
+    def test_replaced_file_is_not_published(self):
+        photo = Photo.objects.create(file=save_image(File(io.BytesIO(jpeg((500, 400), "red")), name="a.jpg"), "images/"),
+                                     user=self.user)
+        def replace_while_rendering(file):
+            Photo.objects.filter(pk=photo.pk).update(file="images/other.jpg")
+            return [32]
+
+        with mock.patch("backend.images.render_and_store", replace_while_rendering):
+            generate_variants(Photo, photo.pk, "file", "variants")
+        self.assertEqual(Photo.objects.get(pk=photo.pk).variants, [])
+
+    @override_settings(IMAGE_VARIANT_WORKERS=0)
+    def test_avatar_variants_replace_the_old_ones(self):
+        upload = """
+            mutation ($avatar: Upload!) {
+                uploadAvatar(input: { avatar: $avatar }) { ... on ProfileType { id } }
+            }
+        """
+        query = "query ($id: GlobalID!) { user(id: $id) { profile { avatar(width: 24) } } }"
+        with self.captureOnCommitCallbacks(execute=True):
+            execute(upload, self.user, avatar=SimpleUploadedFile("a.jpg", jpeg((500, 400), "red")))
+        old = Profile.objects.get(user=self.user)
+        self.assertEqual(old.avatar_variants, [32, 320])
+        user_id = relay.to_base64("UserType", self.user.id)
+        self.assertEqual(execute(query, self.user, id=user_id)["user"]["profile"]["avatar"],
+                         default_storage.url(variant_name(old.avatar.name, 32)))
+
+        with mock.patch("backend.images.io_pool.submit") as submit, self.captureOnCommitCallbacks(execute=True):
+            execute(upload, self.user, avatar=SimpleUploadedFile("b.jpg", jpeg((500, 400), "blue")))
+        self.assertEqual(Profile.objects.get(user=self.user).avatar_variants, [32, 320])
+        submit.assert_called_once_with(_run_release, old.avatar.name, [32, 320])
+        release(old.avatar.name, [32, 320])
+        self.assertFalse(any(default_storage.exists(name) for name in image_names(old.avatar.name, [32, 320])))
+
+    @override_settings(IMAGE_VARIANT_WORKERS=0)
+    def test_failed_rendering_keeps_the_original(self):
+        photo = Photo.objects.create(file=save_image(File(io.BytesIO(b"not an image"), name="a.jpg"), "images/"),
+                                     user=self.user)
+        with self.assertLogs("backend.images", "ERROR"):
+            generate_variants(Photo, photo.pk, "file", "variants")
+        self.assertEqual(Photo.objects.get(pk=photo.pk).variants, [])
+
+    @override_settings(IMAGE_VARIANT_ASYNC=True)
+    def test_background_variants_run_on_the_io_pool(self):
+        photo = Photo.objects.create(file="images/photo.jpg", user=self.user)
+        with mock.patch("backend.images.io_pool.submit") as submit, self.captureOnCommitCallbacks(execute=True):
+            schedule_variants(photo, "file", "variants")
+        submit.assert_called_once_with(_run_variants, Photo, photo.pk, "file", "variants")
@@ -0,0 +1,15 @@
+from django.test import TestCase, override_settings
+
+
+@override_settings(METRICS_TOKEN="token")
+class MetricsTest(TestCase):
+    def test_operations_and_requests_are_exposed(self):
+        self.client.post("/graphql", {"query": "query Background { backgroundImage }"},
+                         content_type="application/json")
+        self.client.post("/graphql", {"query": "query TopTags { topTags { tag } }"}, content_type="application/json")
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+        metrics = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer token").content.decode()
+        self.assertIn('graphql_operation_duration_seconds_count{operation="Background",type="query"}', metrics)
+        self.assertIn('graphql_errors_total{code="1001",operation="TopTags"}', metrics)
+        self.assertIn('http_request_sql_queries_count{route="graphql"}', metrics)
@@ -0,0 +1,134 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from strawberry import relay
+
+from backend.models import Photo, Profile, Follow
+from backend.tests.utils import create_user, execute
+
+
+class FollowTest(TestCase):
+    follow = """
+        mutation ($id: GlobalID!, $follow: Boolean!) {
+            updateFollower(input: { userId: $id, follow: $follow }) { ... on UpdateFollowerResult { user { id } } }
+        }
+    """
+    profile = """
+        query ($id: GlobalID!) {
+            user(id: $id) {
+                profile {
+                    follower { totalCount edges { node { username } } }
+                    following { totalCount edges { node { username } } }
+                }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob = create_user("alice"), create_user("bob")
+
+    def profile_of(self, user: User) -> dict:
+        return execute(self.profile, user, id=relay.to_base64("UserType", user.id))["user"]["profile"]
+
+    def test_follow_and_unfollow(self):
+        bob_id = relay.to_base64("UserType", self.bob.id)
+        execute(self.follow, self.alice, id=bob_id, follow=True)
+        execute(self.follow, self.alice, id=bob_id, follow=True)
+        self.assertEqual(list(Follow.objects.values_list("follower_id", "followee_id")), [(self.alice.id, self.bob.id)])
+        self.assertEqual(self.profile_of(self.bob)["follower"], {"totalCount": 1, "edges": [{"node": {"username": "alice"}}]})
+        self.assertEqual(self.profile_of(self.alice)["following"], {"totalCount": 1, "edges": [{"node": {"username": "bob"}}]})
+        self.assertEqual(self.profile_of(self.alice)["follower"], {"totalCount": 0, "edges": []})
+
+        execute(self.follow, self.alice, id=bob_id, follow=False)
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(self.profile_of(self.bob)["follower"]["totalCount"], 0)
+
+
+class BulkMutationTest(TestCase):
+    likes = """
+        mutation ($changes: [PhotoLikeChange!]!) {
+            updatePhotoLikes(input: { changes: $changes }) {
+                ... on PhotoLikeResult { changed photo { id } }
+            }
+        }
+    """
+    follows = """
+        mutation ($changes: [FollowChange!]!) {
+            updateFollowers(input: { changes: $changes }) {
+                ... on UpdateFollowersResult {
+                    user { profile { following { totalCount } } }
+                    results { changed followUser { username } }
+                }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.accounts = [create_user(f"user{i}") for i in range(5)]
+        cls.photos = Photo.objects.bulk_create([Photo(file="images/photo.png", user=cls.accounts[0]) for _ in range(4)])
+
+    def like_changes(self, photos, like=True):
+        return [{"photoId": relay.to_base64("PhotoType", photo.id), "like": like} for photo in photos]
+
+    def test_likes_take_constant_queries(self):
+        user = self.accounts[1]
+        with CaptureQueriesContext(connection) as two:
+            result = execute(self.likes, user, changes=self.like_changes(self.photos[:2]))["updatePhotoLikes"]
+        self.assertEqual([item["changed"] for item in result], [True, True])
+        with CaptureQueriesContext(connection) as four:
+            result = execute(self.likes, user, changes=self.like_changes(self.photos))["updatePhotoLikes"]
+        self.assertEqual([item["changed"] for item in result], [False, False, True, True])
+        self.assertEqual(len(two), len(four))
+
+        changes = self.like_changes(self.photos[:1], like=False) + [{"photoId": relay.to_base64("PhotoType", 0), "like": True}]
+        result = execute(self.likes, user, changes=changes)["updatePhotoLikes"]
+        self.assertEqual(result[1], {"changed": False, "photo": None})
+        self.assertEqual(list(Photo.objects.order_by("id").values_list("like_count", flat=True)), [0, 1, 1, 1])
+
+    def test_follows(self):
+        follower, *followees = self.accounts
+        changes = [{"userId": relay.to_base64("UserType", user.id), "follow": True} for user in followees]
+        result = execute(self.follows, follower, changes=changes)["updateFollowers"]
+        self.assertEqual(result["user"]["profile"]["following"]["totalCount"], 4)
+        self.assertEqual([item["followUser"]["username"] for item in result["results"]], ["user1", "user2", "user3", "user4"])
+
+        changes[0]["follow"] = False
+        result = execute(self.follows, follower, changes=changes[:2])["updateFollowers"]
+        self.assertEqual([item["changed"] for item in result["results"]], [True, False])
+        self.assertEqual(result["user"]["profile"]["following"]["totalCount"], 3)
+        self.assertEqual(Profile.objects.get(user=followees[0]).follower_count, 0)
+        self.assertEqual(Follow.objects.filter(follower=follower).count(), 3)
+
+    def test_repeated_batches_change_nothing(self):
+        user = self.accounts[1]
+        changes = self.like_changes(self.photos[:3]) + self.like_changes(self.photos[3:], like=False)
+        execute(self.likes, user, changes=changes)
+        result = execute(self.likes, user, changes=changes)["updatePhotoLikes"]
+        self.assertEqual([item["changed"] for item in result], [False] * 4)
+        self.assertEqual(list(Photo.objects.order_by("id").values_list("like_count", flat=True)), [1, 1, 1, 0])
+
+        changes = [{"userId": relay.to_base64("UserType", other.id), "follow": True} for other in self.accounts[2:]]
+        execute(self.follows, user, changes=changes)
+        result = execute(self.follows, user, changes=changes)["updateFollowers"]
+        self.assertEqual([item["changed"] for item in result["results"]], [False] * 3)
+        self.assertEqual(result["user"]["profile"]["following"]["totalCount"], 3)
+        self.assertEqual(list(Profile.objects.order_by("user_id").values_list("follower_count", flat=True)), [0, 0, 1, 1, 1])
+
+    @override_settings(BULK_MUTATION_MAX_ITEMS=2)
+    def test_batch_size_is_limited(self):
+        with self.assertRaisesMessage(AssertionError, "at most 2 changes per request"):
+            execute(self.likes, self.accounts[1], changes=self.like_changes(self.photos))
+        self.assertFalse(Photo.user_like.through.objects.exists())
+
+    def test_invalid_ids_are_rejected(self):
+        likes = self.like_changes(self.photos[:1]) + [{"photoId": relay.to_base64("PhotoType", "x"), "like": True}]
+        follows = [{"userId": relay.to_base64("UserType", user_id), "follow": True}
+                   for user_id in (self.accounts[2].id, "1.5")]
+        for query, changes in ((self.likes, likes), (self.follows, follows)):
+            with self.subTest(query=query), self.assertRaisesMessage(AssertionError, "no node with id"):
+                execute(query, self.accounts[1], changes=changes)
+        self.assertFalse(Photo.user_like.through.objects.exists())
+        self.assertFalse(Follow.objects.exists())
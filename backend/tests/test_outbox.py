@@ -0,0 +1,73 @@
+from algoliasearch_django import get_adapter
+from django.test import TestCase
+from strawberry import relay
+
+from backend.models import Photo, Comment, IndexOutbox
+from backend.outbox import drain
+from backend.tests.utils import create_user, execute
+
+
+class FakeAlgoliaIndex:
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+
+    def save_objects(self, objects):
+        self.calls.append(("save_objects", len(objects)))
+        self.objects.update({o["objectID"]: o for o in objects})
+
+    def partial_update_objects(self, objects):
+        self.calls.append(("partial_update_objects", len(objects)))
+        for o in objects:
+            self.objects.setdefault(o["objectID"], {}).update(o)
+
+    def delete_objects(self, object_ids):
+        self.calls.append(("delete_objects", len(object_ids)))
+        for object_id in object_ids:
+            self.objects.pop(object_id, None)
+
+
+class FakeAlgoliaClient:
+    """In-process stand-in for algoliasearch's SearchClient."""
+
+    def __init__(self):
+        self.indices = {}
+
+    def init_index(self, name):
+        return self.indices.setdefault(name, FakeAlgoliaIndex())
+
+
+class IndexOutboxTest(TestCase):
+    comment = """
+        mutation ($photoId: GlobalID!, $comment: String!) {
+            createComment(input: { photoId: $photoId, comment: $comment }) { ... on CommentType { id } }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("user")
+        cls.photos = Photo.objects.bulk_create([Photo(file="images/photo.png", user=cls.user) for _ in range(2)])
+
+    def test_changes_are_coalesced_into_batches(self):
+        photo_id = relay.to_base64("PhotoType", self.photos[0].id)
+        for text in ("first", "second", "third"):
+            execute(self.comment, self.user, photoId=photo_id, comment=text)
+        Comment.objects.filter(comment="second").delete()
+        self.assertEqual(IndexOutbox.objects.count(), 3)
+
+        client = FakeAlgoliaClient()
+        self.assertEqual(drain(client=client), 3)
+        self.assertFalse(IndexOutbox.objects.exists())
+
+        index = client.indices[get_adapter(Photo).index_name]
+        self.assertEqual(index.calls, [("partial_update_objects", 1)])
+        self.assertEqual(index.objects[self.photos[0].id]["photo_comments"], ["first", "third"])
+
+    def test_delete_supersedes_earlier_changes(self):
+        execute(self.comment, self.user, photoId=relay.to_base64("PhotoType", self.photos[1].id), comment="text")
+        IndexOutbox.objects.create(model="backend.Photo", object_id=self.photos[1].id, operation=IndexOutbox.DELETE)
+
+        client = FakeAlgoliaClient()
+        drain(client=client)
+        self.assertEqual(client.indices[get_adapter(Photo).index_name].calls, [("delete_objects", 1)])
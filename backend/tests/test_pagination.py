@@ -0,0 +1,161 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from strawberry import relay
+
+from backend.models import Photo, Comment, Follow
+from backend.tests.utils import create_user, execute
+
+
+class KeysetPaginationTest(TestCase):
+    photos = """
+        query ($first: Int, $after: String, $last: Int, $before: String) {
+            photos(first: $first, after: $after, last: $last, before: $before) {
+                pageInfo { hasPreviousPage hasNextPage startCursor endCursor }
+                edges { node { description } }
+            }
+        }
+    """
+    comments = """
+        query ($first: Int!) {
+            photos(first: $first) {
+                edges { node { comments(first: 2) { pageInfo { hasNextPage } edges { node { comment } } } } }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("user")
+        start = timezone.now()
+        photos = Photo.objects.bulk_create(Photo(file="images/p.png", user=cls.user, description=str(i)) for i in range(5))
+        comments = Comment.objects.bulk_create(
+            Comment(photo=photo, user=cls.user, comment=f"{photo.description}.{i}") for photo in photos for i in range(3)
+        )
+        for i, photo in enumerate(photos):
+            Photo.objects.filter(pk=photo.pk).update(date_time=start + timedelta(minutes=i))
+        for i, comment in enumerate(comments):
+            # Later comments are older, their order must come from date_time and not from the id
+            Comment.objects.filter(pk=comment.pk).update(date_time=start - timedelta(minutes=i % 3))
+
+    def page(self, **arguments) -> dict:
+        return execute(self.photos, self.user, **arguments)["photos"]
+
+    def descriptions(self, page: dict) -> list:
+        return [edge["node"]["description"] for edge in page["edges"]]
+
+    def test_forward_and_backward_cursors(self):
+        first = self.page(first=2)
+        self.assertEqual(self.descriptions(first), ["4", "3"])
+        self.assertTrue(first["pageInfo"]["hasNextPage"])
+        second = self.page(first=2, after=first["pageInfo"]["endCursor"])
+        self.assertEqual(self.descriptions(second), ["2", "1"])
+        self.assertTrue(second["pageInfo"]["hasPreviousPage"])
+
+        back = self.page(last=2, before=second["pageInfo"]["endCursor"])
+        self.assertEqual(self.descriptions(back), ["3", "2"])
+        self.assertEqual((back["pageInfo"]["hasPreviousPage"], back["pageInfo"]["hasNextPage"]), (True, True))
+        oldest = self.page(last=2)
+        self.assertEqual(self.descriptions(oldest), ["1", "0"])
+        self.assertFalse(oldest["pageInfo"]["hasNextPage"])
+
+    def test_nested_comments_are_paged_together_oldest_first(self):
+        with CaptureQueriesContext(connection) as one:
+            execute(self.comments, self.user, first=1)
+        with CaptureQueriesContext(connection) as five:
+            edges = execute(self.comments, self.user, first=5)["photos"]["edges"]
+        self.assertEqual(len(one), len(five))
+        self.assertEqual([edge["node"]["comment"] for edge in edges[0]["node"]["comments"]["edges"]], ["4.2", "4.1"])
+        self.assertTrue(all(edge["node"]["comments"]["pageInfo"]["hasNextPage"] for edge in edges))
+
+    def test_nested_comment_cursors(self):
+        query = """
+            query ($id: GlobalID!, $after: String) {
+                photo(id: $id) { comments(first: 2, after: $after) { pageInfo { endCursor } edges { node { comment } } } }
+            }
+        """
+        photo_id = relay.to_base64("PhotoType", Photo.objects.get(description="0").pk)
+        first = execute(query, self.user, id=photo_id)["photo"]["comments"]
+        rest = execute(query, self.user, id=photo_id, after=first["pageInfo"]["endCursor"])["photo"]["comments"]
+        comments = [edge["node"]["comment"] for page in (first, rest) for edge in page["edges"]]
+        self.assertEqual(comments, ["0.2", "0.1", "0.0"])
+
+    def test_ties_are_broken_by_id(self):
+        Photo.objects.update(date_time=timezone.now())
+        Comment.objects.filter(photo__description="0").update(date_time=timezone.now())
+        descriptions, after = [], None
+        while True:
+            page = self.page(first=1, after=after)
+            descriptions += self.descriptions(page)
+            if not page["pageInfo"]["hasNextPage"]:
+                break
+            after = page["pageInfo"]["endCursor"]
+        self.assertEqual(descriptions, ["4", "3", "2", "1", "0"])
+        third = self.page(first=3)["pageInfo"]["endCursor"]
+        self.assertEqual(self.descriptions(self.page(last=2, before=third)), ["4", "3"])
+
+        query = """
+            query ($id: GlobalID!, $after: String) {
+                photo(id: $id) { comments(first: 1, after: $after) { pageInfo { endCursor } edges { node { comment } } } }
+            }
+        """
+        photo_id = relay.to_base64("PhotoType", Photo.objects.get(description="0").pk)
+        comments, after = [], None
+        for _ in range(3):
+            page = execute(query, self.user, id=photo_id, after=after)["photo"]["comments"]
+            comments += [edge["node"]["comment"] for edge in page["edges"]]
+            after = page["pageInfo"]["endCursor"]
+        self.assertEqual(comments, ["0.0", "0.1", "0.2"])
+
+    def test_cursor_of_a_deleted_node_still_seeks(self):
+        cursor = self.page(first=2)["pageInfo"]["endCursor"]
+        Photo.objects.filter(description="3").delete()
+        self.assertEqual(self.descriptions(self.page(first=2, after=cursor)), ["2", "1"])
+        self.assertEqual(self.descriptions(self.page(last=2, before=cursor)), ["4"])
+
+    def test_invalid_cursors_are_rejected(self):
+        for cursor in (relay.to_base64("arrayconnection", 2), relay.to_base64("keyset", "yesterday|1"),
+                       relay.to_base64("keyset", "2024-01-01T00:00:00|x"), "not a cursor"):
+            with self.subTest(cursor=cursor), self.assertRaisesMessage(AssertionError, f"Invalid cursor '{cursor}'."):
+                self.page(first=2, after=cursor)
+
+
+class ViewerRelationTest(TestCase):
+    query = """
+        query ($first: Int!) {
+            photos(first: $first) {
+                edges { node { isLike user { profile { isFollowing } } } }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = create_user("viewer")
+        owners = [create_user(f"owner{i}") for i in range(10)]
+        photos = Photo.objects.bulk_create([Photo(file="images/photo.png", user=user) for user in owners])
+        for photo in photos[::2]:
+            photo.user_like.add(cls.viewer)
+        for owner in owners[::3]:
+            Follow.objects.create(follower=cls.viewer, followee=owner)
+
+    def count_queries(self, first: int) -> int:
+        with CaptureQueriesContext(connection) as context:
+            data = execute(self.query, self.viewer, first=first)
+        self.assertEqual(len(data["photos"]["edges"]), first)
+        return len(context.captured_queries)
+
+    def test_query_count_is_independent_of_page_size(self):
+        self.assertEqual(self.count_queries(2), self.count_queries(10))
+
+    def test_viewer_relations(self):
+        edges = execute(self.query, self.viewer, first=10)["photos"]["edges"]
+        liked = {photo.id for photo in Photo.objects.filter(user_like=self.viewer)}
+        followed = set(Follow.objects.filter(follower=self.viewer).values_list("followee_id", flat=True))
+        photos = Photo.objects.order_by("-date_time", "-pk")
+        self.assertEqual([e["node"]["isLike"] for e in edges], [p.id in liked for p in photos])
+        self.assertEqual([e["node"]["user"]["profile"]["isFollowing"] for e in edges],
+                         [p.user_id in followed for p in photos])
@@ -0,0 +1,86 @@
+import time
+from unittest import mock
+
+import psycopg2
+
+from django.db import connection
+from django.test import TestCase
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+
+from backend.postgresql.base import ConnectionPool, DatabaseWrapper
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.in_transaction = False
+        self.pings = 0
+
+    def get_transaction_status(self):
+        return TRANSACTION_STATUS_INTRANS if self.in_transaction else TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.in_transaction = False
+
+    def cursor(self):
+        self.pings += 1
+        return mock.MagicMock()
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTest(TestCase):
+    def setUp(self):
+        self.pool = ConnectionPool("test", size=2, timeout=0.1, max_age=600, check_after=30)
+
+    def test_released_connections_are_reused(self):
+        first = self.pool.checkout(FakeConnection)
+        first.in_transaction = True
+        self.pool.release(first)
+        self.assertIs(self.pool.checkout(FakeConnection), first)
+        self.assertFalse(first.in_transaction)
+
+    def test_checkout_waits_for_a_free_connection(self):
+        self.pool.checkout(FakeConnection)
+        self.pool.checkout(FakeConnection)
+        with self.assertRaises(psycopg2.OperationalError):
+            self.pool.checkout(FakeConnection)
+
+    def test_stale_connections_are_replaced(self):
+        closed = self.pool.checkout(FakeConnection)
+        self.pool.release(closed)
+        closed.closed = 1
+        self.assertIsNot(self.pool.checkout(FakeConnection), closed)
+
+        idle = self.pool.checkout(FakeConnection)
+        self.pool.release(idle)
+        self.pool.idle[-1] = (idle, time.monotonic(), time.monotonic() - 60)
+        self.assertIs(self.pool.checkout(FakeConnection), idle)
+        self.assertEqual(idle.pings, 1)
+
+    def test_connections_closed_in_a_transaction_are_discarded(self):
+        connection = self.pool.checkout(FakeConnection)
+        self.pool.release(connection, reusable=False)
+        self.assertTrue(connection.closed)
+        self.assertFalse(self.pool.idle)
+
+    def test_idle_connections_are_closed(self):
+        idle, busy = self.pool.checkout(FakeConnection), self.pool.checkout(FakeConnection)
+        self.pool.release(idle)
+        self.pool.close()
+        self.assertTrue(idle.closed)
+        self.assertFalse(busy.closed or self.pool.idle)
+        self.pool.release(busy)
+        self.assertIs(self.pool.checkout(FakeConnection), busy)
+
+    def test_size_zero_bypasses_the_pool(self):
+        wrapper = DatabaseWrapper({**connection.settings_dict, "POOL": {"SIZE": 0}}, alias="unpooled")
+        raw = FakeConnection()
+        with mock.patch("django.db.backends.postgresql.base.DatabaseWrapper.get_new_connection", return_value=raw), \
+                mock.patch("backend.postgresql.base.get_pool") as get_pool:
+            self.assertIs(wrapper.get_new_connection({}), raw)
+            wrapper.connection = raw
+            wrapper._close()
+        get_pool.assert_not_called()
+        self.assertTrue(raw.closed)
@@ -0,0 +1,87 @@
+import io
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from strawberry import relay
+
+from backend.models import Photo, Profile, Comment, Feed
+from backend.images import delete_files
+from backend.purge import _run_purge, orphans, purge_photo, stored_files
+from backend.tests.utils import create_user, execute
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), PHOTO_PURGE_BATCH_SIZE=1, PHOTO_PURGE_RETRY_DELAY=0,
+                   PHOTO_PURGE_ASYNC=False)
+class PhotoPurgeTest(TestCase):
+    delete = """
+        mutation ($id: GlobalID!) { deletePhoto(input: { id: $id }) { ... on PhotoType { id } } }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.friend = create_user("user", photo_count=1), create_user("friend")
+
+    def setUp(self):
+        self.photo = Photo.objects.create(file="images/photo.jpg", variants=[320], user=self.user)
+        for name in ("images/photo.jpg", "images/photo_320w.webp"):
+            default_storage.save(name, io.BytesIO(b"image"))
+        self.photo.user_like.add(self.user, self.friend)
+        Comment.objects.create(photo=self.photo, user=self.friend, comment="nice")
+        Feed.objects.bulk_create([Feed(user=user, photo=self.photo) for user in (self.user, self.friend)])
+
+    def tearDown(self):
+        delete_files([name for name, _ in stored_files("")])
+
+    def test_deleted_photo_is_hidden_then_purged(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            execute(self.delete, self.user, id=relay.to_base64("PhotoType", self.photo.id))
+        self.assertFalse(Photo.objects.filter(pk=self.photo.pk).exists())
+        self.assertEqual(Profile.objects.get(user=self.user).photo_count, 0)
+        feeds = execute("query ($id: GlobalID!) { feeds(filters: { user: { id: $id } }) { edges { node { id } } } }",
+                        self.friend, id=relay.to_base64("UserType", self.friend.id))
+        self.assertEqual(feeds["feeds"]["edges"], [])
+
+        for callback in callbacks:
+            callback()
+        self.assertFalse(Photo.all_objects.filter(pk=self.photo.pk).exists())
+        self.assertFalse(Feed.objects.exists() or Comment.objects.exists() or Photo.user_like.through.objects.exists())
+        self.assertFalse(default_storage.exists("images/photo.jpg") or default_storage.exists("images/photo_320w.webp"))
+
+    @override_settings(PHOTO_PURGE_ASYNC=True)
+    def test_background_purge_runs_on_the_executor(self):
+        with mock.patch("backend.purge.executor.submit") as submit, self.captureOnCommitCallbacks(execute=True):
+            execute(self.delete, self.user, id=relay.to_base64("PhotoType", self.photo.id))
+        submit.assert_called_once_with(_run_purge, self.photo.id)
+
+    def test_shared_image_is_kept(self):
+        Photo.objects.create(file="images/photo.jpg", user=self.friend)
+        Photo.objects.filter(pk=self.photo.pk).update(deleted_at=timezone.now())
+        self.assertTrue(purge_photo(self.photo.pk))
+        self.assertTrue(default_storage.exists("images/photo.jpg"))
+
+    def test_failed_storage_delete_is_retried(self):
+        self.assertFalse(purge_photo(self.photo.pk))
+        Photo.objects.filter(pk=self.photo.pk).update(deleted_at=timezone.now())
+        with mock.patch("backend.purge.delete_files", side_effect=[OSError("throttled"), None]) as delete:
+            self.assertTrue(purge_photo(self.photo.pk))
+        self.assertEqual(delete.call_count, 2)
+
+    @override_settings(CRON_SECRET="secret", PHOTO_PURGE_MIN_AGE=0)
+    def test_cron_purge(self):
+        Photo.objects.filter(pk=self.photo.pk).update(deleted_at=timezone.now())
+        self.assertEqual(self.client.get("/cron/purge", HTTP_AUTHORIZATION="Bearer other").status_code, 404)
+        self.assertTrue(Photo.all_objects.filter(pk=self.photo.pk).exists())
+        response = self.client.get("/cron/purge", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.json(), {"purged": 1})
+        self.assertFalse(Photo.all_objects.filter(pk=self.photo.pk).exists())
+
+    def test_orphans(self):
+        for name in ("images/gone.jpg", "images/gone_320w.webp", "uploads/photo/1/abandoned.jpg"):
+            default_storage.save(name, io.BytesIO(b"image"))
+        self.assertEqual(sorted(orphans(timedelta(0))),
+                         ["images/gone.jpg", "images/gone_320w.webp", "uploads/photo/1/abandoned.jpg"])
+        self.assertEqual(orphans(timedelta(hours=1)), [])
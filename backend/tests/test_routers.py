@@ -0,0 +1,56 @@
+import random
+from unittest import mock
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.test import TestCase, override_settings
+
+from backend.models import Photo
+from backend.routers import ReplicaRouter, read_replicas
+from backend.tests.utils import create_user, execute
+
+
+# The primary stands in for the replica, random.choice is only called when a read is sent to a replica
+@override_settings(DATABASE_REPLICAS=[DEFAULT_DB_ALIAS], SHARED_CACHE=True)
+class ReplicaRoutingTest(TestCase):
+    query = "{ photos(first: 5) { edges { node { id } } } }"
+    mutation = 'mutation { updateProfile(input: {firstName: "a", lastName: "b", description: "c"}) { __typename } }'
+
+    def setUp(self):
+        cache.clear()
+        self.user, self.other = create_user("user"), create_user("other")
+        Photo.objects.create(file="images/photo.png", user=self.other)
+
+    def replica_reads(self, query: str, user: User) -> int:
+        with mock.patch("backend.routers.random.choice", wraps=random.choice) as choice:
+            execute(query, user)
+        return choice.call_count
+
+    def test_queries_read_from_replicas(self):
+        self.assertGreater(self.replica_reads(self.query, self.user), 0)
+
+    def test_mutations_stick_their_user_to_the_primary(self):
+        self.assertEqual(self.replica_reads(self.mutation, self.user), 0)
+        self.assertEqual(self.replica_reads(self.query, self.user), 0)
+        self.assertGreater(self.replica_reads(self.query, self.other), 0)
+
+    @override_settings(DATABASE_REPLICAS=["replica1"])
+    def test_query_reads_are_routed_to_the_replica_alias(self):
+        self.assertEqual(Photo.objects.all().db, DEFAULT_DB_ALIAS)
+        token = read_replicas.set(True)
+        try:
+            self.assertEqual(Photo.objects.all().db, "replica1")
+            self.assertEqual(Session.objects.all().db, DEFAULT_DB_ALIAS)
+        finally:
+            read_replicas.reset(token)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_replicas_need_the_shared_cache(self):
+        self.assertEqual(self.replica_reads(self.query, self.user), 0)
+
+    def test_writes_and_migrations_use_the_primary(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_write(Photo), DEFAULT_DB_ALIAS)
+        self.assertFalse(router.allow_migrate("replica1", "backend"))
@@ -0,0 +1,78 @@
+import io
+import tempfile
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+
+from backend.models import Photo
+from backend.tests.utils import create_user, execute, jpeg
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), FEED_FANOUT_ASYNC=False, IMAGE_VARIANT_ASYNC=False,
+                   IMAGE_VARIANT_WORKERS=0)
+class DirectUploadTest(TestCase):
+    create = """
+        mutation ($kind: UploadKind!) {
+            createUpload(input: { kind: $kind, contentType: "image/jpeg" }) {
+                ... on UploadTarget { key url fields { name value } }
+            }
+        }
+    """
+    finalize = """
+        mutation ($key: String!) {
+            finalizePhotoUpload(input: { key: $key, description: "d", location: "l", tags: ["tag", "other", "tag"] }) {
+                ... on PhotoType { width height ratio }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("user")
+
+    def upload(self, kind: str, content: bytes, user: User = None) -> str:
+        target = execute(self.create, user or self.user, kind=kind)["createUpload"]
+        form = {field["name"]: field["value"] for field in target["fields"]}
+        response = self.client.post(target["url"], {**form, "file": io.BytesIO(content)})
+        self.assertEqual(response.status_code, 204)
+        return target["key"]
+
+    def test_finalize_creates_photo(self):
+        key = self.upload("PHOTO", jpeg())
+        with self.captureOnCommitCallbacks() as callbacks:
+            photo = execute(self.finalize, self.user, key=key)["finalizePhotoUpload"]
+        self.assertEqual((photo["width"], photo["height"], photo["ratio"]), (300, 200, 200 / 300))
+        self.assertEqual(Photo.objects.get(user=self.user).file.name, "images/" + key.rsplit("/", 1)[1])
+        # The upload is kept until the photo is committed
+        self.assertTrue(default_storage.exists(key))
+        for callback in callbacks:
+            callback()
+        self.assertFalse(default_storage.exists(key))
+        tags = Photo.objects.get(user=self.user).tags.order_by("tag")
+        self.assertEqual([(tag.tag, tag.photo_count) for tag in tags], [("other", 1), ("tag", 1)])
+
+    def test_failed_finalize_can_be_retried(self):
+        key = self.upload("PHOTO", jpeg())
+        with mock.patch("backend.mutations.create_photo", side_effect=IntegrityError("failed")):
+            with self.captureOnCommitCallbacks(execute=True), self.assertRaises(AssertionError):
+                execute(self.finalize, self.user, key=key)
+        self.assertTrue(default_storage.exists(key))
+        with self.captureOnCommitCallbacks(execute=True):
+            execute(self.finalize, self.user, key=key)
+        self.assertFalse(default_storage.exists(key))
+
+    def test_finalize_rejects_invalid_uploads(self):
+        other = User.objects.create_user(username="other", password="password")
+        keys = [
+            self.upload("PHOTO", b"not an image"),
+            self.upload("AVATAR", jpeg()),
+            self.upload("PHOTO", jpeg(), user=other),
+            "uploads/photo/missing.jpg",
+        ]
+        for key in keys:
+            with self.assertRaises(AssertionError):
+                execute(self.finalize, self.user, key=key)
+        self.assertFalse(Photo.objects.exists())
@@ -0,0 +1,81 @@
+import hashlib
+import json
+from importlib import import_module
+
+from django.conf import settings
+from django.core.cache import caches
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import AsyncRequestFactory, TestCase
+
+from backend.errors import ERR_NOT_LOGIN
+from backend.models import Photo
+from backend.schema import schema
+from backend.tests.utils import create_user
+from backend.views import AsyncPersistedQueryView
+
+
+class PersistedQueryTest(TestCase):
+    query = "{ backgroundImage }"
+    persisted = {"persistedQuery": {"version": 1, "sha256Hash": hashlib.sha256(query.encode()).hexdigest()}}
+
+    def setUp(self):
+        caches[settings.PERSISTED_QUERY_CACHE].clear()
+
+    def get(self, persisted=persisted, **headers):
+        return self.client.get("/graphql", {"extensions": json.dumps(persisted)}, **headers)
+
+    def register(self, query: str) -> dict:
+        persisted = {"persistedQuery": {"version": 1, "sha256Hash": hashlib.sha256(query.encode()).hexdigest()}}
+        response = self.client.post("/graphql", {"query": query, "extensions": persisted},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        return persisted
+
+    def test_register_on_miss(self):
+        self.assertEqual(self.get().json()["errors"][0]["extensions"]["code"], "PERSISTED_QUERY_NOT_FOUND")
+        self.register(self.query)
+
+        response = self.get()
+        self.assertIn("backgroundImage", response.json()["data"])
+        self.assertEqual(set(response["Cache-Control"].split(", ")), {"public", "max-age=60", "s-maxage=60"})
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+    def test_viewer_dependent_response_is_private(self):
+        self.client.force_login(User.objects.create_user(username="user", password="password"))
+        persisted = self.register("{ topTags { tag } }")
+        self.assertEqual(set(self.get(persisted)["Cache-Control"].split(", ")), {"private", "no-cache"})
+
+    def test_get_requires_persisted_query(self):
+        self.assertEqual(self.client.get("/graphql", {"query": self.query}).status_code, 400)
+
+
+class AsyncViewTest(TestCase):
+    view = staticmethod(AsyncPersistedQueryView.as_view(schema=schema))
+
+    def setUp(self):
+        self.user = create_user("user")
+        self.photos = Photo.objects.bulk_create(Photo(file="images/p.png", user=self.user) for _ in range(3))
+        self.client.force_login(self.user)
+        self.session_key = self.client.session.session_key
+
+    async def post(self, query: str, **variables) -> dict:
+        request = AsyncRequestFactory().post("/graphql", {"query": query, "variables": variables},
+                                             content_type="application/json")
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore(self.session_key)
+        request.user = AnonymousUser()
+        response = await self.view(request)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    async def test_keyset_pages_are_fetched_async(self):
+        query = "query($after: String) { photos(first: 2, after: $after) { pageInfo { hasNextPage endCursor } " \
+                "edges { node { id isLike user { username } comments(first: 1) { edges { node { id } } } } } } topTags { tag } }"
+        first = (await self.post(query))["data"]["photos"]
+        second = (await self.post(query, after=first["pageInfo"]["endCursor"]))["data"]["photos"]
+        self.assertEqual(len(first["edges"]) + len(second["edges"]), 3)
+        self.assertFalse(second["pageInfo"]["hasNextPage"])
+
+    async def test_anonymous_is_rejected(self):
+        self.session_key = None
+        result = await self.post("{ topTags { tag } }")
+        self.assertEqual(result["errors"][0]["extensions"]["code"], ERR_NOT_LOGIN["code"])
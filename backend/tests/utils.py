@@ -0,0 +1,41 @@
+import io
+from importlib import import_module
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import RequestFactory
+from strawberry.django.views import StrawberryDjangoContext
+
+from backend.models import Profile
+from backend.schema import schema
+
+
+def execute(query: str, user: User, **variables):
+    request = RequestFactory().post("/graphql")
+    request.user = user
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+    context = StrawberryDjangoContext(request=request, response=HttpResponse())
+    result = schema.execute_sync(query, variable_values=variables, context_value=context)
+    assert result.errors is None, result.errors
+    return result.data
+
+
+def create_user(username: str, **profile) -> User:
+    """A user with the password "password" and a profile with the given counters."""
+    user = User.objects.create_user(username=username, password="password")
+    Profile.objects.create(user=user, **profile)
+    return user
+
+
+def jpeg(size: Tuple[int, int] = (300, 200), color: str = "black", orientation: Optional[int] = None) -> bytes:
+    """A JPEG image, with an EXIF orientation when one is given."""
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    content = io.BytesIO()
+    Image.new("RGB", size, color).save(content, "JPEG", exif=exif)
+    return content.getvalue()
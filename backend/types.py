@@ -1,4 +1,4 @@
-from typing import cast, Type, Iterable
+from typing import cast, Type, Iterable, Optional
 
 import strawberry.django
 import strawberry_django
@@ -8,10 +8,12 @@ from strawberry import auto
 from strawberry import relay
 from strawberry.types import Info
 from strawberry import Parent
-from strawberry_django.relay import ListConnectionWithTotalCount
 
 from . import models
+from .images import variant_url
+from .loaders import get_viewer_loaders
 from .models import Photo
+from .pagination import KeysetConnection, CountedConnection, CounterExtension
 
 UserModel = cast(Type[AbstractUser], get_user_model())
 
@@ -36,18 +38,38 @@ class PhotoFiler:
 class ProfileType(relay.Node):
     user: "UserType"
     description: auto
-    follower: ListConnectionWithTotalCount["UserType"] = strawberry_django.connection()
-    following: ListConnectionWithTotalCount["UserType"] = strawberry_django.connection()
 
-    @strawberry_django.field(name="avatar", only=["avatar"])
+    @strawberry_django.connection(
+        CountedConnection["UserType"],
+        filters=UserFilter,
+        only=["user", "follower_count"],
+        extensions=[CounterExtension("follower_count")],
+    )
     @staticmethod
-    def avatar_url(parent: Parent[models.Profile]) -> str:
-        return parent.avatar_url
+    def follower(parent: Parent[models.Profile]) -> Iterable["UserType"]:
+        return UserModel.objects.filter(follows__followee_id=parent.user_id)
+
+    @strawberry_django.connection(
+        CountedConnection["UserType"],
+        filters=UserFilter,
+        only=["user", "following_count"],
+        extensions=[CounterExtension("following_count")],
+    )
+    @staticmethod
+    def following(parent: Parent[models.Profile]) -> Iterable["UserType"]:
+        return UserModel.objects.filter(followed_by__follower_id=parent.user_id)
+
+    @strawberry_django.field(name="avatar", only=["avatar", "avatar_variants"])
+    @staticmethod
+    def avatar_url(parent: Parent[models.Profile], width: Optional[int] = None) -> str:
+        if parent.avatar.name == "":
+            return ""
+        return variant_url(parent.avatar, parent.avatar_variants, width)
 
-    @strawberry_django.field(prefetch_related=["follower"])
+    @strawberry_django.field
     @staticmethod
     def is_following(parent: Parent[models.Profile], info: Info) -> bool:
-        return parent.follower.filter(pk=info.context.request.user.id).exists()
+        return get_viewer_loaders(info).load("is_following", parent)
 
 
 @strawberry_django.type(models.PhotoTag)
@@ -59,28 +81,33 @@ class PhotoTagType(relay.Node):
 class PhotoType(relay.Node):
     file: auto
     ratio: auto
+    width: auto
+    height: auto
     date_time: auto
     user: "UserType"
-    user_like: ListConnectionWithTotalCount["UserType"] = strawberry_django.connection()
+    user_like: CountedConnection["UserType"] = strawberry_django.connection(
+        only=["like_count"], extensions=[CounterExtension("like_count")])
     description: auto
-    tags: ListConnectionWithTotalCount[PhotoTagType] = strawberry_django.connection()
+    tags: CountedConnection[PhotoTagType] = strawberry_django.connection()
     location: auto
-    comments: "ListConnectionWithTotalCount[CommentType]" = strawberry_django.connection(name="comments")
+    comments: "KeysetConnection[CommentType]" = strawberry_django.connection(
+        name="comments", only=["comment_count"], extensions=[CounterExtension("comment_count")])
 
-    @strawberry_django.field(only=["file"])
+    @strawberry_django.field(only=["file", "variants"])
     @staticmethod
-    def url(parent: Parent[models.Photo]) -> str:
-        return parent.file.url
+    def url(parent: Parent[models.Photo], width: Optional[int] = None) -> str:
+        return variant_url(parent.file, parent.variants, width)
 
-    @strawberry_django.field(prefetch_related=["user_like"])
+    @strawberry_django.field
     @staticmethod
     def is_like(parent: Parent[models.Photo], info: Info) -> bool:
-        return parent.user_like.filter(pk=info.context.request.user.id).exists()
+        return get_viewer_loaders(info).load("is_like", parent)
 
-    @strawberry_django.field(only=["file", "ratio"])
+    @strawberry_django.field(only=["ratio"])
     @staticmethod
     def ratio(parent: Parent[models.Photo]) -> float:
-        return parent.ratio if parent.ratio != -1 else parent.file.height / parent.file.width
+        # Legacy rows keep -1 until `manage.py backfilldimensions` runs, show them as squares meanwhile
+        return parent.ratio if parent.ratio != -1 else 1.0
 
 
 @strawberry_django.type(UserModel, filters=UserFilter, select_related="profile")
@@ -91,7 +118,14 @@ class UserType(relay.Node):
     email: auto
     profile: "ProfileType"
 
-    @strawberry_django.connection(ListConnectionWithTotalCount[PhotoType], filters=PhotoFiler, order=PhotoOrder)
+    @strawberry_django.connection(
+        KeysetConnection[PhotoType],
+        filters=PhotoFiler,
+        order=PhotoOrder,
+        only=["profile__photo_count"],
+        select_related=["profile"],
+        extensions=[CounterExtension("profile.photo_count")],
+    )
     @staticmethod
     def photos(parent: Parent[UserModel]) -> Iterable["PhotoType"]:
         return Photo.objects.filter(user_id=parent.id)
@@ -0,0 +1,112 @@
+import io
+import uuid
+from typing import Dict, Tuple
+
+from PIL import Image
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import reverse
+from graphql import GraphQLError
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from backend.errors import ERR_INVALID_UPLOAD
+from backend.utils import image_dimensions
+
+# Content types accepted for direct uploads and the Pillow format each must decode as
+CONTENT_TYPES = {
+    "image/jpeg": (".jpg", "JPEG"),
+    "image/png": (".png", "PNG"),
+    "image/webp": (".webp", "WEBP"),
+}
+
+# Bytes read from the start of an upload to validate it, enough for the header and EXIF of any photo
+HEAD_SIZE = 256 * 1024
+
+SIGNING_SALT = "backend.uploads"
+
+
+def upload_prefix(kind: str, user_id: int) -> str:
+    return f"uploads/{kind}/{user_id}/"
+
+
+def upload_key(kind: str, user_id: int, content_type: str) -> str:
+    if content_type not in CONTENT_TYPES:
+        raise GraphQLError(message=f"unsupported content type {content_type}", extensions=ERR_INVALID_UPLOAD)
+    return f"{upload_prefix(kind, user_id)}{uuid.uuid4().hex}{CONTENT_TYPES[content_type][0]}"
+
+
+def presign(key: str, content_type: str) -> Tuple[str, Dict[str, str]]:
+    """URL and form fields of a POST that uploads one object to ``key`` without going through Django.
+
+    On S3 this is a presigned POST whose policy pins the key, the content type and the size. Other
+    storages get a signed form for the ``direct_upload`` view with the same constraints.
+    """
+    if isinstance(default_storage, S3Boto3Storage):
+        post = default_storage.connection.meta.client.generate_presigned_post(
+            Bucket=default_storage.bucket_name,
+            Key=default_storage._normalize_name(key),
+            Fields={"Content-Type": content_type},
+            Conditions=[
+                {"Content-Type": content_type},
+                ["content-length-range", 1, settings.UPLOAD_MAX_SIZE],
+            ],
+            ExpiresIn=settings.UPLOAD_URL_EXPIRES,
+        )
+        return post["url"], post["fields"]
+
+    signature = signing.dumps({"key": key, "type": content_type}, salt=SIGNING_SALT)
+    return reverse("backend:direct_upload"), {"key": key, "Content-Type": content_type, "signature": signature}
+
+
+def check_signature(signature: str) -> Dict[str, str]:
+    return signing.loads(signature, salt=SIGNING_SALT, max_age=settings.UPLOAD_URL_EXPIRES)
+
+
+def read_head(key: str) -> bytes:
+    if isinstance(default_storage, S3Boto3Storage):
+        obj = default_storage.bucket.Object(default_storage._normalize_name(key))
+        return obj.get(Range=f"bytes=0-{HEAD_SIZE - 1}")["Body"].read()
+    with default_storage.open(key, "rb") as file:
+        return file.read(HEAD_SIZE)
+
+
+def validate_upload(key: str, kind: str, user_id: int) -> Tuple[int, int]:
+    """Check that ``key`` is a finished upload of the user and a supported image, returns its dimensions."""
+    if not key.startswith(upload_prefix(kind, user_id)) or ".." in key or not default_storage.exists(key):
+        raise GraphQLError(message="upload not found", extensions=ERR_INVALID_UPLOAD)
+    if default_storage.size(key) > settings.UPLOAD_MAX_SIZE:
+        raise GraphQLError(message="upload is too large", extensions=ERR_INVALID_UPLOAD)
+
+    head = io.BytesIO(read_head(key))
+    try:
+        with Image.open(head) as img:
+            image_format = img.format
+        width, height = image_dimensions(head)
+    except Exception:
+        raise GraphQLError(message="upload is not an image", extensions=ERR_INVALID_UPLOAD)
+
+    extension = key[key.rindex("."):]
+    if (extension, image_format) not in CONTENT_TYPES.values():
+        raise GraphQLError(message=f"upload is not a {extension} image", extensions=ERR_INVALID_UPLOAD)
+    if width * height > Image.MAX_IMAGE_PIXELS:
+        raise GraphQLError(message="image is too large", extensions=ERR_INVALID_UPLOAD)
+    return width, height
+
+
+def promote(key: str, prefix: str) -> str:
+    """Copy a validated upload out of ``uploads/`` to ``prefix``, server side on S3, returns the new name.
+
+    The upload is deleted once the transaction commits, a rolled back finalize can be retried and
+    leaves its copy to the orphan sweep of ``purgephotos``.
+    """
+    name = prefix + key.rsplit("/", 1)[1]
+    if isinstance(default_storage, S3Boto3Storage):
+        source = {"Bucket": default_storage.bucket_name, "Key": default_storage._normalize_name(key)}
+        default_storage.bucket.Object(default_storage._normalize_name(name)).copy_from(CopySource=source)
+    else:
+        with default_storage.open(key, "rb") as file:
+            name = default_storage.save(name, file)
+    transaction.on_commit(lambda: default_storage.delete(key))
+    return name
@@ -1,13 +1,16 @@
 import hashlib
+import os
 import secrets
 
-from django.core.files.storage import FileSystemStorage
+from PIL import Image, UnidentifiedImageError
+from django.core.files.storage import default_storage
+from django.db import connection
 from strawberry import relay
 from graphql import GraphQLError
 
-from backend.errors import ERR_NOT_LOGIN
+from backend.errors import ERR_INVALID_UPLOAD, ERR_NOT_LOGIN
 
-fs = FileSystemStorage()
+UPLOAD_CHUNK_SIZE = 64 * 1024
 
 
 def hash_password(password: str) -> (str, str):
@@ -35,11 +38,50 @@ def to_model_id(global_id: str) -> str:
     return relay.from_base64(global_id)[1]
 
 
-def save_image(img) -> str:
-    img_hash = hashlib.md5(img.read()).hexdigest()
-    suffix = img.name[img.name.rindex(".") + 1:]
-    filename = f'{img_hash}.{suffix}'
-    if not fs.exists(filename):
+def lock_name(name: str):
+    """Serialize the writers and deleters of a stored name until the transaction ends.
+
+    Uses a PostgreSQL advisory lock, other databases serialize writing transactions already.
+    """
+    if connection.vendor == "postgresql":
+        key = int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], "big", signed=True)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [key])
+
+
+def save_image(img, prefix: str, storage=default_storage) -> str:
+    """Store an upload under the SHA-256 of its content and return the storage name.
+
+    The upload is hashed chunk by chunk and streamed to the storage (multipart for S3), so memory
+    stays bounded whatever the file size. Content already stored is not written again. Call it in
+    the transaction saving the row that references the name: the name stays locked until then, so
+    ``release`` cannot delete the content between the check and the commit.
+    """
+    sha256 = hashlib.sha256()
+    for chunk in img.chunks(chunk_size=UPLOAD_CHUNK_SIZE):
+        sha256.update(chunk)
+    suffix = os.path.splitext(img.name)[1].lower()
+    filename = f'{prefix}{sha256.hexdigest()}{suffix}'
+    lock_name(filename)
+    if not storage.exists(filename):
         img.seek(0)
-        fs.save(filename, img)
+        filename = storage.save(filename, img)
     return filename
+
+
+# EXIF orientations that rotate the image by 90 or 270 degrees
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def image_dimensions(file) -> (int, int):
+    """Width and height as displayed, read from the image header without decoding the pixel data."""
+    file.seek(0)
+    try:
+        with Image.open(file) as img:
+            width, height = img.size
+            if img.getexif().get(0x0112) in TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+    except UnidentifiedImageError:
+        raise GraphQLError(message="upload is not an image", extensions=ERR_INVALID_UPLOAD)
+    file.seek(0)
+    return width, height
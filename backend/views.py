@@ -0,0 +1,148 @@
+from datetime import timedelta
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, Http404
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from prometheus_client import CONTENT_TYPE_LATEST
+from strawberry.django.views import AsyncGraphQLView, GraphQLView
+from strawberry.http import GraphQLRequestData
+
+from backend.metrics import collect
+from backend.persisted import PersistedQueryNotFound, resolve_query, cache_response
+from backend.purge import purge_deleted
+from backend.uploads import check_signature
+
+
+class PersistedQueryMixin:
+    """Automatic persisted queries protocol, persisted queries can be sent by GET."""
+
+    allow_queries_via_get = True
+
+    def persisted_query(self, data: dict) -> Optional[dict]:
+        extensions = data.get("extensions") or {}
+        if isinstance(extensions, str):
+            extensions = self.parse_json(extensions)
+        return extensions.get("persistedQuery")
+
+    @staticmethod
+    def request_data(data: dict, query: Optional[str]) -> GraphQLRequestData:
+        return GraphQLRequestData(
+            query=query,
+            variables=data.get("variables"),
+            operation_name=data.get("operationName"),
+        )
+
+    @staticmethod
+    def not_found() -> HttpResponse:
+        response = JsonResponse({"errors": [
+            {"message": "PersistedQueryNotFound", "extensions": {"code": "PERSISTED_QUERY_NOT_FOUND"}}
+        ]})
+        patch_cache_control(response, no_store=True)
+        return response
+
+    @staticmethod
+    def cache(request, response: HttpResponse) -> HttpResponse:
+        # Only set once an operation was executed, GraphiQL and rejected requests are left alone
+        if request.method == "GET" and hasattr(request, "graphql_succeeded"):
+            return cache_response(request, response, request.graphql_succeeded)
+        return response
+
+
+class PersistedQueryView(PersistedQueryMixin, GraphQLView):
+    def parse_http_body(self, request) -> GraphQLRequestData:
+        if "application/json" in (request.content_type or ""):
+            data = self.parse_json(request.body)
+        elif request.method == "GET":
+            data = self.parse_query_params(request.query_params)
+        else:
+            # Multipart uploads are never persisted
+            return super().parse_http_body(request)
+        return self.request_data(data, resolve_query(data.get("query"), self.persisted_query(data), request.method))
+
+    def process_result(self, request, result):
+        request.graphql_succeeded = not result.errors
+        return super().process_result(request, result)
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        except PersistedQueryNotFound:
+            return self.not_found()
+        return self.cache(request, response)
+
+
+class AsyncPersistedQueryView(PersistedQueryMixin, AsyncGraphQLView):
+    """Async variant served under ASGI, a request waiting on the database or AWS does not hold a thread."""
+
+    async def get_context(self, request, response):
+        # Resolvers run on the event loop and read request.user, load it before
+        request.user = await sync_to_async(get_user)(request)
+        return await super().get_context(request, response)
+
+    async def parse_http_body(self, request) -> GraphQLRequestData:
+        if "application/json" in (request.content_type or ""):
+            data = self.parse_json(await request.get_body())
+        elif request.method == "GET":
+            data = self.parse_query_params(request.query_params)
+        else:
+            return await super().parse_http_body(request)
+        query = await sync_to_async(resolve_query)(data.get("query"), self.persisted_query(data), request.method)
+        return self.request_data(data, query)
+
+    async def process_result(self, request, result):
+        request.graphql_succeeded = not result.errors
+        return await super().process_result(request, result)
+
+    @method_decorator(csrf_exempt)
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            response = await super().dispatch(request, *args, **kwargs)
+        except PersistedQueryNotFound:
+            return self.not_found()
+        return self.cache(request, response)
+
+
+@csrf_exempt
+@require_POST
+def direct_upload(request):
+    """Local stand-in for the S3 presigned POST returned by ``createUpload``."""
+    try:
+        target = check_signature(request.POST.get("signature", ""))
+    except signing.BadSignature:
+        return HttpResponseForbidden("invalid or expired signature")
+
+    file = request.FILES.get("file")
+    if request.POST.get("key") != target["key"] or request.POST.get("Content-Type") != target["type"]:
+        return HttpResponseForbidden("fields do not match the signature")
+    if file is None or not 0 < file.size <= settings.UPLOAD_MAX_SIZE:
+        return HttpResponseBadRequest("missing file or file too large")
+    if default_storage.exists(target["key"]):
+        return HttpResponseForbidden("upload already exists")
+
+    default_storage.save(target["key"], file)
+    return HttpResponse(status=204)
+
+
+def metrics(request):
+    """Prometheus metrics, only served to requests bearing METRICS_TOKEN."""
+    if not settings.METRICS_TOKEN or request.headers.get("Authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        raise Http404()
+    return HttpResponse(collect(), content_type=CONTENT_TYPE_LATEST)
+
+
+@never_cache
+def purge(request):
+    """Purge photos deleted PHOTO_PURGE_MIN_AGE seconds ago, for the cron job bearing CRON_SECRET."""
+    if not settings.CRON_SECRET or request.headers.get("Authorization") != f"Bearer {settings.CRON_SECRET}":
+        raise Http404()
+    return JsonResponse({"purged": purge_deleted(timedelta(seconds=settings.PHOTO_PURGE_MIN_AGE))})
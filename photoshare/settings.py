@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 import os
 from pathlib import Path
 
+from boto3.s3.transfer import TransferConfig
+
 RUN_SERVER_PORT = 8000
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -56,6 +58,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -88,10 +91,30 @@ WSGI_APPLICATION = 'photoshare.wsgi.app'
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# Connections are pooled per process by backend.postgresql, DB_POOL_SIZE bounds the connections of a
+# process and a request waits up to DB_POOL_TIMEOUT seconds for one. Connections idle for CHECK_AFTER
+# seconds are pinged before reuse and retired after MAX_AGE. Serverless instances (Vercel) serve one
+# request at a time, they keep a single connection across invocations. Set DB_POOL_SIZE to 0 behind
+# PgBouncer in transaction mode, connections are then kept DB_CONN_MAX_AGE seconds by Django itself.
+DB_POOL = {
+    'SIZE': int(os.environ.get('DB_POOL_SIZE', 1 if 'VERCEL' in os.environ else 10)),
+    'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+    'MAX_AGE': int(os.environ.get('DB_POOL_MAX_AGE', 600)),
+    'CHECK_AFTER': int(os.environ.get('DB_POOL_CHECK_AFTER', 30)),
+}
+
+DB_CONNECTION = {
+    'ENGINE': 'backend.postgresql',
+    'POOL': DB_POOL,
+    # With the pool Django must give the connection back at the end of every request
+    'CONN_MAX_AGE': 0 if DB_POOL['SIZE'] else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+    'CONN_HEALTH_CHECKS': True,
+}
+
 if 'RDS_HOSTNAME' in os.environ:
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            **DB_CONNECTION,
             'NAME': os.environ['RDS_DB_NAME'],
             'USER': os.environ['RDS_USERNAME'],
             'PASSWORD': os.environ['RDS_PASSWORD'],
@@ -102,7 +125,7 @@ if 'RDS_HOSTNAME' in os.environ:
 elif 'POSTGRES_HOST' in os.environ:
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            **DB_CONNECTION,
             'NAME': os.environ['POSTGRES_DATABASE'],
             'USER': os.environ['POSTGRES_USER'],
             'PASSWORD': os.environ['POSTGRES_PASSWORD'],
@@ -112,7 +135,7 @@ elif 'POSTGRES_HOST' in os.environ:
 else:
     DATABASES = {
         "default": {
-            "ENGINE": "django.db.backends.postgresql",
+            **DB_CONNECTION,
             "NAME": "photoshare",
             'USER': 'postgres',
             'PASSWORD': 'example',
@@ -121,6 +144,39 @@ else:
         }
     }
 
+# Read replicas, comma separated hosts in DATABASE_REPLICA_HOSTS with the credentials of default. GraphQL
+# query operations read from them, mutations and everything else use default, see backend/routers.py.
+# Tests mirror them to default. Locally, DATABASE_REPLICA_HOSTS=127.0.0.1 adds a second connection to
+# the same server, which exercises the routing without replication. Replicas are only read with the
+# shared cache (REDIS_URL), which keeps the pins of REPLICA_PIN_CACHE.
+DATABASE_REPLICAS = []
+
+for index, host in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_HOSTS', '').split(','))):
+    DATABASE_REPLICAS.append(f'replica{index + 1}')
+    DATABASES[f'replica{index + 1}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['backend.routers.ReplicaRouter']
+
+# Seconds a user keeps reading from default after one of its mutations, above the replication lag
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+
+REPLICA_PIN_CACHE = 'default'
+
+# Caches
+# Sessions, cached users, replica pins, query budgets, location suggestions and persisted queries must be
+# seen by every worker and serverless instance, set REDIS_URL (redis://host:6379/0) to keep them in Redis.
+# Without it each process has a memory cache of its own: sessions and users are then read from the
+# database and queries are not sent to the replicas.
+SHARED_CACHE = 'REDIS_URL' in os.environ
+
+if SHARED_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -177,6 +233,24 @@ MEDIA_ROOT = "media/"
 DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage' if DEBUG \
     else 'storages.backends.s3boto3.S3Boto3Storage'
 
+# Widths of the WebP copies generated for every uploaded photo and avatar, the smallest serves as a placeholder
+IMAGE_VARIANT_WIDTHS = [32, 320, 640, 1080]
+
+IMAGE_VARIANT_QUALITY = 80
+
+# Variants are rendered in IMAGE_VARIANT_WORKERS spawned processes, in the rendering thread when 0. Serverless
+# functions cannot start processes and freeze threads once the response is sent, on Vercel variants are
+# rendered in the request after it commits unless IMAGE_VARIANT_WORKERS and IMAGE_VARIANT_ASYNC are set.
+IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', 0 if 'VERCEL' in os.environ else 2))
+
+IMAGE_VARIANT_ASYNC = os.environ['IMAGE_VARIANT_ASYNC'] == "True" if "IMAGE_VARIANT_ASYNC" in os.environ \
+    else 'VERCEL' not in os.environ
+
+# Direct uploads, clients POST the file to a presigned target and finalize it with a mutation
+UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+
+UPLOAD_URL_EXPIRES = 15 * 60
+
 LOGGING = {
     'version': 1,
     'filters': {
@@ -217,17 +291,130 @@ AWS_LOCATION = 'static/'
 
 AWS_S3_FILE_OVERWRITE = False
 
+# Uploads are streamed to S3 in multipart chunks, bounding the memory of each upload to chunksize * concurrency
+AWS_S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=4,
+)
+
 ALGOLIA = {
     'APPLICATION_ID': os.environ["ALGOLIA_APPLICATION_ID"],
     'API_KEY': os.environ["ALGOLIA_API_KEY"],
     'INDEX_PREFIX': "photo_share",
-    'INDEX_SUFFIX': "dev" if DEBUG else "prod"
+    'INDEX_SUFFIX': "dev" if DEBUG else "prod",
+    # Index changes are queued in the outbox by the mutations and sent by `manage.py drainindex`
+    'AUTO_INDEXING': False,
 }
 
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
 
+# Bearer token of the Prometheus scraper, /metrics is not served when unset. With several gunicorn
+# workers set PROMETHEUS_MULTIPROC_DIR so the metrics of all workers are merged.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Resolver tracing, see `manage.py traces`. A fraction of the operations is stored, and every
+# operation slower than TRACING_SLOW_MS. Spans faster than TRACING_MIN_SPAN_MS without SQL are dropped.
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED') == "True"
+
+TRACING_SAMPLE_RATE = float(os.environ.get('TRACING_SAMPLE_RATE', 0.01))
+
+TRACING_SLOW_MS = float(os.environ.get('TRACING_SLOW_MS', 500))
+
+TRACING_MIN_SPAN_MS = 1.0
+
+# Parsed and validated query documents kept in memory by each worker
+GRAPHQL_DOCUMENT_CACHE_SIZE = int(os.environ.get('GRAPHQL_DOCUMENT_CACHE_SIZE', 512))
+
+# Connections return GRAPHQL_DEFAULT_PAGE_SIZE nodes when queried without first or last, and refuse
+# to return more than GRAPHQL_MAX_PAGE_SIZE.
+GRAPHQL_DEFAULT_PAGE_SIZE = int(os.environ.get('GRAPHQL_DEFAULT_PAGE_SIZE', 20))
+
+GRAPHQL_MAX_PAGE_SIZE = int(os.environ.get('GRAPHQL_MAX_PAGE_SIZE', 100))
+
+# Operations nested deeper than GRAPHQL_MAX_DEPTH fields or costing more than GRAPHQL_MAX_COST are
+# rejected before they run, the cost is the number of objects they may resolve, see backend/cost.py.
+# With GRAPHQL_COST_PER_MINUTE set, a user (or an address when anonymous) spending more within a
+# minute is throttled until the next one. The spending is counted in QUERY_COST_CACHE, shared by the
+# workers with REDIS_URL, without it each worker counts its own.
+GRAPHQL_MAX_DEPTH = int(os.environ.get('GRAPHQL_MAX_DEPTH', 10))
+
+GRAPHQL_MAX_COST = int(os.environ.get('GRAPHQL_MAX_COST', 5000))
+
+GRAPHQL_COST_PER_MINUTE = int(os.environ.get('GRAPHQL_COST_PER_MINUTE', 0))
+
+QUERY_COST_CACHE = 'default'
+
+# Changes accepted by one call of the batch mutations (updatePhotoLikes, updateFollowers)
+BULK_MUTATION_MAX_ITEMS = int(os.environ.get('BULK_MUTATION_MAX_ITEMS', 100))
+
+# Serve /graphql with the async view, set by photoshare/asgi.py. WSGI deployments (Vercel) keep the sync view.
+GRAPHQL_ASYNC = os.environ.get('GRAPHQL_ASYNC') == "True"
+
+# Automatic persisted queries, registered query texts are kept in this cache without expiry
+PERSISTED_QUERY_CACHE = 'default'
+
+# Seconds a GET query that does not depend on the viewer may be cached by browsers and the CDN
+PERSISTED_QUERY_MAX_AGE = int(os.environ.get('PERSISTED_QUERY_MAX_AGE', 60))
+
+# With the shared cache, sessions are read from it and written through to the database, and the
+# authenticated user and its profile are cached for USER_CACHE_TTL seconds, dropped whenever either row
+# is saved. Without it both are read from the database, a copy in one process would outlive a logout or
+# a password change handled by another.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db' if SHARED_CACHE \
+    else 'django.contrib.sessions.backends.db'
+
+AUTHENTICATION_BACKENDS = ['backend.authentication.CachedModelBackend' if SHARED_CACHE
+                           else 'django.contrib.auth.backends.ModelBackend']
+
+USER_CACHE = 'default'
+
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 3600))
+
+# Location suggestions of AWS Location are cached in this cache, shared by the workers and kept across
+# serverless cold starts with REDIS_URL. Searches without any result are cached for
+# LOCATION_SUGGESTION_NEGATIVE_TTL only.
+LOCATION_SUGGESTION_CACHE = 'default'
+
+LOCATION_SUGGESTION_TTL = int(os.environ.get('LOCATION_SUGGESTION_TTL', 86400))
+
+LOCATION_SUGGESTION_NEGATIVE_TTL = int(os.environ.get('LOCATION_SUGGESTION_NEGATIVE_TTL', 300))
+
+# Deleted photos are hidden at once and purged in the background, their dependent rows in batches of
+# PHOTO_PURGE_BATCH_SIZE. Storage deletes are attempted PHOTO_PURGE_ATTEMPTS times with an exponential
+# backoff from PHOTO_PURGE_RETRY_DELAY seconds, `manage.py purgephotos` retries failed purges.
+PHOTO_PURGE_BATCH_SIZE = int(os.environ.get('PHOTO_PURGE_BATCH_SIZE', 1000))
+
+PHOTO_PURGE_ATTEMPTS = int(os.environ.get('PHOTO_PURGE_ATTEMPTS', 3))
+
+PHOTO_PURGE_RETRY_DELAY = float(os.environ.get('PHOTO_PURGE_RETRY_DELAY', 1.0))
+
+PHOTO_PURGE_ASYNC = os.environ['PHOTO_PURGE_ASYNC'] == "True" if "PHOTO_PURGE_ASYNC" in os.environ else True
+
+# Photos deleted at least PHOTO_PURGE_MIN_AGE seconds ago whose purge did not finish are purged again by
+# `manage.py purgephotos` (run it every few minutes, or with --loop), or on Vercel by the cron job of
+# vercel.json calling /cron/purge with CRON_SECRET. The endpoint is not served when CRON_SECRET is unset.
+PHOTO_PURGE_MIN_AGE = 300
+
+CRON_SECRET = os.environ.get('CRON_SECRET')
+
+# Feed fan-out
+# Accounts with at least FEED_FANOUT_THRESHOLD followers are not fanned out on upload, all their photos
+# are merged into follower feeds when the feed is read, without storing them. Other uploads are fanned
+# out in a background thread unless FEED_FANOUT_ASYNC is False, the default on Vercel which freezes
+# threads once the response is sent.
+
+FEED_FANOUT_THRESHOLD = int(os.environ.get('FEED_FANOUT_THRESHOLD', 10000))
+
+FEED_FANOUT_BATCH_SIZE = int(os.environ.get('FEED_FANOUT_BATCH_SIZE', 1000))
+
+FEED_FANOUT_WORKERS = int(os.environ.get('FEED_FANOUT_WORKERS', 2))
+
+FEED_FANOUT_ASYNC = os.environ['FEED_FANOUT_ASYNC'] == "True" if "FEED_FANOUT_ASYNC" in os.environ \
+    else 'VERCEL' not in os.environ
+
 STRAWBERRY_DJANGO = {
     "MAP_AUTO_ID_AS_GLOBAL_ID": True,
 }